@@ -8,89 +8,111 @@ Detects probe-level half-life shifts within an operon.
 
 import csv
 import math
+import logging
 import numpy
 from operon import Operon
 from operonBank import OperonBank
+from contigs import SampleReads, getContigs
+from prefetch import prefetch, loadSampleReads
+from probeTable import loadProbeTable, saveProbeAssignment
+from parallel import selectedSamples
+from halfLifeShift import HLShiftTable, WORKWIDTH, THRESHOLD, MINAVERAGEREAD
+from export import configureLogging, writeProcessedOperons
+import profiling
 
 
-operonBankList = [OperonBank("operonBankRD_wt1.txt"), \
-                  OperonBank("operonBankRD_wt2.txt"), \
-                  OperonBank("operonBankRD_rny1.txt"), \
-                  OperonBank("operonBankRD_rny2.txt")]
 nameList = ["wt1", "wt2", "rny1", "rny2"]
+readsFiles = ["wt1.csv", "wt2.csv", "rny1.csv", "rny2.csv"]
 probeHLFileList = ["probehalfLifeWT.csv", "probehalfLifeWT.csv", \
                    "probehalfLifeRNY.csv", "probehalfLifeRNY.csv"]
+log = logging.getLogger("HLShiftFinder")
 
-##Construct a probe-level half-life list
-for i in xrange(0, 4):
-    fileName = "processedOperons_" + nameList[i] + ".csv"
-    processedOperons = open(fileName, 'w')
-    probeHLFile = open(probeHLFileList[i], 'rU')
-    probeHLTable = csv.reader(probeHLFile)
-    probeHLList = []
-    for row in probeHLTable:
-        position = int(row[0])
-        orientation = row[1]
-        probeHL = float(row[2])
-        probeHLList.append((position, orientation, probeHL))
-
-    """Look for regions with differential RNA stabilities,
-    using a sliding-window algorithm for averageRead change."""    
-    count = 0
-    operonBank = operonBankList [i]
-    for operon in operonBank:
-        operon.setProbeHalfLife(probeHLList)
-
-        HLLogList = []
-        for HLTuple in operon.getProbeHalfLife():
-            halfLife = HLTuple[2]
-            if halfLife > 0:
-                HLLog = math.log(halfLife, 2)
-                HLLogList.append(HLLog)
-        if HLLogList != []:
-            refAverageLogHL = numpy.average(HLLogList)
-            workWidth = 3
-            threshold = 1.0
-            
-            if len(HLLogList) > workWidth:
-                start = 0
-                end   = start + workWidth
-                maxAverageLogHL = refAverageLogHL
-                minAverageLogHL = refAverageLogHL
-                while end < len(HLLogList):            
-                    workSpace = HLLogList[start:end]
-                    workAverageLogHL = numpy.average(workSpace)
-                    if operon.getName() == "operon_118":
-                        print "The work AverageLogHL is: ", round(workAverageLogHL, 2)
-                    if workAverageLogHL > maxAverageLogHL:
-                        maxAverageLogHL = workAverageLogHL
-                    if workAverageLogHL < minAverageLogHL:
-                        minAverageLogHL = workAverageLogHL 
-                    start += 1
-                    end    = start + workWidth
-                
-                if maxAverageLogHL >= refAverageLogHL + threshold \
-                   or minAverageLogHL <= refAverageLogHL - threshold \
-                   and operon.getAverageRead() > 500:
-                    processedOperons.write(operon.getName() + \
-                                         "," + operon[0].getName() + \
-                                         "," + operon[-1].getName() + \
-                                         "," + str(operon.getAverageRead()) + \
-                                         "," + str(refAverageLogHL) + \
-                                         "," + str(maxAverageLogHL) + \
-                                         "," + str(minAverageLogHL) + \
-                                         '\n')
-                    count += 1
-                    print str(operon)
-                    print "The average RNA-seq read is: ", round(operon.getAverageRead())
-    ##              print HLLogList
-                    print "The ref AverageLogHL is:     ", round(refAverageLogHL, 2)
-                    print "The max AverageLogHL is:     ", round(maxAverageLogHL, 2)
-                    print "The min AverageLogHL is:     ", round(minAverageLogHL, 2), "\n"
-    print count
-    print fileName, " is generated" 
+
+def probeHLFile(strainName):
+    """Returns the probe half-life file of a sample: that of the WT for
+    wt1, wt2, ... and that of the RNase Y mutant for rny1, rny2, ..."""
+    if strainName in nameList:
+        return probeHLFileList[nameList.index(strainName)]
+    if strainName.startswith("rny"):
+        return probeHLFileList[2]
+    return probeHLFileList[0]
+
+
+def loadOperonBank(strainName, probeHLFile, contigs = None):
+    """Returns the refined operonBank of a sample bound to its reads, with
+    the probes of probeHLFile assigned to its operons. The reads of the
+    given contigs (default: every contig) are loaded and indexed at once,
+    so that this can run ahead in a background thread (see prefetch.py)."""
+    operonBank = OperonBank("operonBankRD_" + strainName + ".npz").bind(
+        loadSampleReads(strainName, contigs, False))
+    loadProbeTable(probeHLFile).assign(operonBank)
+    return operonBank
+
+
+def HLShiftFinder(strainName, probeHLFile, workWidth = WORKWIDTH,
+                  threshold = THRESHOLD, minAverageRead = MINAVERAGEREAD,
+                  operonBank = None):
+    """Look for regions with differential RNA stabilities in the refined
+    operonBank of a sample (operonBankRD_<strainName>.npz), using a
+    sliding-window algorithm for averageRead change (see halfLifeShift.py)
+    on the probe half-lives of probeHLFile. operonBank is the result of
+    loadOperonBank if it was loaded ahead. Writes the processed operons
+    and the probes of each operon. Returns the operonBank and its
+    HLShiftTable."""
+    with profiling.stage("HLShiftTable", strainName):
+        if operonBank == None:
+            operonBank = OperonBank(
+                "operonBankRD_" + strainName + ".npz").bind(
+                SampleReads(strainName))
+            loadProbeTable(probeHLFile).assign(operonBank)
+        table = HLShiftTable(operonBank, workWidth, threshold, minAverageRead)
+    if log.isEnabledFor(logging.DEBUG):
+        for j in numpy.flatnonzero(table['processed']):
+            log.debug("%s\n"
+                      "The average RNA-seq read is:  %s\n"
+                      "The ref AverageLogHL is:      %s\n"
+                      "The max AverageLogHL is:      %s\n"
+                      "The min AverageLogHL is:      %s\n",
+                      operonBank[j], round(table['averageRead'][j]),
+                      round(table['refLogHL'][j], 2),
+                      round(table['maxLogHL'][j], 2),
+                      round(table['minLogHL'][j], 2))
+    fileName = writeProcessedOperons(
+        operonBank, table, "processedOperons_" + strainName + ".csv")
+    log.info("%d processed operons", table['processed'].sum())
+    log.info("%s is generated", fileName)
     
-    operonBank.save()
-        
-            
-        
+    probeFileName = "operonProbes_" + strainName + ".csv"
+    saveProbeAssignment(operonBank, probeFileName)
+    log.info("%s is generated", probeFileName)
+    return operonBank, table
+
+
+def HLShiftFinders(strainNames, workWidth = WORKWIDTH, threshold = THRESHOLD,
+                   minAverageRead = MINAVERAGEREAD, probeHLFileName = None):
+    """Runs HLShiftFinder on the named samples, with the probe half-lives of
+    probeHLFileName or, by default, of each sample (see probeHLFile). The
+    operonBank of the next sample is loaded in a background thread while a
+    sample is processed (see prefetch.py)."""
+    contigs = getContigs()
+    probeHLFiles = dict((strainName, probeHLFileName or
+                         probeHLFile(strainName))
+                        for strainName in strainNames)
+    for strainName, operonBank in prefetch(
+            lambda strainName: loadOperonBank(strainName,
+                                              probeHLFiles[strainName],
+                                              contigs),
+            strainNames):
+        HLShiftFinder(strainName, probeHLFiles[strainName], workWidth,
+                      threshold, minAverageRead, operonBank)
+
+
+def main():
+    """Finds the processed operons of all samples, or of the samples named
+    in the RNA_SAMPLES environment variable."""
+    configureLogging()
+    HLShiftFinders([nameList[i] for i in selectedSamples(readsFiles)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+File: bankConvert.py
+Converts GeneBank and OperonBank files written as streams of pickled
+objects (geneBank*.txt, operonBank*.txt) to the columnar .npz format."""
+
+import os
+import glob
+import logging
+from bankFormat import convertBank
+from export import configureLogging
+
+log = logging.getLogger("bankConvert")
+
+
+def bankConvert(fileList = None):
+    """Converts the given pickled bank files (default: every geneBank*.txt
+    and operonBank*.txt file). Returns the names of the columnar files."""
+    if fileList == None:
+        fileList = glob.glob("geneBank*.txt") + glob.glob("operonBank*.txt")
+    fileNames = []
+    for legacyName in sorted(fileList):
+        fileName = os.path.splitext(legacyName)[0] + ".npz"
+        bankType = convertBank(legacyName, fileName)
+        log.info("%s (%s) is generated.", fileName, bankType)
+        fileNames.append(fileName)
+    return fileNames
+
+
+def main():
+    configureLogging()
+    bankConvert()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+File: bankFormat.py
+
+Columnar on-disk format for GeneBank and OperonBank objects.
+
+A bank is saved as a NumPy .npz archive of flat arrays: names,
+coordinates, orientations, contig ids, half-lives, operon bounds and bound
+precisions, with offset arrays for the genes of each operon and the
+probe half-lives of each sequence or operon. Loading rebuilds the
+Sequence and Operon objects from these arrays in one pass instead of
+unpickling one object graph per record. Banks of version 1, written
+before genes carried contig ids, load with every gene on the default
+contig.
+
+"""
+import cPickle
+import zipfile
+import cStringIO
+import numpy
+from sequence import makeSequences
+from operon   import Operon
+from contigs  import DEFAULTCONTIG
+
+BANKVERSION = 2
+
+
+def isColumnar(fileName):
+    """Returns True if fileName holds a columnar bank, False if it holds a
+    legacy stream of pickled objects."""
+    return zipfile.is_zipfile(fileName)
+
+
+def _offsets(lengths):
+    """Returns the offsets of consecutive runs with the given lengths."""
+    offsets = numpy.zeros(len(lengths) + 1, dtype = numpy.int64)
+    numpy.cumsum(lengths, out = offsets[1:])
+    return offsets
+
+
+def _strings(values):
+    """Returns a byte-string array of values (empty-safe)."""
+    return numpy.array(values, dtype = 'S' + str(max([1] + map(len, values))))
+
+
+def _shared(values):
+    """Returns the values of a string column as a list in which equal
+    strings are one object, e.g. the contig id of every gene."""
+    if len(values) == 0:
+        return []
+    unique, inverse = numpy.unique(values, return_inverse = True)
+    unique = unique.tolist()
+    return [unique[i] for i in inverse.tolist()]
+
+
+def _probeColumns(probeLists, prefix, columns):
+    """Adds the probe half-lives of several objects to columns."""
+    probes = [probe for probeList in probeLists for probe in probeList]
+    columns[prefix + 'ProbeOffsets'] = _offsets(map(len, probeLists))
+    columns[prefix + 'ProbePositions'] = numpy.array(
+        [probe[0] for probe in probes], dtype = numpy.int64)
+    columns[prefix + 'ProbeOrientations'] = _strings(
+        [probe[1] for probe in probes])
+    columns[prefix + 'ProbeHalfLives'] = numpy.array(
+        [probe[2] for probe in probes], dtype = numpy.float64)
+
+
+def _probeLists(columns, prefix):
+    """Returns the probe half-life lists stored by _probeColumns."""
+    offsets = columns[prefix + 'ProbeOffsets'].tolist()
+    probes = zip(columns[prefix + 'ProbePositions'].tolist(),
+                 columns[prefix + 'ProbeOrientations'].tolist(),
+                 columns[prefix + 'ProbeHalfLives'].tolist())
+    return [probes[offsets[i]:offsets[i + 1]]
+            for i in xrange(len(offsets) - 1)]
+
+
+def _sequenceColumns(sequences, prefix, columns):
+    """Adds the coordinates, names, orientations, half-lives and probe
+    half-lives of sequences to columns."""
+    states = [seq.__getstate__() for seq in sequences]
+    columns[prefix + 'Names'] = _strings([s['_name'] for s in states])
+    columns[prefix + 'Starts'] = numpy.array(
+        [s['_start'] for s in states], dtype = numpy.int64)
+    columns[prefix + 'Ends'] = numpy.array(
+        [s['_end'] for s in states], dtype = numpy.int64)
+    columns[prefix + 'Orientations'] = _strings(
+        [s['_orientation'] for s in states])
+    columns[prefix + 'Contigs'] = _strings([s['_contig'] for s in states])
+    columns[prefix + 'HalfLives'] = numpy.array(
+        [s['_halfLife'] for s in states], dtype = numpy.float64)
+    _probeColumns([s['_probeHalfLife'] for s in states], prefix, columns)
+
+
+def _sequences(columns, prefix):
+    """Returns the Sequence objects stored by _sequenceColumns."""
+    names = columns[prefix + 'Names'].tolist()
+    starts = columns[prefix + 'Starts'].tolist()
+    ends = columns[prefix + 'Ends'].tolist()
+    orientations = columns[prefix + 'Orientations'].tolist()
+    halfLives = columns[prefix + 'HalfLives'].tolist()
+    if prefix + 'Contigs' in columns.files:
+        contigs = _shared(columns[prefix + 'Contigs'])
+    else:
+        contigs = [DEFAULTCONTIG] * len(names)
+    return makeSequences(names, starts, ends, orientations, halfLives,
+                         _probeLists(columns, prefix), contigs)
+
+
+def _boundColumns(bounds, prefix, columns):
+    """Adds optional (left, right) bound pairs to columns."""
+    columns[prefix + 'Set'] = numpy.array(
+        [pair is not None for pair in bounds], dtype = bool)
+    columns[prefix] = numpy.array(
+        [pair if pair is not None else (0, 0) for pair in bounds],
+        dtype = numpy.int64).reshape(-1, 2)
+
+
+def _bounds(columns, prefix):
+    """Returns the optional bound pairs stored by _boundColumns."""
+    isSet = columns[prefix + 'Set'].tolist()
+    pairs = [tuple(pair) for pair in columns[prefix].tolist()]
+    return [pairs[i] if isSet[i] else None for i in xrange(len(isSet))]
+
+
+def _saveColumns(columns, fileName):
+    """Writes columns to an .npz archive. Columns are written in name order
+    with a fixed timestamp, so saving the same bank twice gives identical
+    files (and identical checksums, see pipeline.py)."""
+    archive = zipfile.ZipFile(fileName, 'w', zipfile.ZIP_STORED)
+    for name in sorted(columns):
+        data = cStringIO.StringIO()
+        numpy.lib.format.write_array(data, numpy.asanyarray(columns[name]))
+        info = zipfile.ZipInfo(name + '.npy', (1980, 1, 1, 0, 0, 0))
+        info.external_attr = 0600 << 16
+        archive.writestr(info, data.getvalue())
+    archive.close()
+
+
+def saveGeneBank(sequences, fileName):
+    """Saves the sequences of a GeneBank as a columnar bank."""
+    columns = {'format':  numpy.array('GeneBank'),
+               'version': numpy.array(BANKVERSION)}
+    _sequenceColumns(sequences, 'gene', columns)
+    _saveColumns(columns, fileName)
+
+
+def saveOperonBank(operons, fileName):
+    """Saves the operons of an OperonBank, with their genes, as a
+    columnar bank. Genes are stored in operon order; geneOffsets marks
+    where the genes of each operon start."""
+    states = [operon.__getstate__() for operon in operons]
+    columns = {'format':  numpy.array('OperonBank'),
+               'version': numpy.array(BANKVERSION)}
+    columns['operonNames'] = _strings([s['_name'] for s in states])
+    columns['operonOrientations'] = _strings(
+        [s['_orientation'] for s in states])
+    columns['operonBounds'] = numpy.array(
+        [(s['_leftBound'], s['_rightBound']) for s in states],
+        dtype = numpy.int64).reshape(-1, 2)
+    columns['operonPrecisions'] = numpy.array(
+        [(s['_leftBoundPrecision'], s['_rightBoundPrecision'])
+         for s in states], dtype = bool).reshape(-1, 2)
+    _boundColumns([s['_readsBounds'] for s in states], 'operonReadsBounds',
+                  columns)
+    _boundColumns([s['_baseBounds'] for s in states], 'operonBaseBounds',
+                  columns)
+    _probeColumns([s['_probeHalfLife'] for s in states], 'operon', columns)
+    columns['geneOffsets'] = _offsets([len(s['_sequences']) for s in states])
+    _sequenceColumns([seq for s in states for seq in s['_sequences']],
+                     'gene', columns)
+    _saveColumns(columns, fileName)
+
+
+def _loadColumns(fileName, bankFormat):
+    """Opens a columnar bank and checks its format and version."""
+    columns = numpy.load(fileName)
+    if str(columns['format']) != bankFormat:
+        raise ValueError, fileName + " does not hold a " + bankFormat + "."
+    if int(columns['version']) not in (1, BANKVERSION):
+        raise ValueError, "Unsupported bank version: " + \
+              str(columns['version'])
+    return columns
+
+
+def loadGeneBank(fileName):
+    """Returns the list of Sequence objects of a columnar GeneBank."""
+    return _sequences(_loadColumns(fileName, 'GeneBank'), 'gene')
+
+
+def loadOperonBank(fileName):
+    """Returns the list of Operon objects of a columnar OperonBank."""
+    columns = _loadColumns(fileName, 'OperonBank')
+    names = columns['operonNames'].tolist()
+    orientations = columns['operonOrientations'].tolist()
+    bounds = columns['operonBounds'].tolist()
+    precisions = columns['operonPrecisions'].tolist()
+    readsBounds = _bounds(columns, 'operonReadsBounds')
+    baseBounds = _bounds(columns, 'operonBaseBounds')
+    probeLists = _probeLists(columns, 'operon')
+    geneOffsets = columns['geneOffsets'].tolist()
+    genes = _sequences(columns, 'gene')
+    operons = []
+    for i in xrange(len(names)):
+        sequences = genes[geneOffsets[i]:geneOffsets[i + 1]]
+        operon = Operon.__new__(Operon)
+        operon.__setstate__({'_name':                names[i],
+                             '_sequences':           sequences,
+                             '_size':                len(sequences),
+                             '_orientation':         orientations[i],
+                             '_leftBound':           bounds[i][0],
+                             '_leftBoundPrecision':  precisions[i][0],
+                             '_rightBound':          bounds[i][1],
+                             '_rightBoundPrecision': precisions[i][1],
+                             '_readsList':           None,
+                             '_readsBounds':         readsBounds[i],
+                             '_baseBounds':          baseBounds[i],
+                             '_probeHalfLife':       probeLists[i]})
+        operons.append(operon)
+    return operons
+
+
+def loadPickled(fileName):
+    """Returns the list of objects of a legacy stream of pickled objects."""
+    objects = []
+    fileObj = open(fileName, 'rb')
+    while True:
+        try:
+            objects.append(cPickle.load(fileObj))
+        except EOFError:
+            fileObj.close()
+            break
+    return objects
+
+
+def convertBank(legacyName, fileName):
+    """Converts a legacy pickled GeneBank or OperonBank file to a columnar
+    bank. Returns 'GeneBank' or 'OperonBank'."""
+    objects = loadPickled(legacyName)
+    if objects != [] and isinstance(objects[0], Operon):
+        saveOperonBank(objects, fileName)
+        return 'OperonBank'
+    saveGeneBank(objects, fileName)
+    return 'GeneBank'
@@ -0,0 +1,439 @@
+"""
+File: benchmark.py
+
+Times every stage of the workflow on deterministic synthetic data.
+
+The generator writes, for a given genome length, number of samples and
+seed, a genome (SpyGenome.txt), gene annotations in the layout of
+Spy49_allGenes.csv, per-nucleotide coverage for every sample (binary
+coverage files, and coverage CSV files on request) and probe half-life
+tables. Operons are covered at their own level with a dip between genes
+and a dent down to background between operons; some operons are
+processed (their last gene is degraded and their downstream probes are
+more stable) in the wild-type samples wt1, wt2, ... but not in the
+mutant samples rny1, rny2, ...
+
+Each stage (geneBank construction, operonFinder, boundFinder, refine,
+HLShiftFinder and the RNase Y comparison) runs in its own process, which
+records the time of the stage, its throughput and the peak memory of the
+process. The results are written as one JSON document. A stage whose
+process raises an exception or dies (e.g. killed for lack of memory) is
+reported as failed, with its exit code and error, and the benchmark exits
+with status 1.
+
+Usage: python benchmark.py [--length N] [--samples N] [--seed N]
+                           [--directory DIR] [--csv] [--output FILE]
+                           [--stages STAGE,...]
+
+"""
+import os
+import sys
+import csv
+import json
+import time
+import Queue
+import resource
+import traceback
+import argparse
+import multiprocessing
+import numpy
+
+BASES       = "ACGT"
+LINEWIDTH   = 70
+PROBESTEP   = 60
+BACKGROUND  = 2
+POLLSECONDS = 1
+
+
+def sampleNames(samples):
+    """Returns the names of the samples: wild-type samples wt1, wt2, ...
+    followed by mutant samples rny1, rny2, ..."""
+    wildTypes = (samples + 1) // 2
+    return ["wt" + str(i + 1) for i in xrange(wildTypes)] + \
+           ["rny" + str(i + 1) for i in xrange(samples - wildTypes)]
+
+
+def probeFileName(sample):
+    """Returns the probe half-life file of a sample."""
+    if sample.startswith("wt"):
+        return "probehalfLifeWT.csv"
+    return "probehalfLifeRNY.csv"
+
+
+def generateGenome(length, rng):
+    """Returns a random base string of the given length."""
+    codes = rng.randint(0, 4, length).astype(numpy.uint8)
+    return numpy.frombuffer(BASES, dtype = numpy.uint8)[codes].tostring()
+
+
+def generateOperons(length, rng):
+    """Returns a list of synthetic operons, each a dictionary with its
+    genes (name, start, end, orientation), expression level, 5' and 3'
+    UTR lengths and whether it is processed."""
+    operons = []
+    position = 100
+    k = 0
+    while position < length - 5000:
+        orientation = '+-'[rng.randint(2)]
+        genes = []
+        for j in xrange(rng.randint(1, 6)):
+            geneLength = rng.randint(300, 1500)
+            genes.append(("SPy_%06d" % k, position, position + geneLength,
+                          orientation))
+            k += 1
+            position += geneLength + rng.randint(5, 60)
+        operons.append({'genes':     genes,
+                        'level':     rng.lognormal(5, 1.5),
+                        'utr5':      rng.randint(10, 30),
+                        'utr3':      rng.randint(10, 30),
+                        'processed': rng.rand() < 0.3 and len(genes) > 1})
+        position += rng.randint(80, 300)
+    return operons
+
+
+def _segments(operons):
+    """Returns (starts, ends, owners, factors) of the covered segments of
+    the operons: UTRs, genes and intergenic regions, each covered at the
+    level of its operon times its factor."""
+    starts, ends, owners, factors = [], [], [], []
+    for i in xrange(len(operons)):
+        genes = operons[i]['genes']
+        first = genes[0][1] - operons[i]['utr5']
+        starts.append(first)
+        ends.append(genes[0][1])
+        factors.append(0.9)
+        for j in xrange(len(genes)):
+            starts.append(genes[j][1])
+            ends.append(genes[j][2])
+            factors.append(0.8 + 0.4 * ((j * 7919 + i) % 11) / 10.0)
+            nextStart = genes[j + 1][1] if j + 1 < len(genes) else \
+                        genes[j][2] + operons[i]['utr3']
+            starts.append(genes[j][2])
+            ends.append(nextStart)
+            factors.append(0.7 if j + 1 < len(genes) else 0.9)
+        owners.extend([i] * (2 * len(genes) + 1))
+    return (numpy.array(starts), numpy.array(ends), numpy.array(owners),
+            numpy.array(factors))
+
+
+def generateCoverage(length, operons, segments, rng, mutant):
+    """Returns the per-nucleotide reads of one sample: each segment at its
+    operon's level (varied per sample) with 10% noise, background reads
+    elsewhere. The last gene of a processed operon is degraded unless the
+    sample is a mutant."""
+    starts, ends, owners, factors = segments
+    levels = numpy.array([operon['level'] for operon in operons])
+    levels = levels * rng.lognormal(0, 0.15, len(operons))
+    segmentLevels = levels[owners] * factors
+    if not mutant:
+        lastGenes = numpy.flatnonzero(numpy.diff(numpy.append(owners, -1)))
+        lastGenes = lastGenes - 1
+        processed = numpy.array([operons[owner]['processed']
+                                 for owner in owners[lastGenes]], dtype = bool)
+        segmentLevels[lastGenes[processed]] *= 0.3
+    lengths = ends - starts
+    offsets = numpy.cumsum(lengths) - lengths
+    positions = numpy.repeat(starts - offsets, lengths) + \
+                numpy.arange(lengths.sum())
+    means = numpy.repeat(segmentLevels, lengths)
+    reads = rng.poisson(BACKGROUND, length).astype(numpy.float64)
+    reads[positions] = numpy.floor(numpy.maximum(
+        rng.normal(means, means * 0.1), 0))
+    return reads
+
+
+def generateProbeHalfLives(operons, rng, mutant):
+    """Returns (position, orientation, half-life) probes every PROBESTEP
+    bases of every operon. Downstream probes of processed operons are
+    more stable unless the table is the mutant's; 5% are poor probes
+    (half-life -1)."""
+    probes = []
+    for operon in operons:
+        genes = operon['genes']
+        start, end = genes[0][1], genes[-1][2]
+        positions = numpy.arange(start, end, PROBESTEP)
+        halfLives = rng.uniform(1, 4) * rng.uniform(0.9, 1.1, len(positions))
+        if operon['processed'] and not mutant:
+            halfLives[positions > (start + end) / 2] *= 6
+        halfLives[rng.rand(len(positions)) < 0.05] = -1
+        orientation = genes[0][3]
+        probes.extend((int(positions[i]), orientation,
+                       round(halfLives[i], 3) if halfLives[i] > 0 else -1)
+                      for i in xrange(len(positions)))
+    return probes
+
+
+def writeDataSet(directory, length, samples, seed, writeCSV = False):
+    """Writes a synthetic data set to directory. Returns the sample names
+    and the number of genes."""
+    from coverage import saveCoverage
+    rng = numpy.random.RandomState(seed)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    genome = generateGenome(length, rng)
+    with open(os.path.join(directory, "SpyGenome.txt"), 'w') as fileObj:
+        for i in xrange(0, length, LINEWIDTH):
+            fileObj.write(genome[i:i + LINEWIDTH] + '\n')
+    del genome
+
+    operons = generateOperons(length, rng)
+    genes = [gene for operon in operons for gene in operon['genes']]
+    with open(os.path.join(directory, "Spy49_allGenes.csv"), 'w') as fileObj:
+        csv.writer(fileObj).writerows(genes)
+
+    segments = _segments(operons)
+    names = sampleNames(samples)
+    for name in names:
+        reads = generateCoverage(length, operons, segments, rng,
+                                 name.startswith("rny"))
+        saveCoverage(reads, os.path.join(directory, name + ".cov"), name)
+        if writeCSV:
+            csvName = os.path.join(directory, name + ".csv")
+            numpy.savetxt(csvName, numpy.column_stack(
+                (numpy.arange(length), reads)), fmt = "Spy\t%d\t%d")
+            os.utime(os.path.join(directory, name + ".cov"), None)
+
+    for mutant, fileName in [(False, "probehalfLifeWT.csv"),
+                             (True, "probehalfLifeRNY.csv")]:
+        with open(os.path.join(directory, fileName), 'w') as fileObj:
+            csv.writer(fileObj).writerows(
+                generateProbeHalfLives(operons, rng, mutant))
+    return names, len(genes)
+
+
+def readsFileName(sample):
+    """Returns the reads file of a sample (see coverage.loadReads)."""
+    if os.path.exists(sample + ".csv"):
+        return sample + ".csv"
+    return sample + ".cov"
+
+
+def benchGeneBank(samples):
+    """Builds and saves geneBank.npz from the annotation. Returns (seconds,
+    genes)."""
+    from geneBankConstruct import geneBankConstruct
+    start = time.time()
+    geneBank = geneBankConstruct("Spy49_allGenes.csv", "geneBank.npz")
+    return time.time() - start, len(geneBank)
+
+
+def benchOperonFinder(samples):
+    """Groups the genes of every sample into operons. Returns (seconds,
+    gene pairs)."""
+    from geneBank import GeneBank
+    from coverage import loadReads
+    from operonBankConstruct import batchOperonFinder
+    annotation = GeneBank("geneBank.npz")
+    seconds = 0
+    for sample in samples:
+        readsList = loadReads(readsFileName(sample))
+        geneBank = annotation.bind(readsList)
+        start = time.time()
+        batchOperonFinder(geneBank, readsList)
+        seconds += time.time() - start
+    return seconds, len(samples) * (len(annotation) - 1)
+
+
+def benchBoundFinder(samples):
+    """Finds the operon boundaries of every sample and saves its
+    operonBank_<sample>.npz. Returns (seconds, boundaries)."""
+    from geneBank import GeneBank
+    from coverage import loadReads
+    from operonBankConstruct import batchOperonFinder, windowBoundFinder
+    annotation = GeneBank("geneBank.npz")
+    seconds = 0
+    boundaries = 0
+    for sample in samples:
+        readsList = loadReads(readsFileName(sample))
+        operonBank = batchOperonFinder(annotation.bind(readsList), readsList)
+        start = time.time()
+        for j in xrange(len(operonBank) - 1):
+            operonBank[j].setOrientation()
+            windowBoundFinder(operonBank[j], operonBank[j + 1], readsList)
+        seconds += time.time() - start
+        boundaries += len(operonBank) - 1
+        operonBank.save("operonBank_" + sample + ".npz")
+    return seconds, boundaries
+
+
+def benchRefine(samples):
+    """Builds the consensus operons of all samples, finds their boundaries
+    in every sample and saves operonBankRD_<sample>.npz. Returns (seconds,
+    boundaries)."""
+    from geneBank import GeneBank
+    from operonBank import OperonBank
+    from coverage import loadCoverageMatrix
+    from operonConsensus import consensusGaps, groupOperons
+    from operonBankConstruct import matrixBoundFinder
+    start = time.time()
+    annotation = GeneBank("geneBank.npz")
+    operonBanks = [OperonBank("operonBank_" + sample + ".npz")
+                   for sample in samples]
+    gaps = consensusGaps(operonBanks, annotation, 'union')
+    matrix = loadCoverageMatrix([readsFileName(sample)
+                                 for sample in samples])
+    consensusBank = groupOperons(annotation, gaps)
+    operonBanksRD = [consensusBank.bind(readsList) for readsList in matrix]
+    for j in xrange(len(consensusBank) - 1):
+        matrixBoundFinder([(operonBankRD[j], operonBankRD[j + 1])
+                           for operonBankRD in operonBanksRD], matrix)
+    seconds = time.time() - start
+    for k in xrange(len(samples)):
+        operonBanksRD[k][-1].setOrientation()
+        operonBanksRD[k].save("operonBankRD_" + samples[k] + ".npz")
+    return seconds, len(samples) * (len(consensusBank) - 1)
+
+
+def benchHLShiftFinder(samples):
+    """Assigns probes to the refined operons of every sample, finds the
+    half-life shifts and writes processedOperons_<sample>.csv. Returns
+    (seconds, operons)."""
+    from operonBank import OperonBank
+    from coverage import loadReads
+    from probeTable import loadProbeTable
+    from halfLifeShift import HLShiftTable
+    from export import writeProcessedOperons
+    seconds = 0
+    operons = 0
+    for sample in samples:
+        operonBank = OperonBank("operonBankRD_" + sample + ".npz").bind(
+            loadReads(readsFileName(sample)))
+        start = time.time()
+        loadProbeTable(probeFileName(sample)).assign(operonBank)
+        table = HLShiftTable(operonBank)
+        seconds += time.time() - start
+        operons += len(operonBank)
+        writeProcessedOperons(operonBank, table,
+                              "processedOperons_" + sample + ".csv")
+    return seconds, operons
+
+
+def benchRNaseY(samples):
+    """Compares the processed operons of wt1 and rny1 (see
+    RNaseYProcessedOperonFinder.py). Returns (seconds, operons)."""
+    from operonBank import OperonBank
+    from RNaseYProcessedOperonFinder import RNaseYProcessedOperonFinder
+    start = time.time()
+    RNaseYProcessedOperonFinder("wt1", "rny1")
+    seconds = time.time() - start
+    return seconds, len(OperonBank("operonBankRD_wt1.npz"))
+
+
+STAGES = [("geneBank",      benchGeneBank),
+          ("operonFinder",  benchOperonFinder),
+          ("boundFinder",   benchBoundFinder),
+          ("refine",        benchRefine),
+          ("HLShiftFinder", benchHLShiftFinder),
+          ("RNaseY",        benchRNaseY)]
+
+
+def _runStage(function, samples, queue):
+    """Runs one stage in a child process and reports its results, or the
+    traceback of its exception."""
+    try:
+        seconds, items = function(samples)
+    except Exception:
+        queue.put(traceback.format_exc())
+        raise
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((seconds, items, peak))
+
+
+def _stageResult(process, queue):
+    """Waits for the results of the stage run by process, polling the
+    queue every POLLSECONDS. Returns the results, the traceback of the
+    stage, or None if the process died without reporting."""
+    while True:
+        try:
+            return queue.get(timeout = POLLSECONDS)
+        except Queue.Empty:
+            if not process.is_alive():
+                break
+    try:
+        # The process may have reported just before it exited.
+        return queue.get(timeout = POLLSECONDS)
+    except Queue.Empty:
+        return None
+
+
+def runStage(name, function, samples):
+    """Runs one stage in a fresh process. Returns its result record; the
+    record of a stage that failed has 'failed' set, the exit code of its
+    process and its error."""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target = _runStage,
+                                      args = (function, samples, queue))
+    process.start()
+    result = _stageResult(process, queue)
+    process.join()
+    if not isinstance(result, tuple):
+        return {'stage':    name,
+                'failed':   True,
+                'exitcode': process.exitcode,
+                'error':    result or "process exited without results"}
+    seconds, items, peak = result
+    return {'stage':      name,
+            'seconds':    round(seconds, 6),
+            'items':      items,
+            'throughput': round(items / seconds, 3) if seconds > 0 else None,
+            'peakKB':     peak}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Times the workflow stages on synthetic data.")
+    parser.add_argument("--length", type = int, default = 2000000,
+                        help = "genome length (default 2000000)")
+    parser.add_argument("--samples", type = int, default = 4,
+                        help = "number of samples (default 4)")
+    parser.add_argument("--seed", type = int, default = 7,
+                        help = "random seed (default 7)")
+    parser.add_argument("--directory", default = "benchmarkData",
+                        help = "directory of the synthetic data")
+    parser.add_argument("--csv", action = "store_true",
+                        help = "also write coverage CSV files")
+    parser.add_argument("--output", help = "JSON result file")
+    parser.add_argument("--stages", default = ','.join(
+        name for name, function in STAGES),
+        help = "comma-separated stages to run")
+    args = parser.parse_args(argv)
+    if args.samples < 2:
+        parser.error("at least two samples (wt1 and rny1) are needed")
+    from export import configureLogging
+    configureLogging()
+
+    start = time.time()
+    samples, genes = writeDataSet(args.directory, args.length, args.samples,
+                                  args.seed, args.csv)
+    generation = time.time() - start
+
+    cwd = os.getcwd()
+    os.chdir(args.directory)
+    try:
+        stages = args.stages.split(',')
+        results = [runStage(name, function, samples)
+                   for name, function in STAGES if name in stages]
+    finally:
+        os.chdir(cwd)
+
+    report = {'length':     args.length,
+              'samples':    args.samples,
+              'genes':      genes,
+              'seed':       args.seed,
+              'csv':        args.csv,
+              'generation': round(generation, 6),
+              'python':     sys.version.split()[0],
+              'numpy':      numpy.__version__,
+              'time':       time.strftime("%Y-%m-%dT%H:%M:%S"),
+              'stages':     results}
+    text = json.dumps(report, indent = 1, sort_keys = True)
+    if args.output:
+        with open(args.output, 'w') as fileObj:
+            fileObj.write(text + '\n')
+    print text
+    if any(result.get('failed') for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
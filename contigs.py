@@ -0,0 +1,178 @@
+"""
+File: contigs.py
+
+Registry of the contigs (chromosomes, plasmids, or the chromosomes of
+several strains) processed in one run.
+
+Each contig has an id, a genome file and a pattern for the reads file of
+a sample (e.g. 'plasmid_%s.csv' gives 'plasmid_wt1.csv' for wt1). The
+contigs are listed in contigs.csv, one per row:
+
+    contig id, genome file, reads file pattern
+
+Without contigs.csv there is one contig, Spy, with the genome
+SpyGenome.txt and the reads files wt1.csv, wt2.csv, ... as before.
+
+Genomes and coverage are loaded on first use and kept by the registry,
+so one process serves every contig without loading anything twice.
+Binary coverage files are memory-mapped (see coverage.py).
+
+"""
+import os
+import csv
+from genome   import getGenome
+from coverage import loadReads
+
+CONTIGFILE    = "contigs.csv"
+DEFAULTCONTIG = "Spy"
+DEFAULTGENOME = "SpyGenome.txt"
+DEFAULTREADS  = "%s.csv"
+BEDSUFFIX     = "|"
+
+_contigs = None
+
+
+class Contig(object):
+    """One contig: its genome file and the reads files of its samples."""
+
+    def __init__(self, name, genomeFile, readsPattern):
+        """name: the contig id carried by genes and operons.
+        genomeFile: the text or packed genome file of the contig.
+        readsPattern: the reads file of a sample, with %s for the sample
+                name."""
+        self._name         = name
+        self._genomeFile   = genomeFile
+        self._readsPattern = readsPattern
+        self._reads        = {}
+
+    def getName(self):
+        """Returns the contig id."""
+        return self._name
+
+    def getBedName(self):
+        """Returns the contig column of BED files, e.g. 'Spy|'."""
+        return self._name + BEDSUFFIX
+
+    def getGenome(self):
+        """Returns the shared Genome of the contig (see genome.py)."""
+        return getGenome(self._genomeFile)
+
+    def getReadsFile(self, sample):
+        """Returns the reads file of a sample on this contig."""
+        return self._readsPattern % sample
+
+    def getReads(self, sample):
+        """Returns the Coverage of a sample on this contig. It is loaded on
+        the first request and kept for later ones."""
+        if sample not in self._reads:
+            self._reads[sample] = loadReads(self.getReadsFile(sample))
+        return self._reads[sample]
+
+    def release(self, sample = None):
+        """Drops the kept Coverage of a sample, or of all samples."""
+        if sample == None:
+            self._reads.clear()
+        else:
+            self._reads.pop(sample, None)
+
+
+def loadContigs(fileName = CONTIGFILE):
+    """Returns the contigs listed in a contig file, or the default contig
+    if the file does not exist."""
+    if not os.path.exists(fileName):
+        return [Contig(DEFAULTCONTIG, DEFAULTGENOME, DEFAULTREADS)]
+    contigs = []
+    with open(fileName, 'rU') as fileObj:
+        for row in csv.reader(fileObj):
+            if row == [] or row[0].startswith('#'):
+                continue
+            if len(row) != 3 or '%s' not in row[2]:
+                raise ValueError, "Bad contig row in " + fileName + ": " + \
+                      ','.join(row)
+            contigs.append(Contig(row[0], row[1], row[2]))
+    return contigs
+
+
+def getContigs():
+    """Returns the registered contigs, in the order of the contig file. The
+    contig file is read on the first call."""
+    global _contigs
+    if _contigs == None:
+        _contigs = loadContigs()
+    return list(_contigs)
+
+
+def getContig(name):
+    """Returns the registered contig with the given id. Raises KeyError if
+    there is none."""
+    for contig in getContigs():
+        if contig.getName() == name:
+            return contig
+    raise KeyError, "Unknown contig: " + str(name)
+
+
+def register(name, genomeFile, readsPattern = DEFAULTREADS):
+    """Registers a contig, replacing a registered contig with the same id.
+    Returns the new Contig."""
+    global _contigs
+    contig = Contig(name, genomeFile, readsPattern)
+    _contigs = [c for c in getContigs() if c.getName() != name] + [contig]
+    return contig
+
+
+def reset():
+    """Forgets the registered contigs; the contig file is read again on
+    the next call of getContigs."""
+    global _contigs
+    _contigs = None
+
+
+def readsFiles(sample):
+    """Returns the reads files of a sample on every contig."""
+    return [contig.getReadsFile(sample) for contig in getContigs()]
+
+
+def contigReads(readsList, contig):
+    """Returns the reads of a contig: readsList[contig] if readsList is a
+    SampleReads, readsList itself otherwise."""
+    if isinstance(readsList, SampleReads):
+        return readsList[contig]
+    return readsList
+
+
+def contigOrder(items):
+    """Returns the contig ids of genes or operons in order of first
+    appearance."""
+    order = []
+    seen = set()
+    for item in items:
+        contig = item.getContig()
+        if contig not in seen:
+            seen.add(contig)
+            order.append(contig)
+    return order
+
+
+class SampleReads(object):
+    """The reads of one sample on every contig, indexed by contig id.
+    Banks bound to a SampleReads (see GeneBank.bind) take the reads of each
+    gene or operon from its own contig; the Coverage of a contig is loaded
+    when a gene or operon on it is first bound."""
+
+    def __init__(self, sample, reads = None):
+        """sample: the sample name.
+        reads: Optional, a dictionary of contig id -> Coverage already
+               loaded (see prefetch.loadSampleReads); the other contigs
+               come from the registry."""
+        self._sample = sample
+        self._reads  = dict(reads) if reads != None else {}
+
+    def getSample(self):
+        """Returns the sample name."""
+        return self._sample
+
+    def __getitem__(self, contig):
+        """Returns the Coverage of the sample on a contig."""
+        if contig in self._reads:
+            return self._reads[contig]
+        return getContig(contig).getReads(self._sample)
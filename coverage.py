@@ -0,0 +1,880 @@
+"""
+File: coverage.py
+
+Converts a per-nucleotide RNA-seq coverage file (wt1.csv, wt2.csv, ...)
+into a compact binary coverage file, and loads it back as a memory-mapped
+NumPy array. Defines the Coverage class, which wraps the reads of one
+sample with the interval statistics of operon calling and a range-minimum
+index.
+
+A binary coverage file starts with a fixed-size text header holding the
+sample name, the number of positions, the dtype and the MD5 checksum of
+the source CSV, followed by the raw coverage values. Reads may be stored
+as float64 (exact for any read), float32 or uint32 (see compactDtype), at
+8, 4 and 4 bytes per position.
+
+A run-length encoded file (version 2, encoding 'rle') also holds the
+number of runs of equal reads, and stores the start of every run
+followed by its read. It is loaded as a RunLengthCoverage, which answers
+the same queries as a Coverage from the runs without decoding them, so
+a sample costs memory per run instead of per position.
+
+"""
+import csv
+import os
+import math
+import hashlib
+import numpy
+import profiling
+
+COVERAGEMAGIC   = "RNACOV"
+COVERAGEVERSION = 1
+RLEVERSION      = 2
+HEADERSIZE      = 256
+COVERAGEEXT     = ".cov"
+WINDOWBLOCK     = 1 << 20
+LOGTABLESIZE    = 1 << 16
+_logTable       = None
+
+
+def readCoverageCSV(fileName):
+    """Parses a tab-delimited coverage file. The third column holds the
+    read of each nucleotide position. Returns a list of floats."""
+    with open(fileName, 'rU') as readsFile:
+        reads = csv.reader(readsFile, delimiter='\t')
+        readsList = []
+        for row in reads:
+            readsList.append(float(row[2]))
+    return readsList
+
+
+def fileChecksum(fileName):
+    """Returns the MD5 hex digest of a file."""
+    md5 = hashlib.md5()
+    with open(fileName, 'rb') as fileObj:
+        while True:
+            block = fileObj.read(1 << 20)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def coverageFileName(fileName):
+    """Returns the binary coverage file name that belongs to a CSV file,
+    e.g. 'wt1.csv' -> 'wt1.cov'."""
+    return os.path.splitext(fileName)[0] + COVERAGEEXT
+
+
+def convertCoverage(csvName, covName = None, sampleName = None,
+                    dtype = 'float64', encoding = 'dense'):
+    """Converts a coverage CSV file to a binary coverage file.
+    csvName: the tab-delimited coverage file.
+    covName: Optional, the output file. Defaults to csvName with a
+            '.cov' extension.
+    sampleName: Optional, the sample name. Defaults to the base name
+            of csvName.
+    dtype: Optional, the dtype used to store the reads ('float64',
+            'float32' or 'uint32'), or 'compact' for the smallest that
+            keeps the reads exact (see compactDtype). The default keeps
+            reads exact.
+    encoding: Optional, 'dense' to store every read or 'rle' to store
+            runs of equal reads.
+    Returns the name of the binary coverage file."""
+    if covName == None:
+        covName = coverageFileName(csvName)
+    if sampleName == None:
+        sampleName = os.path.splitext(os.path.basename(csvName))[0]
+    readsArray = numpy.array(readCoverageCSV(csvName), dtype = numpy.float64)
+    if dtype == 'compact':
+        dtype = compactDtype(readsArray)
+    dtype = numpy.dtype(dtype)
+    if dtype.kind not in 'fu':
+        raise ValueError, "Unsupported coverage dtype: " + dtype.name
+
+    return saveCoverage(readsArray.astype(dtype), covName, sampleName,
+                        fileChecksum(csvName), encoding)
+
+
+def saveCoverage(readsArray, covName, sampleName, checksum = 'none',
+                 encoding = 'dense'):
+    """Writes an array of reads to a binary coverage file, with the MD5
+    checksum of the CSV file it was converted from ('none' if it was not
+    converted from a CSV file). With encoding 'rle' the runs of equal
+    reads are stored instead of every read. Returns covName."""
+    readsArray = numpy.asarray(readsArray)
+    fields = [COVERAGEMAGIC, str(COVERAGEVERSION), sampleName,
+              str(len(readsArray)), readsArray.dtype.str, checksum]
+    if encoding == 'rle':
+        starts, values = runLengthEncode(readsArray)
+        fields[1] = str(RLEVERSION)
+        fields += [encoding, str(len(starts))]
+    elif encoding != 'dense':
+        raise ValueError, "Unsupported coverage encoding: " + encoding
+    header = '\t'.join(fields) + '\n'
+    if len(header) > HEADERSIZE:
+        raise ValueError, "The sample name is too long."
+
+    fileObj = open(covName, 'wb')
+    fileObj.write(header.ljust(HEADERSIZE))
+    if encoding == 'rle':
+        starts.tofile(fileObj)
+        values.tofile(fileObj)
+    else:
+        readsArray.tofile(fileObj)
+    fileObj.close()
+    return covName
+
+
+def readCoverageHeader(fileName):
+    """Returns a dictionary describing a binary coverage file, with the
+    keys 'sample', 'length', 'dtype', 'checksum', 'encoding' ('dense' or
+    'rle') and 'runs' (the number of runs, or the length if dense)."""
+    with open(fileName, 'rb') as fileObj:
+        fields = fileObj.read(HEADERSIZE).rstrip().split('\t')
+    if len(fields) < 2 or fields[0] != COVERAGEMAGIC:
+        raise ValueError, fileName + " is not a binary coverage file."
+    if (fields[1], len(fields)) not in ((str(COVERAGEVERSION), 6),
+                                        (str(RLEVERSION), 8)):
+        raise ValueError, "Unsupported coverage file version: " + fields[1]
+    header = {'sample':   fields[2],
+              'length':   int(fields[3]),
+              'dtype':    numpy.dtype(fields[4]),
+              'checksum': fields[5],
+              'encoding': 'dense',
+              'runs':     int(fields[3])}
+    if len(fields) == 8:
+        header['encoding'] = fields[6]
+        header['runs'] = int(fields[7])
+    return header
+
+
+def loadCoverage(fileName):
+    """Memory-maps a binary coverage file read-only.
+    Returns a NumPy array of reads backed by the page cache, or decoded
+    from the runs of a run-length encoded file."""
+    header = readCoverageHeader(fileName)
+    if header['encoding'] == 'rle':
+        return loadRuns(fileName).getReads()
+    if header['length'] == 0:
+        return numpy.zeros(0, dtype = header['dtype'])
+    readsArray = numpy.memmap(fileName, dtype = header['dtype'], mode = 'r',
+                              offset = HEADERSIZE,
+                              shape = (header['length'],))
+    return numpy.asarray(readsArray)
+
+
+def loadRuns(fileName):
+    """Memory-maps the runs of a run-length encoded coverage file
+    read-only. Returns a RunLengthCoverage."""
+    header = readCoverageHeader(fileName)
+    if header['encoding'] != 'rle':
+        raise ValueError, fileName + " is not run-length encoded."
+    runs = header['runs']
+    startDtype = runStartDtype(header['length'])
+    if runs == 0:
+        return RunLengthCoverage(name = header['sample'], runs = (
+            numpy.zeros(0, startDtype), numpy.zeros(0, header['dtype']), 0))
+    starts = numpy.memmap(fileName, dtype = startDtype, mode = 'r',
+                          offset = HEADERSIZE, shape = (runs,))
+    values = numpy.memmap(fileName, dtype = header['dtype'], mode = 'r',
+                          offset = HEADERSIZE + runs * startDtype.itemsize,
+                          shape = (runs,))
+    return RunLengthCoverage(name = header['sample'], runs = (
+        numpy.asarray(starts), numpy.asarray(values), header['length']))
+
+
+def isCurrent(covName, csvName):
+    """Returns True if the binary coverage file was converted from the
+    current content of csvName, and False otherwise."""
+    if not os.path.exists(covName):
+        return False
+    return readCoverageHeader(covName)['checksum'] == fileChecksum(csvName)
+
+
+def loadReads(fileName):
+    """Returns the reads of a sample as a Coverage object.
+    fileName may be a binary coverage file or a coverage CSV file. For a
+    CSV file, its binary coverage file is memory-mapped instead if it
+    was converted from the current content of the CSV file (see
+    isCurrent), or if the CSV file is gone. A binary coverage file that
+    records no checksum ('none') is used if it is not older than the CSV
+    file. A run-length encoded file gives a RunLengthCoverage, and reads
+    parsed from a CSV file are kept in the smallest exact dtype (see
+    compactDtype)."""
+    sampleName = os.path.splitext(os.path.basename(fileName))[0]
+    if fileName.endswith(COVERAGEEXT):
+        return _loadCoverageFile(fileName, sampleName)
+    covName = coverageFileName(fileName)
+    if os.path.exists(covName):
+        if not os.path.exists(fileName):
+            return _loadCoverageFile(covName, sampleName)
+        if readCoverageHeader(covName)['checksum'] == 'none':
+            current = os.path.getmtime(covName) >= os.path.getmtime(fileName)
+        else:
+            current = isCurrent(covName, fileName)
+        if current:
+            return _loadCoverageFile(covName, sampleName)
+    reads = numpy.array(readCoverageCSV(fileName))
+    return Coverage(reads.astype(compactDtype(reads)), sampleName)
+
+
+def _loadCoverageFile(covName, sampleName):
+    """Returns the Coverage, or RunLengthCoverage, of a binary coverage
+    file."""
+    if readCoverageHeader(covName)['encoding'] == 'rle':
+        coverage = loadRuns(covName)
+        coverage._name = sampleName
+        return coverage
+    return Coverage(loadCoverage(covName), sampleName)
+
+
+def logReads(reads):
+    """Returns the log2 of an array of reads as an array, computed as
+    sequence.py computes it for a list (math.log of each read, a read of
+    0 counted as 1). Integer reads below LOGTABLESIZE are looked up in a
+    table of those logarithms; for the others the logarithm is taken once
+    per distinct read."""
+    global _logTable
+    if profiling.ENABLED:
+        profiling.count('logTransforms', len(reads))
+    if _logTable is None:
+        _logTable = numpy.array([0.0] + [math.log(read, 2) for read
+                                         in xrange(1, LOGTABLESIZE)])
+    reads = numpy.asarray(reads)
+    tabled = (reads >= 0) & (reads < LOGTABLESIZE) & \
+             (reads == numpy.floor(reads))
+    if tabled.all():
+        return _logTable[reads.astype(numpy.intp)]
+    logs = numpy.empty(len(reads))
+    logs[tabled] = _logTable[reads[tabled].astype(numpy.intp)]
+    values, inverse = numpy.unique(reads[~tabled], return_inverse = True)
+    logs[~tabled] = numpy.array([math.log(value if value != 0 else 1, 2)
+                                 for value in values],
+                                dtype = numpy.float64)[inverse]
+    return logs
+
+
+def logCV(logs):
+    """Returns the coefficient variation of an array of log-reads, as
+    Sequence.getLogCV does: numpy.std over numpy.average, or 0 if the
+    average is not positive."""
+    average = numpy.average(logs)
+    if average > 0:
+        return numpy.std(logs) / average
+    return 0
+
+
+def windowLogCVs(logs, width):
+    """Returns an array with the log-CV of every window of width log-reads
+    of an array, each equal to logCV of the window. The windows are
+    gathered into rows of a matrix, at most WINDOWBLOCK values at a time,
+    and reduced along the rows; numpy.mean and numpy.std of a row give the
+    same bits as numpy.average and numpy.std of the window alone."""
+    count = max(len(logs) - width + 1, 0)
+    CVs = numpy.zeros(count)
+    rows = max(WINDOWBLOCK // width, 1)
+    offsets = numpy.arange(width)
+    for first in xrange(0, count, rows):
+        last = min(first + rows, count)
+        windows = logs[numpy.arange(first, last)[:, None] + offsets]
+        averages = numpy.mean(windows, axis = 1)
+        stds = numpy.std(windows, axis = 1)
+        positive = averages > 0
+        CVs[first:last][positive] = stds[positive] / averages[positive]
+    return CVs
+
+
+class Coverage(object):
+    """Holds the reads of one sample. A Coverage behaves like the readsList
+    it wraps (len, indexing and slicing), and answers interval statistics
+    of log2-transformed reads. The average read and the log-CV, which
+    operon calling compares with thresholds, are computed from the
+    log-reads of the interval (see logReads), as Sequence computes them
+    for a list, so they are the same bits. As in Sequence, a read of 0 is
+    counted as 1.
+    Minimum reads and their locations come from a sparse table over
+    blocks of MINBLOCK positions, built on first use."""
+
+    MINBLOCK = 32
+
+    def __init__(self, readsList, name = ''):
+        """readsList: a list or NumPy array of reads. Arrays are shared,
+                lists are converted once.
+        name: Optional, the sample name."""
+        self._reads = numpy.asarray(readsList)
+        self._name = name
+        self._minLeft = None
+        self._minRight = None
+
+    def __len__(self):
+        """Returns the number of positions."""
+        return len(self._reads)
+
+    def __getitem__(self, index):
+        """Returns the read at index, or an array view for a slice."""
+        return self._reads[index]
+
+    def __iter__(self):
+        """Iterates through the reads."""
+        return iter(self._reads)
+
+    def getName(self):
+        """Returns the sample name."""
+        return self._name
+
+    def getReads(self):
+        """Returns the reads as a NumPy array."""
+        return self._reads
+
+    def buildMinIndex(self):
+        """Builds the range-minimum index now instead of on first use (see
+        prefetch.py)."""
+        if self._minLeft is None:
+            self._buildMinIndex()
+
+    def _interval(self, start, end):
+        """Clips (start, end) the way a slice of the reads would."""
+        start, end, step = slice(start, end).indices(len(self))
+        return start, max(start, end)
+
+    def _intervals(self, starts, ends):
+        """Clips arrays of starts and ends the way slices of the reads
+        would."""
+        size = len(self)
+        bounds = []
+        for bound in (starts, ends):
+            bound = numpy.array(bound, dtype = numpy.int64, ndmin = 1)
+            bound[bound < 0] += size
+            bounds.append(numpy.clip(bound, 0, size))
+        starts, ends = bounds
+        return starts, numpy.maximum(starts, ends)
+
+    def getAverageRead(self, start, end):
+        """Returns the geometric-mean read over [start, end), or 0 if the
+        interval is empty. It is 2 to the numpy.average of the log-reads
+        (see logReads), the average read a list of the same reads gives,
+        bit for bit: operon calling compares average reads with fold and
+        dent thresholds, which exact multiples of a read meet with
+        equality."""
+        start, end = self._interval(start, end)
+        if start == end:
+            return 0
+        return 2 ** numpy.average(logReads(self[start:end]))
+
+    def getIntervalAverageReads(self, starts, ends):
+        """Returns an array with the geometric-mean read of every interval
+        [starts[k], ends[k]), each equal to getAverageRead(starts[k],
+        ends[k])."""
+        starts, ends = self._intervals(starts, ends)
+        averages = numpy.zeros(len(starts))
+        for k in numpy.flatnonzero(ends > starts):
+            averages[k] = 2 ** numpy.average(
+                logReads(self[starts[k]:ends[k]]))
+        return averages
+
+    def getLogCV(self, start, end):
+        """Returns the coefficient variation of log-reads over
+        [start, end), or 0 if the interval is empty or its average
+        log-read is not positive. It is computed from the log-reads
+        themselves (see logCV), so it is the CV a list of the same reads
+        gives, bit for bit; the boundary search compares CVs for ties."""
+        start, end = self._interval(start, end)
+        if start == end:
+            return 0
+        return logCV(logReads(self[start:end]))
+
+    def getWindowLogCVs(self, start, end, width):
+        """Returns an array with the log-CV of every window [s, s + width)
+        for s in [start, end), each equal to getLogCV(s, s + width).
+        The full windows are evaluated at once (see windowLogCVs)."""
+        size = len(self)
+        starts = numpy.arange(max(start, 0), min(max(start, end), size))
+        CVs = numpy.zeros(len(starts))
+        if len(starts) == 0:
+            return CVs
+        first = int(starts[0])
+        full = min(max(size - width + 1 - first, 0), len(starts))
+        if full > 0:
+            CVs[:full] = windowLogCVs(
+                logReads(self[first:first + full - 1 + width]), width)
+        for k in xrange(full, len(starts)):
+            CVs[k] = self.getLogCV(int(starts[k]), int(starts[k]) + width)
+        return CVs
+
+    def _buildMinIndex(self):
+        """Builds sparse tables over block minima. Level k holds, for every
+        run of 2**k blocks starting at a block, the location of its
+        leftmost minimum (_minLeft) and of its rightmost minimum
+        (_minRight)."""
+        size = len(self._reads)
+        blockSize = Coverage.MINBLOCK
+        blocks = (size + blockSize - 1) // blockSize
+        padded = numpy.empty(blocks * blockSize)
+        padded[:size] = self._reads
+        padded[size:] = numpy.inf
+        padded = padded.reshape(blocks, blockSize)
+        offsets = numpy.arange(blocks) * blockSize
+        left = offsets + padded.argmin(axis = 1)
+        right = offsets + blockSize - 1 - padded[:, ::-1].argmin(axis = 1)
+        values = padded.ravel()
+
+        self._minLeft = [left]
+        self._minRight = [right]
+        half = 1
+        while 2 * half <= blocks:
+            left1, left2 = left[:-half], left[half:]
+            left = numpy.where(values[left1] <= values[left2], left1, left2)
+            right1, right2 = right[:-half], right[half:]
+            right = numpy.where(values[right2] <= values[right1],
+                                right2, right1)
+            self._minLeft.append(left)
+            self._minRight.append(right)
+            half *= 2
+
+    def _minLocation(self, start, end, rightmost):
+        """Returns the leftmost (or rightmost) location of the minimum read
+        in [start, end), which must not be empty. Whole blocks are answered
+        by the sparse tables, the partial blocks at either end by a scan of
+        fewer than MINBLOCK reads."""
+        reads = self._reads
+        blockSize = Coverage.MINBLOCK
+        firstBlock = (start + blockSize - 1) // blockSize
+        lastBlock = end // blockSize
+        if lastBlock <= firstBlock:
+            window = reads[start:end]
+            if rightmost:
+                return end - 1 - int(window[::-1].argmin())
+            return start + int(window.argmin())
+
+        if self._minLeft is None:
+            self._buildMinIndex()
+        table = self._minRight if rightmost else self._minLeft
+        level = (lastBlock - firstBlock).bit_length() - 1
+        candidates = [int(table[level][firstBlock]),
+                      int(table[level][lastBlock - (1 << level)])]
+        headEnd = firstBlock * blockSize
+        if start < headEnd:
+            head = reads[start:headEnd]
+            if rightmost:
+                candidates.append(headEnd - 1 - int(head[::-1].argmin()))
+            else:
+                candidates.append(start + int(head.argmin()))
+        tailStart = lastBlock * blockSize
+        if tailStart < end:
+            tail = reads[tailStart:end]
+            if rightmost:
+                candidates.append(end - 1 - int(tail[::-1].argmin()))
+            else:
+                candidates.append(tailStart + int(tail.argmin()))
+
+        best = candidates[0]
+        for location in candidates[1:]:
+            if reads[location] < reads[best] or \
+               (reads[location] == reads[best] and
+                (location > best) == rightmost):
+                best = location
+        return best
+
+    def getMinRead(self, start, end):
+        """Returns the minimum read over [start, end).
+        Raises IndexError if the interval is empty."""
+        start, end = self._interval(start, end)
+        if start == end:
+            raise IndexError, "The read list is empty."
+        return self[self._minLocation(start, end, False)]
+
+    def getIntervalMinReads(self, starts, ends):
+        """Returns an array with the minimum read of every interval
+        [starts[k], ends[k]), computed in one reduction over the reads.
+        Raises IndexError if an interval is empty."""
+        starts, ends = self._intervals(starts, ends)
+        if (ends == starts).any():
+            raise IndexError, "The read list is empty."
+        if len(starts) == 0:
+            return numpy.zeros(0, dtype = self._reads.dtype)
+        reads = numpy.append(self._reads, numpy.inf)
+        bounds = numpy.empty(2 * len(starts), dtype = numpy.int64)
+        bounds[0::2] = starts
+        bounds[1::2] = ends
+        return numpy.minimum.reduceat(reads, bounds)[0::2]
+
+    def getMinReadLocation(self, start, end):
+        """Returns the leftmost location of the minimum read over
+        [start, end), or start if the interval is empty."""
+        clippedStart, clippedEnd = self._interval(start, end)
+        if clippedStart == clippedEnd:
+            return start
+        return self._minLocation(clippedStart, clippedEnd, False)
+
+    def getRightMinReadLocation(self, start, end):
+        """Returns the rightmost location of the minimum read over
+        [start, end), or start if the interval is empty."""
+        clippedStart, clippedEnd = self._interval(start, end)
+        if clippedStart == clippedEnd:
+            return start
+        return self._minLocation(clippedStart, clippedEnd, True)
+
+
+def compactDtype(reads):
+    """Returns the smallest dtype that holds the reads exactly: uint32 for
+    whole reads below 2**32, float32 if it keeps every read, else float64."""
+    reads = numpy.asarray(reads, dtype = numpy.float64)
+    if len(reads) == 0 or ((reads >= 0).all() and (reads < 2 ** 32).all() and
+                           (reads == numpy.floor(reads)).all()):
+        return numpy.dtype(numpy.uint32)
+    if (reads.astype(numpy.float32) == reads).all():
+        return numpy.dtype(numpy.float32)
+    return numpy.dtype(numpy.float64)
+
+
+def runLengthEncode(reads):
+    """Returns (starts, values) of the runs of equal consecutive reads: run
+    k covers [starts[k], starts[k + 1]) and holds values[k]."""
+    reads = numpy.asarray(reads)
+    if len(reads) == 0:
+        return numpy.zeros(0, dtype = numpy.int64), reads[:0]
+    starts = numpy.flatnonzero(reads[1:] != reads[:-1]) + 1
+    starts = numpy.concatenate(([0], starts)).astype(runStartDtype(len(reads)))
+    return starts, reads[starts]
+
+
+def runStartDtype(length):
+    """Returns the dtype of the run starts of a run-length encoded coverage
+    of the given number of positions."""
+    if length < 2 ** 32:
+        return numpy.dtype(numpy.uint32)
+    return numpy.dtype(numpy.int64)
+
+
+class RunLengthCoverage(Coverage):
+    """Holds the reads of one sample as runs of equal reads. RNA-seq
+    coverage is integer-valued and constant over long stretches, so a
+    few runs stand for many positions. A RunLengthCoverage answers
+    everything a Coverage does: a read is found by binary search over the
+    run starts (O(log n)), a slice is decoded run by run, and the
+    range-minimum tables are kept per run instead of per position.
+    getReads decodes every position."""
+
+    def __init__(self, readsList = None, name = '', runs = None):
+        """readsList: a list or NumPy array of reads to encode.
+        name: Optional, the sample name.
+        runs: Optional, instead of readsList, the (starts, values, length)
+              of already encoded runs (see runLengthEncode)."""
+        if runs == None:
+            reads = numpy.asarray(readsList)
+            starts, values = runLengthEncode(reads)
+            length = len(reads)
+        else:
+            starts, values, length = runs
+        self._starts = numpy.asarray(starts)
+        self._values = numpy.asarray(values)
+        self._length = int(length)
+        self._reads = None
+        self._name = name
+        self._minLeft = None
+        self._minRight = None
+
+    def __len__(self):
+        """Returns the number of positions."""
+        return self._length
+
+    def getRunCount(self):
+        """Returns the number of runs."""
+        return len(self._starts)
+
+    def getRuns(self):
+        """Returns the (starts, values) arrays of the runs."""
+        return self._starts, self._values
+
+    def _runs(self, positions):
+        """Returns the runs holding positions (a number or an array of
+        positions in [0, len(self)])."""
+        return numpy.searchsorted(self._starts, positions, 'right') - 1
+
+    def _runEnds(self, first, last):
+        """Returns the ends of the runs first to last, inclusive."""
+        return numpy.append(self._starts[first + 1:last + 1],
+                            self._length if last + 1 >= len(self._starts)
+                            else self._starts[last + 1])
+
+    def _decode(self, start, end):
+        """Returns the reads of [start, end), clipped, as a NumPy array."""
+        if end <= start:
+            return self._values[:0]
+        first, last = self._runs([start, end - 1])
+        starts = numpy.maximum(self._starts[first:last + 1], start)
+        ends = numpy.minimum(self._runEnds(first, last), end)
+        return numpy.repeat(self._values[first:last + 1], ends - starts)
+
+    def __getitem__(self, index):
+        """Returns the read at index, an array of the reads of a slice, or
+        the reads at an array of indexes."""
+        if isinstance(index, slice):
+            start, end, step = index.indices(self._length)
+            if step == 1:
+                return self._decode(start, end)
+            return self[numpy.arange(start, end, step)]
+        positions = numpy.asarray(index)
+        if positions.ndim == 0:
+            position = int(index)
+            if position < 0:
+                position += self._length
+            if position < 0 or position >= self._length:
+                raise IndexError, "The read index is out of range."
+            return self._values[self._runs(position)]
+        positions = numpy.where(positions < 0, positions + self._length,
+                                positions)
+        if ((positions < 0) | (positions >= self._length)).any():
+            raise IndexError, "The read index is out of range."
+        return self._values[self._runs(positions)]
+
+    def __iter__(self):
+        """Iterates through the reads, one run at a time."""
+        for k in xrange(len(self._starts)):
+            for read in self._decode(int(self._starts[k]),
+                                     int(self._runEnds(k, k)[0])):
+                yield read
+
+    def getReads(self):
+        """Returns all reads as a NumPy array, decoded."""
+        return self._decode(0, self._length)
+
+    def _buildMinIndex(self):
+        """Builds sparse tables over the runs. Level k holds, for every 2**k
+        runs starting at a run, the leftmost (_minLeft) and rightmost
+        (_minRight) run of minimum read."""
+        values = self._values
+        left = numpy.arange(len(values))
+        right = left
+        self._minLeft = [left]
+        self._minRight = [right]
+        half = 1
+        while 2 * half <= len(values):
+            left1, left2 = left[:-half], left[half:]
+            left = numpy.where(values[left1] <= values[left2], left1, left2)
+            right1, right2 = right[:-half], right[half:]
+            right = numpy.where(values[right2] <= values[right1],
+                                right2, right1)
+            self._minLeft.append(left)
+            self._minRight.append(right)
+            half *= 2
+
+    def _minRuns(self, firsts, lasts, rightmost):
+        """Returns the leftmost (or rightmost) runs of minimum read among
+        the runs firsts[k] to lasts[k], inclusive, for arrays of runs."""
+        if self._minLeft is None:
+            self._buildMinIndex()
+        table = self._minRight if rightmost else self._minLeft
+        values = self._values
+        levels = numpy.frexp(lasts - firsts + 1)[1] - 1
+        best = numpy.empty(len(firsts), dtype = numpy.int64)
+        for level in numpy.unique(levels):
+            rows = levels == level
+            candidates1 = table[level][firsts[rows]]
+            candidates2 = table[level][lasts[rows] - (1 << level) + 1]
+            if rightmost:
+                best[rows] = numpy.where(
+                    values[candidates2] <= values[candidates1],
+                    candidates2, candidates1)
+            else:
+                best[rows] = numpy.where(
+                    values[candidates1] <= values[candidates2],
+                    candidates1, candidates2)
+        return best
+
+    def _minLocation(self, start, end, rightmost):
+        """Returns the leftmost (or rightmost) location of the minimum read
+        in [start, end), which must not be empty: the first (or last)
+        position of the run of minimum read within the interval."""
+        first, last = self._runs([start, end - 1])
+        run = int(self._minRuns(numpy.array([first]), numpy.array([last]),
+                                rightmost)[0])
+        if rightmost:
+            return min(end, int(self._runEnds(run, run)[0])) - 1
+        return max(start, int(self._starts[run]))
+
+    def getIntervalMinReads(self, starts, ends):
+        """Returns an array with the minimum read of every interval
+        [starts[k], ends[k]), from the sparse tables over the runs.
+        Raises IndexError if an interval is empty."""
+        starts, ends = self._intervals(starts, ends)
+        if (ends == starts).any():
+            raise IndexError, "The read list is empty."
+        if len(starts) == 0:
+            return numpy.zeros(0, dtype = self._values.dtype)
+        runs = self._minRuns(self._runs(starts), self._runs(ends - 1), False)
+        return self._values[runs].astype(numpy.float64)
+
+
+def loadCoverageMatrix(fileNames):
+    """Returns the reads of several samples (coverage CSV or binary coverage
+    files, see loadReads) as one CoverageMatrix, in the order of fileNames."""
+    return CoverageMatrix([loadReads(fileName) for fileName in fileNames])
+
+
+class CoverageMatrix(object):
+    """Holds the reads of several samples with named rows, each sample as
+    its own Coverage, so memory-mapped and run-length encoded samples stay
+    as compact as they are alone. Interval statistics are answered for
+    every sample in one call: each returns an array with one entry per
+    sample, equal to what the Coverage of that sample returns. Bounds may
+    be numbers, shared by all samples, or arrays with one bound per
+    sample."""
+
+    def __init__(self, coverages, names = None):
+        """coverages: a list of Coverage objects (or read arrays) of equal
+                length, or a 2-D array with one row per sample.
+        names: Optional, the sample names; by default the names of the
+               Coverage objects."""
+        if names == None:
+            names = [coverage.getName() if isinstance(coverage, Coverage)
+                     else '' for coverage in coverages]
+        self._names = list(names)
+        if len(self._names) != len(coverages):
+            raise ValueError, "There must be one name per sample."
+        self._coverages = [coverage if isinstance(coverage, Coverage)
+                           else Coverage(coverage, name)
+                           for coverage, name in zip(coverages, self._names)]
+        if len(set(len(coverage) for coverage in self._coverages)) > 1:
+            raise ValueError, "The samples have different lengths."
+
+    def __len__(self):
+        """Returns the number of samples."""
+        return len(self._coverages)
+
+    def __getitem__(self, sample):
+        """Returns the Coverage of a sample, given by its index or name."""
+        return self.getCoverage(sample)
+
+    def __iter__(self):
+        """Iterates through the Coverage of each sample."""
+        return iter(self._coverages)
+
+    def getNames(self):
+        """Returns the sample names."""
+        return self._names
+
+    def getIndex(self, name):
+        """Returns the row of the sample with the given name.
+        Raises ValueError if there is no such sample."""
+        return self._names.index(name)
+
+    def getReads(self):
+        """Returns the reads as a 2-D NumPy array, one row per sample. The
+        rows are decoded and copied (see Coverage.getReads)."""
+        if len(self) == 0:
+            return numpy.zeros((0, 0))
+        return numpy.vstack([coverage.getReads()
+                             for coverage in self._coverages])
+
+    def getReadsAt(self, positions):
+        """Returns a 2-D array of the reads of each sample (one row per
+        sample) at an array of positions."""
+        return numpy.vstack([coverage[positions]
+                             for coverage in self._coverages])
+
+    def getPositionCount(self):
+        """Returns the number of positions of each sample."""
+        if len(self) == 0:
+            return 0
+        return len(self._coverages[0])
+
+    def getCoverage(self, sample):
+        """Returns the Coverage of a sample, given by its index or name."""
+        if isinstance(sample, str):
+            sample = self.getIndex(sample)
+        return self._coverages[sample]
+
+    def _intervals(self, start, end):
+        """Returns per-sample (starts, ends) arrays, clipped the way slices
+        of the reads would be."""
+        size = self.getPositionCount()
+        bounds = []
+        for bound in (start, end):
+            bounds.append(numpy.empty(len(self), dtype = numpy.int64))
+            bounds[-1][:] = bound
+            bounds[-1][bounds[-1] < 0] += size
+            numpy.clip(bounds[-1], 0, size, out = bounds[-1])
+        starts, ends = bounds
+        return starts, numpy.maximum(starts, ends)
+
+    def getAverageReads(self, start, end):
+        """Returns the geometric-mean read of each sample over [start, end),
+        0 for a sample whose interval is empty (see
+        Coverage.getAverageRead)."""
+        starts, ends = self._intervals(start, end)
+        averages = numpy.zeros(len(self))
+        for k in numpy.flatnonzero(ends > starts):
+            averages[k] = self._coverages[k].getAverageRead(starts[k],
+                                                            ends[k])
+        return averages
+
+    def getLogCVs(self, start, end):
+        """Returns the coefficient variation of log-reads of each sample over
+        [start, end), 0 where the interval is empty or the average log-read
+        is not positive (see Coverage.getLogCV)."""
+        starts, ends = self._intervals(start, end)
+        CVs = numpy.zeros(len(self))
+        for k in numpy.flatnonzero(ends > starts):
+            CVs[k] = self._coverages[k].getLogCV(starts[k], ends[k])
+        return CVs
+
+    def getWindowLogCVs(self, start, end, width):
+        """Returns a 2-D array with the log-CV of every window [s, s + width)
+        for s in [start, end) (one row per sample), as
+        Coverage.getWindowLogCVs returns for one sample."""
+        starts = numpy.arange(max(start, 0),
+                              min(max(start, end), self.getPositionCount()))
+        CVs = numpy.zeros((len(self), len(starts)))
+        for k in xrange(len(self)):
+            CVs[k] = self._coverages[k].getWindowLogCVs(start, end, width)
+        return CVs
+
+    def _minLocations(self, rows, starts, ends, rightmost):
+        """Returns the leftmost (or rightmost) location of the minimum read
+        of the given samples over their intervals, which must not be empty. The
+        reads spanned by all intervals are scanned at once, so this is
+        meant for short intervals such as operon junctions."""
+        low = int(starts.min())
+        high = int(ends.max())
+        positions = numpy.arange(low, high)
+        inside = (positions >= starts[:, None]) & (positions < ends[:, None])
+        reads = numpy.vstack([self._coverages[k][low:high] for k in rows])
+        window = numpy.where(inside, reads, numpy.inf)
+        if rightmost:
+            return high - 1 - window[:, ::-1].argmin(axis = 1)
+        return low + window.argmin(axis = 1)
+
+    def getMinReads(self, start, end):
+        """Returns the minimum read of each sample over [start, end).
+        Raises IndexError if the interval of a sample is empty."""
+        starts, ends = self._intervals(start, end)
+        if (ends == starts).any():
+            raise IndexError, "The read list is empty."
+        locations = self._minLocations(numpy.arange(len(self)), starts, ends,
+                                       False)
+        return numpy.array([self._coverages[k][int(locations[k])]
+                            for k in xrange(len(self))])
+
+    def getMinReadLocations(self, start, end):
+        """Returns the leftmost location of the minimum read of each sample
+        over [start, end), or its start where the interval is empty."""
+        return self._locations(start, end, False)
+
+    def getRightMinReadLocations(self, start, end):
+        """Returns the rightmost location of the minimum read of each sample
+        over [start, end), or its start where the interval is empty."""
+        return self._locations(start, end, True)
+
+    def _locations(self, start, end, rightmost):
+        """Returns the minimum locations of getMinReadLocations (or of
+        getRightMinReadLocations, if rightmost)."""
+        starts, ends = self._intervals(start, end)
+        locations = numpy.empty(len(self), dtype = numpy.int64)
+        locations[:] = start
+        full = numpy.flatnonzero(ends > starts)
+        if len(full) > 0:
+            locations[full] = self._minLocations(full, starts[full],
+                                                 ends[full], rightmost)
+        return locations
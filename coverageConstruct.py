@@ -0,0 +1,40 @@
+"""
+File: coverageConstruct.py
+Converts the coverage files of wt1, wt2, rny1, and rny2, on every contig
+(see contigs.py), into binary coverage files that later stages memory-map
+instead of re-parsing. The reads may be stored in a smaller dtype, or as
+runs of equal reads (see coverage.py)."""
+
+import logging
+from coverage import convertCoverage
+from contigs import getContigs
+from export import configureLogging
+
+sampleList = ["wt1", "wt2", "rny1", "rny2"]
+log = logging.getLogger("coverageConstruct")
+
+
+def coverageConstruct(samples = sampleList, dtype = 'float64',
+                      encoding = 'dense'):
+    """Converts the reads files of the samples on every contig, storing the
+    reads in dtype ('float64', 'float32', 'uint32' or 'compact') with the
+    given encoding ('dense' or 'rle'). Returns the names of the binary
+    coverage files."""
+    covNames = []
+    for contig in getContigs():
+        for sample in samples:
+            covName = convertCoverage(contig.getReadsFile(sample),
+                                      dtype = dtype, encoding = encoding)
+            log.info("%s is generated.", covName)
+            covNames.append(covName)
+    return covNames
+
+
+def main():
+    """Converts the reads files of the four samples."""
+    configureLogging()
+    coverageConstruct()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+"""
+File: equivalenceCheck.py
+
+Checks that the faster paths of the workflow give the same results as
+the paths they replace, on deterministic synthetic data:
+
+    boundFinder   windowBoundFinder on a Coverage (dense and run-length
+                  encoded) sets the same operon bounds as boundFinder on
+                  a list of reads. The coverage is made of short runs of
+                  a few low integer reads, so many windows of a search
+                  space tie on their log-CV.
+    matrixBoundFinder
+                  matrixBoundFinder on a CoverageMatrix sets, in every
+                  sample, the bounds boundFinder sets on a list of the
+                  reads of that sample, and with the width, reach and
+                  factor of MATRIXSETTINGS the bounds windowBoundFinder
+                  sets with them.
+    operonFinder  batchOperonFinder on a Coverage (dense and run-length
+                  encoded) groups genes into the same operons as
+                  operonFinder on a list of reads. Each gene is covered
+                  at one of PLATEAUREADS and the dips between genes fall
+                  to a half or a quarter of it, so the fold and dent
+                  criteria often meet their thresholds exactly.
+    operonJudges  operonJudges on a CoverageMatrix splits, in every
+                  sample, the consecutive genes operonJudge splits on a
+                  list of the reads of that sample. The samples cover
+                  the genes of operonFinder at their reads times powers
+                  of two, so the thresholds are met exactly as often.
+    processedOperons
+                  HLShiftTable flags the operons, and computes their
+                  average read and reference, maximum and minimum log2
+                  half-life, exactly as the original per-operon
+                  sliding-window search does. Operons have up to 300
+                  probes, and many half-lives are powers of two, so
+                  window means often reach the threshold exactly.
+    bankFormat    Every bank written by a workflow run, saved as a legacy
+                  stream of pickled objects, loads to the same genes and
+                  operons as its .npz file, and converts back to the same
+                  bytes (see bankFormat.py).
+    parallel      A workflow run with PARALLELWORKERS worker processes
+                  writes the same bytes to every output file as a serial
+                  run.
+    incremental   A workflow run in incremental mode, after the data set
+                  it last ran on was edited (see editDataSet), writes the
+                  same bytes to every output file but the state files as
+                  a full run on the edited data set.
+
+The workflow checks run 'rnaProcessing.py all' in a child process on a
+synthetic data set of DATALENGTH positions and four samples (see
+benchmark.writeDataSet), in a temporary directory unless --directory is
+given.
+
+Each check prints OK, or the first mismatches it found. The script exits
+with status 1 if any check fails.
+
+Usage: python equivalenceCheck.py [--seed N] [--directory DIR]
+                                  [--checks CHECK,...]
+
+"""
+import os
+import sys
+import csv
+import math
+import glob
+import shutil
+import filecmp
+import tempfile
+import argparse
+import subprocess
+import numpy
+from sequence import Sequence
+from operon   import Operon
+from coverage import Coverage, RunLengthCoverage, CoverageMatrix
+from coverage import runLengthEncode, loadCoverage, saveCoverage
+from operonBankConstruct import boundFinder, windowBoundFinder
+from operonBankConstruct import matrixBoundFinder, operonJudge, operonJudges
+from operonBankConstruct import operonFinder, batchOperonFinder
+from halfLifeShift import HLShiftTable, WORKWIDTH, THRESHOLD, MINAVERAGEREAD
+from geneBank   import GeneBank
+from operonBank import OperonBank
+from bankFormat import convertBank
+from benchmark  import writeDataSet
+from incremental import INCREMENTALVARIABLE, STATEEXT
+
+STEPLENGTH = 40000
+STEPREADS  = [0, 1, 2, 3, 4, 6, 8, 16]
+MATRIXSAMPLES = 3
+MATRIXSETTINGS = (15, 120, 1.5)
+PLATEAUREADS = [1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64]
+PLATEAUGENES = 300
+PROBEOPERONS = 600
+PROBEREADS   = [250, 499, 500, 501, 2000]
+PROBEHLS     = [0.5, 1, 2, 4, 8, -1]
+DATALENGTH = 200000
+PARALLELWORKERS = 3
+SHOWN      = 3
+SCRIPT     = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "rnaProcessing.py")
+
+
+def stepCoverage(length, rng):
+    """Returns reads made of runs of 3 to 59 equal reads, each drawn from
+    STEPREADS."""
+    reads = numpy.zeros(length)
+    position = 0
+    while position < length:
+        run = rng.randint(3, 60)
+        reads[position:position + run] = rng.choice(STEPREADS)
+        position += run
+    return reads
+
+
+def stepGenes(length, rng):
+    """Returns (start, end, orientation) of consecutive genes 100 to 1500
+    bases long, some overlapping, most on the forward strand."""
+    genes = []
+    position = 100
+    while True:
+        end = position + rng.randint(100, 1500)
+        if end >= length - 500:
+            return genes
+        genes.append((position, end, '+++-'[rng.randint(4)]))
+        position = end + rng.randint(-5, 150)
+
+
+def junctionOperons(genes, readsList):
+    """Returns an (operon1, operon2) pair for every two consecutive genes,
+    each gene taken as a single-gene operon on readsList."""
+    pairs = []
+    for j in xrange(len(genes) - 1):
+        operon1 = Operon('')
+        operon1.add(Sequence(readsList, genes[j][:2], 'gene1', genes[j][2]))
+        operon2 = Operon('')
+        operon2.add(Sequence(readsList, genes[j + 1][:2], 'gene2',
+                             genes[j + 1][2]))
+        pairs.append((operon1, operon2))
+    return pairs
+
+
+def pairBounds(pairs):
+    """Returns the (right bound, precision, left bound, precision) set
+    between the operons of every pair."""
+    return [(operon1.getRightBound(), operon1.getRightBoundPrecision(),
+             operon2.getLeftBound(), operon2.getLeftBoundPrecision())
+            for operon1, operon2 in pairs]
+
+
+def junctionBounds(genes, readsList, finder):
+    """Returns the bounds (see pairBounds) that finder sets between every
+    two consecutive genes of readsList."""
+    pairs = junctionOperons(genes, readsList)
+    for operon1, operon2 in pairs:
+        finder(operon1, operon2, readsList)
+    return pairBounds(pairs)
+
+
+def compare(label, expected, found):
+    """Returns the descriptions of the rows where found differs from
+    expected."""
+    if len(expected) != len(found):
+        return ["%s: %d rows instead of %d" % (label, len(found),
+                                               len(expected))]
+    return ["%s: row %d is %r instead of %r" % (label, j, found[j],
+                                                 expected[j])
+            for j in xrange(len(expected)) if found[j] != expected[j]]
+
+
+def checkBoundFinder(seed, directory):
+    """windowBoundFinder on a Coverage and on a RunLengthCoverage against
+    boundFinder on a list of the same reads."""
+    rng = numpy.random.RandomState(seed)
+    reads = stepCoverage(STEPLENGTH, rng)
+    genes = stepGenes(STEPLENGTH, rng)
+    expected = junctionBounds(genes, list(reads), boundFinder)
+    starts, values = runLengthEncode(reads)
+    problems = []
+    for label, readsList in [
+            ("Coverage", Coverage(reads)),
+            ("RunLengthCoverage", RunLengthCoverage(
+                runs = (starts, values, len(reads))))]:
+        problems += compare(label, expected,
+                            junctionBounds(genes, readsList,
+                                           windowBoundFinder))
+    return problems
+
+
+def checkMatrixBoundFinder(seed, directory):
+    """matrixBoundFinder on a CoverageMatrix of MATRIXSAMPLES samples
+    against boundFinder on a list of the reads of each sample."""
+    rng = numpy.random.RandomState(seed)
+    samples = [stepCoverage(STEPLENGTH, rng)
+               for k in xrange(MATRIXSAMPLES)]
+    genes = stepGenes(STEPLENGTH, rng)
+    matrix = CoverageMatrix(samples)
+    sampleOperons = [junctionOperons(genes, matrix.getCoverage(k))
+                     for k in xrange(len(matrix))]
+    for j in xrange(len(genes) - 1):
+        matrixBoundFinder([pairs[j] for pairs in sampleOperons], matrix)
+    problems = []
+    for k in xrange(len(matrix)):
+        problems += compare("sample %d" % k,
+                            junctionBounds(genes, list(samples[k]),
+                                           boundFinder),
+                            pairBounds(sampleOperons[k]))
+
+    width, reach, factor = MATRIXSETTINGS
+    sampleOperons = [junctionOperons(genes, matrix.getCoverage(k))
+                     for k in xrange(len(matrix))]
+    for j in xrange(len(genes) - 1):
+        matrixBoundFinder([pairs[j] for pairs in sampleOperons], matrix,
+                          width, reach, factor)
+    for k in xrange(len(matrix)):
+        problems += compare(
+            "sample %d with %r" % (k, MATRIXSETTINGS),
+            junctionBounds(genes, matrix.getCoverage(k),
+                           lambda operon1, operon2, readsList:
+                           windowBoundFinder(operon1, operon2, readsList,
+                                             width, reach, factor)),
+            pairBounds(sampleOperons[k]))
+    return problems
+
+
+def plateauCoverage(genes, rng):
+    """Returns (reads, genes) where each of genes consecutive genes, 50 to
+    399 bases long and on the forward strand, is covered at a single read
+    of PLATEAUREADS or at four times, a quarter of or twice the read of
+    the gene before, and the 2 to 29 bases after a gene at its read, half
+    of it or a quarter of it."""
+    pieces = [numpy.ones(100)]
+    plateaus = []
+    position = 100
+    read = None
+    for j in xrange(genes):
+        if read == None or rng.rand() < 0.5:
+            read = float(rng.choice(PLATEAUREADS))
+        else:
+            read *= [4, 0.25, 2, 1][rng.randint(4)]
+        length = rng.randint(50, 400)
+        plateaus.append((position, position + length, '+'))
+        pieces.append(numpy.repeat(read, length))
+        gap = rng.randint(2, 30)
+        pieces.append(numpy.repeat(read * [0.5, 1, 0.25][rng.randint(3)],
+                                   gap))
+        position += length + gap
+    pieces.append(numpy.ones(100))
+    return numpy.concatenate(pieces), plateaus
+
+
+def operonRecords(genes, readsList, finder):
+    """Returns the genes (start, end) of every operon finder groups the
+    genes of readsList into."""
+    geneBank = GeneBank()
+    for j in xrange(len(genes)):
+        geneBank.add(Sequence(readsList, genes[j][:2], 'gene' + str(j),
+                              genes[j][2]))
+    return [[gene.getPosition() for gene in operon]
+            for operon in finder(geneBank, readsList)]
+
+
+def checkOperonFinder(seed, directory):
+    """batchOperonFinder on a Coverage and on a RunLengthCoverage against
+    operonFinder on a list of the same reads."""
+    reads, genes = plateauCoverage(PLATEAUGENES,
+                                   numpy.random.RandomState(seed))
+    expected = operonRecords(genes, list(reads), operonFinder)
+    problems = []
+    for label, readsList in [("Coverage", Coverage(reads)),
+                             ("RunLengthCoverage",
+                              RunLengthCoverage(reads))]:
+        problems += compare(label, expected,
+                            operonRecords(genes, readsList,
+                                          batchOperonFinder))
+    return problems
+
+
+def checkOperonJudges(seed, directory):
+    """operonJudges on a CoverageMatrix of MATRIXSAMPLES samples against
+    operonJudge on a list of the reads of each sample."""
+    rng = numpy.random.RandomState(seed)
+    reads, genes = plateauCoverage(PLATEAUGENES, rng)
+    samples = [reads]
+    for k in xrange(1, MATRIXSAMPLES):
+        scales = numpy.ones(len(reads))
+        for j in xrange(len(genes)):
+            scales[genes[j][0]:] = 2.0 ** rng.randint(-2, 3)
+        samples.append(reads * scales)
+    matrix = CoverageMatrix(samples)
+    pairs = [(Sequence(None, genes[j][:2], 'gene1', genes[j][2]),
+              Sequence(None, genes[j + 1][:2], 'gene2', genes[j + 1][2]))
+             for j in xrange(len(genes) - 1)]
+    found = [operonJudges(seq1, seq2, matrix) for seq1, seq2 in pairs]
+    problems = []
+    for k in xrange(len(matrix)):
+        readsList = list(samples[k])
+        problems += compare("sample %d" % k,
+                            [operonJudge(seq1.bind(readsList),
+                                         seq2.bind(readsList), readsList)
+                             for seq1, seq2 in pairs],
+                            [bool(judges[k]) for judges in found])
+    return problems
+
+
+def probeOperons(rng):
+    """Returns an OperonBank of PROBEOPERONS operons, each 100 bases long
+    and covered at one read of PROBEREADS, with 0 to 299 probes. The
+    half-lives of an operon are drawn from PROBEHLS, or are random
+    (rounded to 3 decimals as in the probe tables) with a few poor
+    probes."""
+    reads = Coverage(numpy.repeat(rng.choice(PROBEREADS, PROBEOPERONS),
+                                  100).astype(numpy.float64))
+    operonBank = OperonBank()
+    for j in xrange(PROBEOPERONS):
+        operon = Operon("operon_" + str(j + 1))
+        operon.setLeftBound(100 * j)
+        operon.setRightBound(100 * j + 100)
+        operon.setReads(reads)
+        count = rng.randint(0, 300 if rng.rand() < 0.2 else 20)
+        if rng.rand() < 0.5:
+            halfLives = rng.choice(PROBEHLS, count)
+        else:
+            halfLives = numpy.round(rng.lognormal(1, 1, count), 3)
+            halfLives[rng.rand(count) < 0.05] = -1
+        operon.addProbeHalfLife([(100 * j, '+', float(halfLife))
+                                 for halfLife in halfLives])
+        operonBank.add(operon)
+    return operonBank
+
+
+def shiftRecords(operonBank):
+    """Returns the name, average read and reference, maximum and minimum
+    log2 half-life of every operon flagged by the original sliding-window
+    search of HLShiftFinder."""
+    records = []
+    for operon in operonBank:
+        logHLs = [math.log(probe[2], 2) for probe in
+                  operon.getProbeHalfLife() if probe[2] > 0]
+        if len(logHLs) <= WORKWIDTH:
+            continue
+        ref = numpy.average(logHLs)
+        maxLogHL = minLogHL = ref
+        for start in xrange(len(logHLs) - WORKWIDTH):
+            work = numpy.average(logHLs[start:start + WORKWIDTH])
+            maxLogHL = max(maxLogHL, work)
+            minLogHL = min(minLogHL, work)
+        if maxLogHL >= ref + THRESHOLD or \
+           minLogHL <= ref - THRESHOLD and \
+           operon.getAverageRead() > MINAVERAGEREAD:
+            records.append((operon.getName(), float(operon.getAverageRead()),
+                            float(ref), float(maxLogHL), float(minLogHL)))
+    return records
+
+
+def checkProcessedOperons(seed, directory):
+    """HLShiftTable against the original per-operon sliding-window
+    search."""
+    operonBank = probeOperons(numpy.random.RandomState(seed))
+    table = HLShiftTable(operonBank)
+    return compare("HLShiftTable", shiftRecords(operonBank),
+                   [(operonBank[j].getName(), float(table['averageRead'][j]),
+                     float(table['refLogHL'][j]), float(table['maxLogHL'][j]),
+                     float(table['minLogHL'][j]))
+                    for j in numpy.flatnonzero(table['processed'])])
+
+
+def dataDirectory(directory, seed):
+    """Returns the directory of the synthetic data set of seed, writing it
+    on first use."""
+    dataName = os.path.join(directory, "data")
+    if not os.path.exists(dataName):
+        writeDataSet(dataName, DATALENGTH, 4, seed)
+    return dataName
+
+
+def runWorkflow(directory, workers = 1, incremental = False):
+    """Runs the five stages of the workflow in directory, in a child
+    process, with the given number of workers and, if incremental is
+    True, in incremental mode (see incremental.py)."""
+    environment = dict(os.environ)
+    environment.pop(INCREMENTALVARIABLE, None)
+    if incremental:
+        environment[INCREMENTALVARIABLE] = "1"
+    subprocess.check_call([sys.executable, SCRIPT, "all",
+                           "--workers", str(workers)],
+                          cwd = directory, env = environment)
+
+
+def workflowDirectory(directory, seed, name, workers = 1):
+    """Returns the directory of a workflow run on the data set of seed,
+    running it on first use."""
+    runName = os.path.join(directory, name)
+    if not os.path.exists(runName):
+        shutil.copytree(dataDirectory(directory, seed), runName)
+        runWorkflow(runName, workers)
+    return runName
+
+
+def bankRecords(bank):
+    """Returns the pickled states of the genes, or of the operons and
+    their genes, of a bank, for comparison."""
+    records = []
+    for item in bank:
+        state = item.__getstate__()
+        if '_sequences' in state:
+            state['_sequences'] = [gene.__getstate__()
+                                   for gene in state['_sequences']]
+        records.append(state)
+    return records
+
+
+def checkBankFormat(seed, directory):
+    """The banks of a workflow run saved as legacy pickles against their
+    .npz files."""
+    runName = workflowDirectory(directory, seed, "serial")
+    legacyDirectory = os.path.join(directory, "legacy")
+    if not os.path.exists(legacyDirectory):
+        os.makedirs(legacyDirectory)
+    problems = []
+    for fileName in sorted(glob.glob(os.path.join(runName, "*Bank*.npz"))):
+        baseName = os.path.splitext(os.path.basename(fileName))[0]
+        bankClass = GeneBank if baseName.startswith("geneBank") \
+                    else OperonBank
+        bank = bankClass(fileName)
+        legacyName = os.path.join(legacyDirectory, baseName + ".txt")
+        bank.save(legacyName)
+        problems += compare(baseName, bankRecords(bank),
+                            bankRecords(bankClass(legacyName)))
+        convertedName = os.path.join(legacyDirectory, baseName + ".npz")
+        convertBank(legacyName, convertedName)
+        if not filecmp.cmp(fileName, convertedName, shallow = False):
+            problems.append(baseName + ": converted .npz differs")
+    return problems
+
+
+def compareOutputs(label, directory1, directory2, inputs):
+    """Returns the descriptions of the output files (the files that are
+    not inputs) of two workflow runs that differ or exist in one run
+    only."""
+    names1 = set(os.listdir(directory1)) - set(inputs)
+    names2 = set(os.listdir(directory2)) - set(inputs)
+    problems = ["%s: %s is missing" % (label, name)
+                for name in sorted(names1 ^ names2)]
+    for name in sorted(names1 & names2):
+        if not filecmp.cmp(os.path.join(directory1, name),
+                           os.path.join(directory2, name), shallow = False):
+            problems.append("%s: %s differs" % (label, name))
+    return problems
+
+
+def checkParallel(seed, directory):
+    """A workflow run with PARALLELWORKERS workers against a serial run."""
+    serialName = workflowDirectory(directory, seed, "serial")
+    parallelName = workflowDirectory(directory, seed, "parallel",
+                                     PARALLELWORKERS)
+    return compareOutputs("parallel", serialName, parallelName,
+                          os.listdir(dataDirectory(directory, seed)))
+
+
+def editDataSet(directory):
+    """Edits the data set in directory: removes a gene of the annotation,
+    moves another one and adds a new one after the last, triples the
+    reads of a range of wt1 and clears a range of rny2."""
+    fileName = os.path.join(directory, "Spy49_allGenes.csv")
+    with open(fileName, 'r') as fileObj:
+        genes = list(csv.reader(fileObj))
+    moved = genes[len(genes) // 2]
+    genes[len(genes) // 2] = [moved[0], str(int(moved[1]) + 30)] + moved[2:]
+    end = int(genes[-1][2])
+    genes.append(["SPy_new", str(end + 40), str(end + 400), genes[-1][3]])
+    del genes[len(genes) // 4]
+    with open(fileName, 'w') as fileObj:
+        csv.writer(fileObj).writerows(genes)
+
+    for name, start, length, scale in [("wt1", 3, 500, 3),
+                                       ("rny2", 6, 100, 0)]:
+        covName = os.path.join(directory, name + ".cov")
+        reads = numpy.array(loadCoverage(covName))
+        start = len(reads) * start // 8
+        reads[start:start + length] *= scale
+        saveCoverage(reads, covName, name)
+
+
+def checkIncremental(seed, directory):
+    """An incremental workflow run on an edited data set against a full
+    run on it."""
+    dataName = dataDirectory(directory, seed)
+    incrementalName = os.path.join(directory, "incremental")
+    if not os.path.exists(incrementalName):
+        shutil.copytree(dataName, incrementalName)
+        runWorkflow(incrementalName, incremental = True)
+        editDataSet(incrementalName)
+        runWorkflow(incrementalName, incremental = True)
+    editedName = os.path.join(directory, "edited")
+    if not os.path.exists(editedName):
+        shutil.copytree(dataName, editedName)
+        editDataSet(editedName)
+        runWorkflow(editedName)
+    # Only an incremental run saves the digests of its reads.
+    states = [name for name in os.listdir(incrementalName)
+              if name.endswith(STATEEXT)]
+    return compareOutputs("incremental", editedName, incrementalName,
+                          os.listdir(dataName) + states)
+
+
+CHECKS = [("boundFinder",       checkBoundFinder),
+          ("matrixBoundFinder", checkMatrixBoundFinder),
+          ("operonFinder",      checkOperonFinder),
+          ("operonJudges",      checkOperonJudges),
+          ("processedOperons",  checkProcessedOperons),
+          ("bankFormat",        checkBankFormat),
+          ("parallel",          checkParallel),
+          ("incremental",       checkIncremental)]
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = "Checks the fast paths against the paths they "
+                      "replace.")
+    parser.add_argument("--seed", type = int, default = 7,
+                        help = "random seed (default 7)")
+    parser.add_argument("--directory",
+                        help = "directory of the workflow runs (default: "
+                               "a temporary directory, removed afterwards)")
+    parser.add_argument("--checks", default = ','.join(
+        name for name, function in CHECKS),
+        help = "comma-separated checks to run")
+    args = parser.parse_args(argv)
+
+    directory = args.directory or tempfile.mkdtemp(prefix = "equivalence")
+    failed = False
+    try:
+        for name, function in CHECKS:
+            if name not in args.checks.split(','):
+                continue
+            problems = function(args.seed, directory)
+            if problems:
+                failed = True
+                print name + ": FAILED (%d)" % len(problems)
+                for problem in problems[:SHOWN]:
+                    print "    " + problem
+            else:
+                print name + ": OK"
+    finally:
+        if args.directory == None:
+            shutil.rmtree(directory)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+File: export.py
+
+Writes the text outputs of the workflow in bulk: operon BED files,
+processed-operon CSV files and UTR tables.
+
+The rows of a file are built from whole columns of the bank (or of a
+HLShiftTable) and written in blocks of BLOCKROWS lines, instead of one
+concatenated string and one write per row. A file name ending in '.gz',
+or compress = True, writes gzip-compressed output; compressed files carry
+no timestamp, so the same rows always give the same bytes.
+
+Progress and per-operon messages go through the logging module; each
+module logs to logging.getLogger(<module name>). The entry points of the
+scripts send the messages to stderr (see configureLogging). They are off
+by default; the RNA_LOG environment variable sets the level (e.g.
+RNA_LOG=info or RNA_LOG=debug).
+
+"""
+import os
+import gzip
+import logging
+import numpy
+from contigs import BEDSUFFIX
+
+LOGVARIABLE = "RNA_LOG"
+BLOCKROWS   = 65536
+BEDSCORE    = 44
+
+
+def configureLogging(level = None):
+    """Sends the log messages of all loggers to stderr, at the level of
+    the RNA_LOG environment variable (default: warning). Called by the
+    entry points of the scripts only, so importing a module leaves the
+    logging of the caller alone. A level (e.g. 'info') overrides
+    RNA_LOG; without one, a second call changes nothing."""
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(handler)
+        if level == None:
+            level = os.environ.get(LOGVARIABLE, 'warning')
+    if level != None:
+        root.setLevel(getattr(logging, level.upper(), logging.WARNING))
+
+
+def openOutput(fileName, compress = False):
+    """Opens an output file for writing, gzip-compressed if fileName ends
+    in '.gz' or compress is True ('.gz' is then appended to fileName).
+    Returns (file object, file name)."""
+    if compress and not fileName.endswith('.gz'):
+        fileName += '.gz'
+    if fileName.endswith('.gz'):
+        return gzip.GzipFile(fileName, 'wb', 9, None, 0), fileName
+    return open(fileName, 'w'), fileName
+
+
+def writeLines(lines, fileName, compress = False):
+    """Writes an iterable of lines (without line ends) to a file in blocks
+    of BLOCKROWS lines. Returns the name of the file written."""
+    fileObj, fileName = openOutput(fileName, compress)
+    try:
+        block = []
+        for line in lines:
+            block.append(line)
+            if len(block) == BLOCKROWS:
+                fileObj.write('\n'.join(block) + '\n')
+                block = []
+        if block:
+            fileObj.write('\n'.join(block) + '\n')
+    finally:
+        fileObj.close()
+    return fileName
+
+
+def writeRows(columns, fileName, delimiter = ',', compress = False):
+    """Writes the rows formed by parallel columns (lists or arrays) as
+    delimited text, each value formatted with str. Returns the name of
+    the file written."""
+    columns = [map(str, column) for column in columns]
+    return writeLines(map(delimiter.join, zip(*columns)), fileName,
+                      compress)
+
+
+def writeTable(header, columns, fileName, delimiter = ',',
+               compress = False):
+    """Writes a header line of column names followed by the rows formed by
+    parallel columns, as writeRows does. Returns the name of the file
+    written."""
+    columns = [map(str, column) for column in columns]
+    return writeLines([delimiter.join(header)] +
+                      map(delimiter.join, zip(*columns)), fileName,
+                      compress)
+
+
+def operonColumns(operonBank):
+    """Returns the names, left bounds, right bounds, orientations and contig
+    ids of the operons of a bank as parallel lists."""
+    operons = list(operonBank)
+    return ([operon.getName() for operon in operons],
+            [operon.getLeftBound() for operon in operons],
+            [operon.getRightBound() for operon in operons],
+            [operon.getOrientation() for operon in operons],
+            [operon.getContig() for operon in operons])
+
+
+def writeBed(operonBank, fileName, contig = None, score = BEDSCORE,
+             compress = False):
+    """Writes the bounds of the operons of a bank as a BED file with the
+    columns contig, left bound, right bound, name, score and strand. The
+    contig column is the contig id of each operon followed by '|' (e.g.
+    'Spy|'), or contig if it is given. Returns the name of the file
+    written."""
+    names, lefts, rights, orientations, contigs = operonColumns(operonBank)
+    if contig == None:
+        contigs = [name + BEDSUFFIX for name in contigs]
+    else:
+        contigs = [contig] * len(names)
+    return writeRows([contigs, lefts, rights, names,
+                      [score] * len(names), orientations], fileName, '\t',
+                     compress)
+
+
+def writeProcessedOperons(operonBank, table, fileName, compress = False):
+    """Writes the processed operons of a HLShiftTable (see halfLifeShift.py)
+    as CSV rows: operon, first gene, last gene, average read, reference,
+    maximum and minimum average log2 half-life. Returns the name of the
+    file written."""
+    rows = numpy.flatnonzero(table['processed'])
+    operons = [operonBank[j] for j in rows]
+    return writeRows([[operon.getName() for operon in operons],
+                      [operon[0].getName() for operon in operons],
+                      [operon[-1].getName() for operon in operons],
+                      table['averageRead'][rows], table['refLogHL'][rows],
+                      table['maxLogHL'][rows], table['minLogHL'][rows]],
+                     fileName, ',', compress)
+
+
+def operonUTRs(operonBank):
+    """Returns arrays of the 5' and 3' UTR lengths of the operons of a
+    bank: the distances from the operon bounds to the first and last
+    gene, in the direction of transcription."""
+    operons = list(operonBank)
+    lefts = numpy.array([operon.getLeftBound() for operon in operons],
+                        dtype = numpy.int64)
+    rights = numpy.array([operon.getRightBound() for operon in operons],
+                         dtype = numpy.int64)
+    firstStarts = numpy.array([operon[0].getStart() for operon in operons],
+                              dtype = numpy.int64)
+    lastEnds = numpy.array([operon[-1].getEnd() for operon in operons],
+                           dtype = numpy.int64)
+    forward = numpy.array([operon.getOrientation() == '+'
+                           for operon in operons], dtype = bool)
+    UTR5 = numpy.where(forward, numpy.abs(lefts - firstStarts),
+                       numpy.abs(rights - lastEnds))
+    UTR3 = numpy.where(forward, numpy.abs(rights - lastEnds),
+                       numpy.abs(lefts - firstStarts))
+    return UTR5, UTR3
+
+
+def writeUTRTable(operonBank, rows, fileName, compress = False):
+    """Writes the UTR lengths of the operons of a bank at the given indexes
+    as CSV rows: operon, first gene, last gene, 5' UTR, 3' UTR. Returns the
+    name of the file written."""
+    UTR5, UTR3 = operonUTRs(operonBank)
+    rows = numpy.asarray(rows, dtype = numpy.int64)
+    operons = [operonBank[j] for j in rows]
+    return writeRows([[operon.getName() for operon in operons],
+                      [operon[0].getName() for operon in operons],
+                      [operon[-1].getName() for operon in operons],
+                      UTR5[rows], UTR3[rows]], fileName, ',', compress)
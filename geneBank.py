@@ -3,11 +3,20 @@ File: geneBank.py
 Define GeneBank class that groups all genes on the chromosome
 
 Use a regular list and Sequence to accomplish the task.
+A GeneBank may hold the genes of several contigs (see contigs.py);
+getContigBank returns those of one contig.
+A name index and a start-coordinate index are kept up to date on add(),
+so lookups by name, neighbours and position queries do not scan the list.
 """
 import csv
 import math
+import bisect
+import os
 import cPickle
+import profiling
 from sequence import Sequence
+from bankFormat import isColumnar, loadGeneBank, saveGeneBank
+from contigs import contigReads, contigOrder
 from exceptions import StopIteration
 
 class GeneBank(object):
@@ -16,11 +25,18 @@ class GeneBank(object):
     def __init__(self, fileName = None):
         """Creates a new dictionary to hold sequences. If
         a filename is provided, loads the accounts from a file
-        of pickled sequences. """
+        of pickled sequences, or from a columnar bank (see bankFormat.py). """
         self._sequences = []
         self._fileName = fileName
         self._size = 0
-        if fileName != None:
+        self._nameIndex = {}
+        self._seqIndex = {}
+        self._startIndex = []
+        self._maxLength = 0
+        if fileName != None and isColumnar(fileName):
+            for seq in loadGeneBank(fileName):
+                self.add(seq)
+        elif fileName != None:
             fileObj = open(fileName, 'r')
             while True:
                 try:
@@ -29,6 +45,8 @@ class GeneBank(object):
                 except EOFError:
                     fileObj.close()
                     break
+        if fileName != None and profiling.ENABLED:
+            profiling.count('bankBytesRead', os.path.getsize(fileName))
 
         
     def __str__(self):
@@ -56,9 +74,16 @@ class GeneBank(object):
             i += 1
     
     def add(self, sequence):
-        """Insert a sequence at the end of the list."""
+        """Insert a sequence at the end of the list, and record it in the
+        name, sequence and start-coordinate indexes."""
+        index = self._size
         self._sequences.append(sequence)
         self._size += 1
+        self._nameIndex.setdefault(sequence.getName(), index)
+        self._seqIndex.setdefault(id(sequence), index)
+        bisect.insort(self._startIndex, (sequence.getStart(), index))
+        self._maxLength = max(self._maxLength,
+                              sequence.getEnd() - sequence.getStart())
 
     def __getitem__(self, index):
         """Takes the index. Returns the sequence at that index position."""
@@ -68,30 +93,21 @@ class GeneBank(object):
     
     def get(self, name):
         """Returns a sequence with the given name."""
-        for seq in self._sequences:
-            if seq.getName() == name:
-                return seq
-        return None
+        index = self.getIndex(name)
+        if index < 0:
+            return None
+        return self._sequences[index]
 
     def getIndex(self, name):
-        for i in xrange(self._size):
-            seq = self._sequences[i]
-            if seq.getName() == name:
-                return i
-        return -1                
+        """Returns the index of the first sequence with the given name,
+        or -1 if there is none."""
+        return self._nameIndex.get(name, -1)
 
     def getPrevious(self, sequence):
         """Precondition: The sequence exists.
         Returns its upstream sequence """
-        if not sequence in self._sequences:
-            return None
-        i = 0
-        while i < self._size:
-            seq = self._sequences[i]
-            if seq == sequence:
-                break
-            i += 1
-        if i == 0:
+        i = self._seqIndex.get(id(sequence), -1)
+        if i <= 0:
             return None
         else:
             return self._sequences[i-1]
@@ -99,32 +115,77 @@ class GeneBank(object):
     def getNext(self, sequence):
         """Precondition: The sequence exists.
         Returns its downstream sequence """
-        if not sequence in self._sequences:
-            return None
-        i = 0
-        while i < self._size:
-            seq = self._sequences[i]
-            if seq == sequence:
-                break
-            i += 1
-        if i == self._size-1:
+        i = self._seqIndex.get(id(sequence), -1)
+        if i < 0 or i == self._size-1:
             return None
         else:
             return self._sequences[i+1]
 
+    def getOverlapping(self, start, end):
+        """Returns a list of the sequences that overlap [start, end),
+        ordered by start site."""
+        if start >= end:
+            return []
+        low  = bisect.bisect_left(self._startIndex,
+                                  (start - self._maxLength + 1,))
+        high = bisect.bisect_left(self._startIndex, (end,))
+        overlapping = []
+        for i in xrange(low, high):
+            seq = self._sequences[self._startIndex[i][1]]
+            if seq.getEnd() > start:
+                overlapping.append(seq)
+        return overlapping
 
+    def getContaining(self, position):
+        """Returns a list of the sequences that contain the position,
+        ordered by start site."""
+        return self.getOverlapping(position, position + 1)
+
+
+
+    def bind(self, readsList):
+        """Returns a new GeneBank holding copies of all genes that take
+        their reads from readsList. This lets one annotation bank serve
+        every sample. readsList may be a contigs.SampleReads, from which
+        each gene takes the reads of its own contig."""
+        geneBank = GeneBank()
+        geneBank._fileName = self._fileName
+        for sequence in self._sequences:
+            geneBank.add(sequence.bind(contigReads(readsList,
+                                                   sequence.getContig())))
+        return geneBank
+
+    def getContigs(self):
+        """Returns the contig ids of the genes, in order of appearance."""
+        return contigOrder(self._sequences)
+
+    def getContigBank(self, contig):
+        """Returns a new GeneBank holding the genes of one contig, in
+        order. The genes are shared, not copied."""
+        geneBank = GeneBank()
+        for sequence in self._sequences:
+            if sequence.getContig() == contig:
+                geneBank.add(sequence)
+        return geneBank
 
     def save(self, fileName = None):
         """Saves pickled sequences to a file. The parameter
-        allows the user to change filenames."""
+        allows the user to change filenames. A fileName ending in '.npz'
+        is saved in the columnar format of bankFormat.py instead."""
         if fileName != None:
             self._fileName = fileName
         elif self._fileName == None:
             return
-        fileObj = open(self._fileName, 'w')
-        for sequence in self._sequences:
-            cPickle.dump(sequence, fileObj)
-        fileObj.close()
+        if self._fileName.endswith('.npz'):
+            saveGeneBank(self._sequences, self._fileName)
+        else:
+            fileObj = open(self._fileName, 'w')
+            for sequence in self._sequences:
+                cPickle.dump(sequence, fileObj)
+            fileObj.close()
+        if profiling.ENABLED:
+            profiling.count('bankBytesWritten',
+                            os.path.getsize(self._fileName))
         
 
 ##def main():
@@ -1,33 +1,48 @@
 """
 File: geneBankConstruct.py
-Generates four GeneBank objects representing genes in wt1, wt2, rny1, and rny2.
-Save each object using cPickle."""
+Generates one GeneBank object holding the annotated genes. The bank is
+sample-agnostic: later stages bind it to the reads of wt1, wt2, rny1,
+and rny2. Save the object in the columnar format of bankFormat.py.
+A fifth column of Spy49_allGenes.csv, if present, names the contig of the
+gene (see contigs.py)."""
 
 import csv
 import math
 import cPickle
 from sequence import Sequence
 from geneBank import GeneBank
+from contigs import DEFAULTCONTIG
 
-fileList = ["wt1.csv", "wt2.csv", "rny1.csv", "rny2.csv"]
-for fileName in fileList:
-    geneFile = open('Spy49_allGenes.csv', 'rU')
+geneFileName = "Spy49_allGenes.csv"
+geneBankFile = "geneBank.npz"
+
+
+def geneBankConstruct(fileName = geneFileName, bankName = geneBankFile):
+    """Reads the annotation CSV file (name, start, end, strand and an
+    optional contig per row) into a GeneBank, saves it to bankName and
+    returns it. bankName None only returns it."""
+    geneFile = open(fileName, 'rU')
     genes = csv.reader(geneFile)
 
-    with open(fileName, 'rU') as readsFile:
-        reads = csv.reader(readsFile, delimiter='\t')
-        readsList = []
-        for row in reads:
-            readsList.append(float(row[2]))
-            
     geneBank = GeneBank()
     for row in genes:
         name = row[0]
         start = int(row[1])
         end = int(row[2])
         orientation = row[3]
-        seq = Sequence(readsList, (start, end), name, orientation) 
+        contig = row[4] if len(row) > 4 else DEFAULTCONTIG
+        seq = Sequence(None, (start, end), name, orientation, contig)
         geneBank.add(seq)
-    geneBankName = "geneBank_" + fileName[0:-4] + ".txt"
-    geneBank.save(geneBankName)
     geneFile.close()
+    if bankName != None:
+        geneBank.save(bankName)
+    return geneBank
+
+
+def main():
+    """Constructs geneBank.npz from Spy49_allGenes.csv."""
+    geneBankConstruct()
+
+
+if __name__ == "__main__":
+    main()
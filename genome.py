@@ -0,0 +1,206 @@
+"""
+File: genome.py
+
+Define a Genome class that serves base sequences (SpyGenome.txt) on
+demand.
+
+A Genome reads its file on first use, not at import. It can keep the
+bases 2-bit packed (four bases per byte) and decodes only the slices
+that are asked for. A packed genome file is memory-mapped, so several
+genomes can be held by one process cheaply.
+
+"""
+import os
+import bisect
+import string
+import numpy
+
+GENOMEMAGIC   = "RNAGEN"
+GENOMEVERSION = 1
+HEADERSIZE    = 256
+GENOMEEXT     = ".seq2"
+
+BASES      = "ACGT"
+COMPLEMENT = string.maketrans("ACGTacgtNn", "TGCAtgcaNn")
+
+_genomes = {}
+
+
+def getGenome(fileName):
+    """Returns the shared Genome of a genome file. The file is read on
+    the first request of a base, not by this call."""
+    if fileName not in _genomes:
+        _genomes[fileName] = Genome(fileName)
+    return _genomes[fileName]
+
+
+def packedFileName(fileName):
+    """Returns the packed genome file name that belongs to a text genome
+    file, e.g. 'SpyGenome.txt' -> 'SpyGenome.seq2'."""
+    return os.path.splitext(fileName)[0] + GENOMEEXT
+
+
+def readGenomeText(fileName):
+    """Returns the bases of a text genome file as one string."""
+    with open(fileName, 'r') as myfile:
+        return myfile.read().replace('\n', '')
+
+
+def packBases(bases):
+    """Packs a base string four bases per byte, first base in the high
+    bits. Returns (packed uint8 array, exception positions, exception
+    characters) where the exceptions are the characters other than A, C,
+    G and T, which are packed as A."""
+    chars = numpy.frombuffer(bases, dtype = numpy.uint8)
+    codes = numpy.zeros(((len(chars) + 3) // 4) * 4, dtype = numpy.uint8)
+    known = numpy.zeros(len(chars), dtype = bool)
+    for code in xrange(4):
+        isBase = chars == ord(BASES[code])
+        codes[:len(chars)][isBase] = code
+        known |= isBase
+    codes = codes.reshape(-1, 4)
+    packed = (codes[:, 0] << 6) | (codes[:, 1] << 4) | \
+             (codes[:, 2] << 2) | codes[:, 3]
+    positions = numpy.flatnonzero(~known)
+    return packed.astype(numpy.uint8), positions, chars[positions]
+
+
+def packGenome(fileName, packedName = None):
+    """Converts a text genome file to a packed genome file.
+    Returns the name of the packed genome file."""
+    if packedName == None:
+        packedName = packedFileName(fileName)
+    bases = readGenomeText(fileName)
+    packed, positions, chars = packBases(bases)
+    header = '\t'.join([GENOMEMAGIC, str(GENOMEVERSION), str(len(bases)),
+                        str(len(positions))]) + '\n'
+    fileObj = open(packedName, 'wb')
+    fileObj.write(header.ljust(HEADERSIZE))
+    packed.tofile(fileObj)
+    positions.astype(numpy.int64).tofile(fileObj)
+    chars.tofile(fileObj)
+    fileObj.close()
+    return packedName
+
+
+class Genome(object):
+    """Serves the bases of one genome. Slicing a Genome returns a string,
+    so a Genome can stand in for the genome string."""
+
+    def __init__(self, fileName, packed = False):
+        """fileName: a text genome file or a packed genome file. For a
+                text file, its packed file is memory-mapped instead if it
+                exists and is not older than the text file.
+        packed: Optional, keep the bases of a text file 2-bit packed in
+                memory instead of as a string."""
+        self._fileName = fileName
+        self._packed   = packed
+        self._loaded   = False
+        self._length   = 0
+        self._bases    = None
+        self._codes    = None
+        self._exceptionPositions = []
+        self._exceptionChars     = ''
+
+    def _load(self):
+        """Reads the genome file on first use."""
+        if self._loaded:
+            return
+        packedName = self._fileName
+        if not packedName.endswith(GENOMEEXT):
+            packedName = packedFileName(self._fileName)
+            if not os.path.exists(packedName) or \
+               (os.path.exists(self._fileName) and
+                os.path.getmtime(packedName) <
+                os.path.getmtime(self._fileName)):
+                packedName = None
+        if packedName != None:
+            self._mapPacked(packedName)
+        else:
+            bases = readGenomeText(self._fileName)
+            self._length = len(bases)
+            if self._packed:
+                self._codes, positions, chars = packBases(bases)
+                self._exceptionPositions = positions.tolist()
+                self._exceptionChars = chars.tostring()
+            else:
+                self._bases = bases
+        self._loaded = True
+
+    def _mapPacked(self, packedName):
+        """Memory-maps a packed genome file."""
+        with open(packedName, 'rb') as fileObj:
+            fields = fileObj.read(HEADERSIZE).rstrip().split('\t')
+        if len(fields) != 4 or fields[0] != GENOMEMAGIC:
+            raise ValueError, packedName + " is not a packed genome file."
+        if int(fields[1]) != GENOMEVERSION:
+            raise ValueError, "Unsupported genome file version: " + fields[1]
+        self._length = int(fields[2])
+        exceptions = int(fields[3])
+        packedSize = (self._length + 3) // 4
+        if packedSize == 0:
+            self._codes = numpy.zeros(0, dtype = numpy.uint8)
+            return
+        fileMap = numpy.memmap(packedName, dtype = numpy.uint8, mode = 'r',
+                               offset = HEADERSIZE)
+        self._codes = fileMap[:packedSize]
+        tail = numpy.asarray(fileMap[packedSize:])
+        self._exceptionPositions = numpy.frombuffer(
+            tail[:8 * exceptions].tostring(), dtype = numpy.int64).tolist()
+        self._exceptionChars = tail[8 * exceptions:9 * exceptions].tostring()
+
+    def __len__(self):
+        """Returns the number of bases."""
+        self._load()
+        return self._length
+
+    def __getitem__(self, index):
+        """Returns the base at index, or the base string of a slice."""
+        self._load()
+        if isinstance(index, slice):
+            start, end, step = index.indices(self._length)
+            if step != 1:
+                return self.getBases(0, self._length)[index]
+            return self.getBases(start, end)
+        if index < 0:
+            index += self._length
+        if index < 0 or index >= self._length:
+            raise IndexError, "Genome index out of range."
+        return self.getBases(index, index + 1)
+
+    def __str__(self):
+        """Returns all bases."""
+        return self[:]
+
+    def getName(self):
+        """Returns the name of the genome file."""
+        return self._fileName
+
+    def getBases(self, start, end):
+        """Returns the bases in [start, end), 0 <= start <= end <= len."""
+        self._load()
+        end = max(start, end)
+        if self._bases != None:
+            return self._bases[start:end]
+        first = start // 4
+        last = (end + 3) // 4
+        codes = numpy.asarray(self._codes[first:last])
+        unpacked = numpy.empty((len(codes), 4), dtype = numpy.uint8)
+        unpacked[:, 0] = codes >> 6
+        unpacked[:, 1] = (codes >> 4) & 3
+        unpacked[:, 2] = (codes >> 2) & 3
+        unpacked[:, 3] = codes & 3
+        offset = start - first * 4
+        chars = numpy.frombuffer(BASES, dtype = numpy.uint8)[
+            unpacked.ravel()[offset:offset + end - start]]
+        low = bisect.bisect_left(self._exceptionPositions, start)
+        high = bisect.bisect_left(self._exceptionPositions, end)
+        for i in xrange(low, high):
+            chars[self._exceptionPositions[i] - start] = \
+                ord(self._exceptionChars[i])
+        return chars.tostring()
+
+    def getReverseComplement(self, start, end):
+        """Returns the reverse complement of the bases in [start, end)."""
+        start, end, step = slice(start, end).indices(len(self))
+        return self.getBases(start, end).translate(COMPLEMENT)[::-1]
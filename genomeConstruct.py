@@ -0,0 +1,32 @@
+"""
+File: genomeConstruct.py
+Packs SpyGenome.txt, or the genome of every contig (see contigs.py), into
+a 2-bit packed genome file that Sequence and Operon memory-map instead of
+reading the text genome."""
+
+import logging
+from genome import packGenome
+from contigs import getContigs
+from export import configureLogging
+
+log = logging.getLogger("genomeConstruct")
+
+
+def genomeConstruct():
+    """Packs the genome of every contig. Returns the names of the packed
+    genome files."""
+    packedNames = []
+    for contig in getContigs():
+        packedName = packGenome(contig.getGenome().getName())
+        log.info("%s is generated.", packedName)
+        packedNames.append(packedName)
+    return packedNames
+
+
+def main():
+    configureLogging()
+    genomeConstruct()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+File: halfLifeShift.py
+
+Detects probe-level half-life shifts within the operons of an OperonBank
+in one pass over all probes.
+
+The log half-lives of the probes of all operons are flattened into one
+array with per-operon offsets. Sliding-window means are computed for the
+whole array at once, and the reference, maximum and minimum window means
+of every operon come from segmented reductions. The probes of an operon
+are summed in the order numpy.average sums them (see pairwiseSums), so
+every reference equals the original per-operon average bit for bit.
+
+"""
+import numpy
+
+WORKWIDTH      = 3
+THRESHOLD      = 1.0
+MINAVERAGEREAD = 500
+PAIRWISEBLOCK  = 128
+
+
+def _segments(owners):
+    """Returns the start of every run of equal values in a sorted array."""
+    if len(owners) == 0:
+        return numpy.zeros(0, dtype = numpy.int64)
+    return numpy.flatnonzero(numpy.concatenate(([True],
+                                                owners[1:] != owners[:-1])))
+
+
+def pairwiseSums(values, starts, counts):
+    """Returns the sums of the segments values[start:start + count] of an
+    array of float64 values, each added in the order numpy.add.reduce
+    adds it: one by one below eight values, with eight interleaved
+    partial sums up to PAIRWISEBLOCK values, and as the sums of two
+    halves above. Each sum equals values[start:start + count].sum() bit
+    for bit."""
+    sums = numpy.zeros(len(starts))
+    large = counts > PAIRWISEBLOCK
+    if large.any():
+        halves = counts[large] // 2
+        halves -= halves % 8
+        sums[large] = pairwiseSums(values, starts[large], halves) + \
+                      pairwiseSums(values, starts[large] + halves,
+                                   counts[large] - halves)
+    short = counts < 8
+    for k in xrange(7):
+        rows = short & (counts > k)
+        sums[rows] += values[starts[rows] + k]
+    blocks = ~large & ~short
+    if blocks.any():
+        starts = starts[blocks]
+        counts = counts[blocks]
+        lanes = numpy.arange(8)
+        partials = values[starts[:, None] + lanes]
+        for block in xrange(1, PAIRWISEBLOCK // 8):
+            rows = counts // 8 > block
+            if not rows.any():
+                break
+            partials[rows] += values[starts[rows, None] + 8 * block + lanes]
+        totals = ((partials[:, 0] + partials[:, 1]) +
+                  (partials[:, 2] + partials[:, 3])) + \
+                 ((partials[:, 4] + partials[:, 5]) +
+                  (partials[:, 6] + partials[:, 7]))
+        rests = starts + counts - counts % 8
+        for k in xrange(7):
+            rows = counts % 8 > k
+            totals[rows] += values[rests[rows] + k]
+        sums[blocks] = totals
+    return sums
+
+
+def probeStatistics(operonBank):
+    """Returns the statistics of the probes of every operon of an
+    OperonBank that do not depend on the thresholds of HLShiftTable, as
+    a dict: 'logHLs', the log2 half-lives of the probes with a positive
+    half-life, operon by operon, 'owners', the operon of each of them,
+    and the per-operon arrays 'probes', 'refLogHL' and 'averageRead' (see
+    HLShiftTable)."""
+    operons = list(operonBank)
+    probeLists = [operon.getProbeHalfLife() for operon in operons]
+    halfLives = numpy.array([probe[2] for probes in probeLists
+                             for probe in probes], dtype = numpy.float64)
+    owners = numpy.repeat(numpy.arange(len(operons)),
+                          [len(probes) for probes in probeLists])
+    positive = halfLives > 0
+    logHLs = numpy.log(halfLives[positive]) / numpy.log(2)
+    owners = owners[positive]
+
+    counts = numpy.bincount(owners, minlength = len(operons))
+    refs = numpy.zeros(len(operons))
+    hasProbes = counts > 0
+    refs[hasProbes] = pairwiseSums(logHLs,
+                                   (numpy.cumsum(counts) - counts)[hasProbes],
+                                   counts[hasProbes]) / counts[hasProbes]
+
+    averageReads = numpy.array([operon.getAverageRead()
+                                for operon in operons], dtype = numpy.float64)
+    return {'logHLs':      logHLs,
+            'owners':      owners,
+            'probes':      counts,
+            'refLogHL':    refs,
+            'averageRead': averageReads}
+
+
+def windowExtremes(statistics, workWidth = WORKWIDTH):
+    """Returns the (maxLogHL, minLogHL) arrays of HLShiftTable for the
+    probeStatistics of an OperonBank: the largest and smallest average of
+    workWidth consecutive log half-lives of every operon, bounded by its
+    refLogHL."""
+    logHLs = statistics['logHLs']
+    owners = statistics['owners']
+    refs = statistics['refLogHL']
+    ends = numpy.cumsum(statistics['probes'])
+    maxs = refs.copy()
+    mins = refs.copy()
+    windows = len(logHLs) - workWidth + 1
+    if windows > 0:
+        sums = logHLs[0:windows]
+        for k in xrange(1, workWidth):
+            sums = sums + logHLs[k:windows + k]
+        means = sums / workWidth
+        starts = numpy.arange(windows)
+        valid = starts + workWidth < ends[owners[:windows]]
+        means = means[valid]
+        windowOwners = owners[:windows][valid]
+        segments = _segments(windowOwners)
+        if len(segments) > 0:
+            segmentOwners = windowOwners[segments]
+            maxs[segmentOwners] = numpy.maximum(
+                refs[segmentOwners], numpy.maximum.reduceat(means, segments))
+            mins[segmentOwners] = numpy.minimum(
+                refs[segmentOwners], numpy.minimum.reduceat(means, segments))
+    return maxs, mins
+
+
+def isProcessed(statistics, maxs, mins, workWidth = WORKWIDTH,
+                threshold = THRESHOLD, minAverageRead = MINAVERAGEREAD):
+    """Returns the 'processed' array of HLShiftTable from the
+    probeStatistics of an OperonBank and its windowExtremes."""
+    refs = statistics['refLogHL']
+    return (statistics['probes'] > workWidth) & \
+           ((maxs >= refs + threshold) |
+            ((mins <= refs - threshold) &
+             (statistics['averageRead'] > minAverageRead)))
+
+
+def HLShiftTable(operonBank, workWidth = WORKWIDTH, threshold = THRESHOLD,
+                 minAverageRead = MINAVERAGEREAD):
+    """Returns a per-operon table (a dict of arrays, one entry per operon)
+    of the half-life shift statistics used by HLShiftFinder:
+    'probes':      the number of probes with a positive half-life,
+    'refLogHL':    the average log2 half-life of those probes,
+    'maxLogHL':    the largest average of workWidth consecutive log
+                   half-lives, or refLogHL if it is larger,
+    'minLogHL':    the smallest such average, or refLogHL if it is smaller,
+    'averageRead': the average read of the operon,
+    'processed':   True for an operon with a half-life shift.
+    As in the original sliding-window search, only operons with more than
+    workWidth probes are flagged, the last window of an operon is not
+    considered, and an operon is flagged if its maximum window reaches
+    refLogHL + threshold, or if its minimum window reaches refLogHL -
+    threshold and its average read is over minAverageRead. The table is
+    built in three steps (probeStatistics, windowExtremes and
+    isProcessed), so that other thresholds can be tried on the same
+    statistics (see parameterSweep.py)."""
+    statistics = probeStatistics(operonBank)
+    maxs, mins = windowExtremes(statistics, workWidth)
+    processed = isProcessed(statistics, maxs, mins, workWidth, threshold,
+                            minAverageRead)
+    return {'probes':      statistics['probes'],
+            'refLogHL':    statistics['refLogHL'],
+            'maxLogHL':    maxs,
+            'minLogHL':    mins,
+            'averageRead': statistics['averageRead'],
+            'processed':   processed}
@@ -0,0 +1,263 @@
+"""
+File: incremental.py
+
+Incremental re-analysis of operon boundaries.
+
+Every decision of operonBankConstruct and operonBankRefine depends on a
+pair of consecutive genes and on the reads around them: whether the two
+genes are in different operons (operonJudge) depends on the reads from
+the start of the first gene to the end of the second, and the bounds set
+at the junction of two operons (boundFinder) on the reads from the start
+of the last gene of the first operon to the end of the first gene of the
+second.
+
+Each stage saves, next to each OperonBank it writes, a state file with
+the settings of the run (its parameters and the MD5 digest of the source
+files of the stage, see runSettings) and, in incremental mode, MD5
+digests of its reads in blocks of BLOCKSIZE positions, per contig.
+When the RNA_INCREMENTAL environment variable is set, a stage compares
+the current reads with the digests of its previous run and the current
+annotation with the genes of its previous OperonBank. Decisions whose
+genes are unchanged (same name, coordinates and strand, and still
+consecutive) and whose reads lie outside the changed blocks are taken
+from the previous OperonBank; the others are recomputed. A previous run
+with other settings, or saved without digests, is not reused.
+
+"""
+import os
+import json
+import hashlib
+import bisect
+import numpy
+from coverage import Coverage
+from contigs  import contigReads
+from operonBank import OperonBank
+
+INCREMENTALVARIABLE = "RNA_INCREMENTAL"
+BLOCKSIZE = 4096
+STATEEXT  = ".state.json"
+
+
+def isIncremental():
+    """Returns True if the RNA_INCREMENTAL environment variable is set."""
+    return bool(os.environ.get(INCREMENTALVARIABLE))
+
+
+def stateFileName(bankName):
+    """Returns the state file of a bank file, e.g. 'operonBank_wt1.npz' ->
+    'operonBank_wt1.state.json'."""
+    return os.path.splitext(bankName)[0] + STATEEXT
+
+
+def blockDigests(reads, blockSize = BLOCKSIZE):
+    """Returns the MD5 digests of the reads in blocks of blockSize
+    positions. Reads are compared by value, whatever their dtype or
+    encoding: a Coverage is decoded one block at a time."""
+    if not isinstance(reads, Coverage):
+        reads = numpy.asarray(reads)
+    return [hashlib.md5(numpy.asarray(reads[i:i + blockSize],
+                                      dtype = numpy.float64)).hexdigest()
+            for i in xrange(0, len(reads), blockSize)]
+
+
+def codeDigest(name):
+    """Returns the MD5 digest of the source files of a stage script and of
+    the modules it imports (see pipeline.sourceFiles)."""
+    from pipeline import SOURCEDIR, sourceFiles
+    digest = hashlib.md5()
+    for fileName in sourceFiles(name):
+        with open(os.path.join(SOURCEDIR, fileName), 'rb') as fileObj:
+            digest.update(fileName + '\0' + fileObj.read())
+    return digest.hexdigest()
+
+
+def runSettings(name, parameters):
+    """Returns the settings of a run of the stage script name: its
+    parameters (a dictionary of name -> value, saved as JSON) and the
+    digest of its code."""
+    return {'parameters': parameters, 'code': codeDigest(name)}
+
+
+def coverageState(readsList, contigs):
+    """Returns the state of the reads of the given contigs: a dictionary
+    of contig id -> (number of positions, block digests). readsList is a
+    readsList or a contigs.SampleReads."""
+    state = {}
+    for contig in contigs:
+        reads = contigReads(readsList, contig)
+        state[contig] = (len(reads), blockDigests(reads))
+    return state
+
+
+def saveState(bankName, settings, state = None):
+    """Writes the settings of the run that wrote a bank (see runSettings)
+    and the coverage state of the bank next to it. Without a state (out
+    of incremental mode) no digests are saved, and the next incremental
+    run recomputes everything."""
+    contigs = None
+    if state != None:
+        contigs = dict((contig, {'length': length, 'digests': digests})
+                       for contig, (length, digests) in state.items())
+    with open(stateFileName(bankName), 'w') as fileObj:
+        json.dump({'blockSize': BLOCKSIZE,
+                   'settings':  settings,
+                   'contigs':   contigs},
+                  fileObj, sort_keys = True)
+
+
+def loadState(bankName, settings):
+    """Returns the coverage state saved next to a bank, or None if there
+    is none, or it was saved with another block size, other settings or
+    no digests."""
+    fileName = stateFileName(bankName)
+    if not os.path.exists(fileName):
+        return None
+    with open(fileName, 'r') as fileObj:
+        saved = json.load(fileObj)
+    # Settings are compared as they read back from JSON.
+    if saved.get('blockSize') != BLOCKSIZE or saved.get('contigs') == None \
+       or saved.get('settings') != json.loads(json.dumps(settings)):
+        return None
+    return dict((contig, (entry['length'], entry['digests']))
+                for contig, entry in saved['contigs'].items())
+
+
+def changedRanges(previous, current):
+    """Returns the sorted, merged (start, end) ranges of positions whose
+    reads differ between two (length, digests) states of a contig."""
+    oldLength, oldDigests = previous
+    newLength, newDigests = current
+    ranges = []
+    for i in xrange(min(len(oldDigests), len(newDigests))):
+        if oldDigests[i] != newDigests[i]:
+            start = i * BLOCKSIZE
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], start + BLOCKSIZE)
+            else:
+                ranges.append((start, start + BLOCKSIZE))
+    if oldLength != newLength:
+        start = min(oldLength, newLength)
+        start -= start % BLOCKSIZE
+        while ranges and ranges[-1][1] > start:
+            start = min(start, ranges.pop()[0])
+        ranges.append((start, max(oldLength, newLength)))
+    return ranges
+
+
+class PreviousRun(object):
+    """The decisions of the previous run of a stage for one sample: the
+    genes, gene pairs and operon junctions of its OperonBank, and the
+    ranges of reads that have changed since, per contig."""
+
+    def __init__(self, operonBank, previousState, currentState = None):
+        """operonBank: the OperonBank written by the previous run.
+        previousState: the coverage state (see coverageState) of the
+                previous run.
+        currentState: Optional, the coverage state of this run; see
+                update."""
+        self._genes     = {}
+        self._pairs     = {}
+        self._junctions = {}
+        self._changes   = {}
+        self._previousState = previousState
+        operons = list(operonBank)
+        for j in xrange(len(operons)):
+            operon = operons[j]
+            for i in xrange(len(operon)):
+                gene = operon[i]
+                self._genes[gene.getName()] = _geneKey(gene)
+                if i + 1 < len(operon):
+                    self._pairs[gene.getName()] = (operon[i + 1].getName(),
+                                                   False)
+            if j + 1 < len(operons) and \
+               operons[j + 1].getContig() == operon.getContig():
+                nextOperon = operons[j + 1]
+                self._pairs[operon[-1].getName()] = (nextOperon[0].getName(),
+                                                     True)
+                self._junctions[(operon[-1].getName(),
+                                 nextOperon[0].getName())] = (
+                    operon.getRightBound(), operon.getRightBoundPrecision(),
+                    nextOperon.getLeftBound(),
+                    nextOperon.getLeftBoundPrecision())
+        if currentState != None:
+            self.update(currentState)
+
+    def update(self, currentState):
+        """Compares the coverage state of this run on some contigs with the
+        previous one. Reads of contigs not compared yet count as changed."""
+        for contig, current in currentState.items():
+            if contig in self._previousState:
+                self._changes[contig] = changedRanges(
+                    self._previousState[contig], current)
+            else:
+                self._changes[contig] = [(0, current[0])]
+
+    def isUnchanged(self, gene):
+        """Returns True if a gene of the previous run has the same contig,
+        coordinates and strand now."""
+        return self._genes.get(gene.getName()) == _geneKey(gene)
+
+    def _readsChanged(self, contig, start, end):
+        """Returns True if any read of [start, end) on a contig changed."""
+        ranges = self._changes.get(contig)
+        if ranges == None:
+            return True
+        i = bisect.bisect_right(ranges, (start, float('inf')))
+        if i > 0 and ranges[i - 1][1] > start:
+            return True
+        return i < len(ranges) and ranges[i][0] < end
+
+    def _reusable(self, gene1, gene2):
+        """Returns True if a decision about two consecutive genes can be
+        taken from the previous run."""
+        start = min(gene1.getStart(), gene2.getStart())
+        end = max(gene1.getEnd(), gene2.getEnd()) + 1
+        return self.isUnchanged(gene1) and self.isUnchanged(gene2) and \
+               not self._readsChanged(gene1.getContig(), start, end)
+
+    def getBreak(self, gene1, gene2):
+        """Returns whether the previous run put two consecutive genes in
+        different operons, or None if the decision must be recomputed."""
+        pair = self._pairs.get(gene1.getName())
+        if pair == None or pair[0] != gene2.getName() or \
+           not self._reusable(gene1, gene2):
+            return None
+        return pair[1]
+
+    def getJunction(self, upGene, downGene):
+        """Returns the (right bound, right bound precision, left bound, left
+        bound precision) the previous run set at the junction of an operon
+        ending with upGene and one starting with downGene, or None if they
+        must be recomputed."""
+        junction = self._junctions.get((upGene.getName(), downGene.getName()))
+        if junction == None or not self._reusable(upGene, downGene):
+            return None
+        return junction
+
+
+def _geneKey(gene):
+    """Returns the contig, coordinates and strand of a gene."""
+    return (gene.getContig(), gene.getStart(), gene.getEnd(),
+            gene.getOrientation())
+
+
+def setJunction(operon1, operon2, junction):
+    """Sets the bounds of a junction returned by PreviousRun.getJunction."""
+    rightBound, rightPrecision, leftBound, leftPrecision = junction
+    operon1.setRightBound(rightBound)
+    operon1.setRightBoundPrecision(rightPrecision)
+    operon2.setLeftBound(leftBound)
+    operon2.setLeftBoundPrecision(leftPrecision)
+
+
+def loadPreviousRun(bankName, settings, currentState = None):
+    """Returns the PreviousRun of a bank file, or None if incremental mode
+    is off, the bank or its state file is missing, or the previous run had
+    other settings (see loadState). The bank must be loaded before this
+    run overwrites it."""
+    if not isIncremental() or not os.path.exists(bankName):
+        return None
+    previousState = loadState(bankName, settings)
+    if previousState == None:
+        return None
+    return PreviousRun(OperonBank(bankName), previousState, currentState)
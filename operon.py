@@ -2,21 +2,31 @@
 File: operon.py
 
 Define an Operon class to describe aa operon.
+Like a Sequence, an Operon is a view: reads and bases are taken from the
+shared readsList and genome string on demand instead of being copied.
+Operons are slotted like Sequences. An operon is on the contig of its
+genes.
 
 """
 
 import math
+import copy
 import numpy
 from sequence import Sequence
-
-with open("SpyGenome.txt", 'r') as myfile:
-    SpyGenome = myfile.read().replace('\n', '')
+from coverage import Coverage
+from probeTable import ProbeTable
+from contigs import DEFAULTCONTIG, getContig
 
 class Operon(object):
     """Defines an Operon class representing a cluster of genes controlled
     by the same promoter."""
 
-    SEQUENCESTR = SpyGenome
+    SEQUENCESTR = Sequence.SEQUENCESTR
+
+    __slots__ = ('_name', '_sequences', '_size', '_orientation',
+                 '_leftBound', '_leftBoundPrecision', '_rightBound',
+                 '_rightBoundPrecision', '_readsList', '_readsBounds',
+                 '_baseBounds', '_probeHalfLife')
 
     def __init__(self, name):
         """Constructs an Operon object """
@@ -28,10 +38,57 @@ class Operon(object):
         self._leftBoundPrecision = False
         self._rightBound   = -1
         self._rightBoundPrecision = False
-        self._reads        = ()
-        self._baseSequence = ''
+        self._readsList    = None
+        self._readsBounds  = None
+        self._baseBounds   = None
         self._probeHalfLife = []
-        
+
+    def __getstate__(self):
+        """Pickles the operon without the shared readsList. The genes are
+        pickled as coordinates only (see Sequence.__getstate__)."""
+        state = dict((slot, getattr(self, slot))
+                     for slot in Operon.__slots__)
+        state['_readsList'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled operon. Reads and bases copied into banks
+        written before operons became views are discarded; the range of
+        such reads is kept when it spans the genes of the operon, which is
+        where setReads was called in the pipeline."""
+        reads = state.pop('_reads', None)
+        state.pop('_baseSequence', None)
+        state.setdefault('_readsList', None)
+        state.setdefault('_readsBounds', None)
+        sequences = state.get('_sequences', [])
+        if reads and state['_readsBounds'] is None and sequences != []:
+            left = sequences[0].getStart()
+            right = sequences[-1].getEnd()
+            if right - left == len(reads):
+                state['_readsBounds'] = (left, right)
+        state.setdefault('_size', len(sequences))
+        Operon.__init__(self, state.get('_name', ''))
+        for slot in Operon.__slots__:
+            if slot in state:
+                setattr(self, slot, state[slot])
+
+    def __copy__(self):
+        """Returns a shallow copy of the operon."""
+        operon = Operon.__new__(Operon)
+        for slot in Operon.__slots__:
+            setattr(operon, slot, getattr(self, slot))
+        return operon
+
+    def bind(self, readsList):
+        """Returns a copy of the operon, and of its genes, that takes its
+        reads from readsList. The operon itself is unchanged."""
+        operon = copy.copy(self)
+        operon._sequences = [seq.bind(readsList) for seq in self._sequences]
+        operon._probeHalfLife = list(self._probeHalfLife)
+        if self._readsBounds is not None:
+            operon._readsList = readsList
+        return operon
+
 
     def __str__(self):
         """Returns a string representation of gene names in an operon."""
@@ -86,18 +143,28 @@ class Operon(object):
         self._rightBound = rightBound
 
     def setReads(self, readsList):
-        """Generates a tuple showing RNA-seq reads of all bases in an operon.
-        Returns None. """
-        self._reads = tuple(readsList[self._leftBound:self._rightBound])
+        """Attaches the operon to readsList. The reads of the operon are
+        those between the current boundaries; moving the boundaries later
+        does not change them. Returns None. """
+        self._readsList = readsList
+        self._readsBounds = (self._leftBound, self._rightBound)
+
+    def _getReads(self):
+        """Returns the reads of the operon as a slice of the readsList."""
+        if self._readsBounds is None:
+            return ()
+        if self._readsList is None:
+            raise ValueError, "The operon is not bound to a readsList."
+        return self._readsList[self._readsBounds[0]:self._readsBounds[1]]
 
     def getReads(self):
         """Returns the RNA-seq reads in an operon. """
-        return self._reads
+        return tuple(self._getReads())
 
     def _logTransform(self):
         """Transform reads to log-reads"""
         logReadsList = []
-        for read in self._reads:
+        for read in self._getReads():
             if read == 0:
                 read = 1
             logRead = math.log(read, 2)
@@ -106,21 +173,30 @@ class Operon(object):
    
     def getAverageRead(self):
         """Returns the average read of the operon. The reads are log-transformed \
-        before averaging and expo-transformed after averaging."""
-        if self._reads == ():
+        before averaging and expo-transformed after averaging.
+        Computed by the readsList if it is a Coverage."""
+        if len(self._getReads()) == 0:
             return 0
+        elif isinstance(self._readsList, Coverage):
+            return self._readsList.getAverageRead(*self._readsBounds)
         else:
             averageLogRead = numpy.average(self._logTransform())
             averageRead = 2 ** averageLogRead
             return averageRead
         
     def setBaseSequence(self):
-        """Defines the base sequence of an operon."""
-        self._baseSequence = Operon.SEQUENCESTR[self._leftBound:\
-                                                self._rightBound]
+        """Defines the base sequence of an operon as the bases between
+        the current boundaries."""
+        self._baseBounds = (self._leftBound, self._rightBound)
 
     def setProbeHalfLife(self, probeHalfLifeList):
-        """Set probe half-lives to the operon """
+        """Set probe half-lives to the operon. probeHalfLifeList is a list
+        of (position, orientation, half-life) tuples or a ProbeTable."""
+        if isinstance(probeHalfLifeList, ProbeTable):
+            self.addProbeHalfLife(probeHalfLifeList.getProbes(
+                self._leftBound, self._rightBound, self._orientation,
+                inclusive = True, contig = self.getContig()))
+            return
         for i in xrange(len(probeHalfLifeList)):
             position = probeHalfLifeList[i][0]
             orientation = probeHalfLifeList[i][1]
@@ -129,6 +205,10 @@ class Operon(object):
                orientation == self._orientation:
                 self._probeHalfLife.append(probeHalfLifeList[i])
 
+    def addProbeHalfLife(self, probes):
+        """Appends already selected probe half-lives to the operon."""
+        self._probeHalfLife.extend(probes)
+
     def getProbeHalfLife(self):
         return self._probeHalfLife
     
@@ -171,14 +251,16 @@ class Operon(object):
         """Returns an operon name """
         return self._name
     
-    def getReads(self):
-        """Returns a tuple of all base reads in an operon. """
-        return self._reads
-
     def getOrientation(self):
         """Returns the orientation of an operon."""
         return self._orientation
 
+    def getContig(self):
+        """Returns the id of the contig of the operon: that of its genes."""
+        if self._size == 0:
+            return DEFAULTCONTIG
+        return self._sequences[0].getContig()
+
     def getLeftBound(self):
         """Returns the left boundary of an operon."""
         return self._leftBound
@@ -189,7 +271,10 @@ class Operon(object):
 
     def getBaseSequence(self):
         """Returns the base sequence of an operon."""
-        return self._baseSequence
+        if self._baseBounds is None:
+            return ''
+        return getContig(self.getContig()).getGenome()[
+            self._baseBounds[0]:self._baseBounds[1]]
     
     def setLeftBoundPrecision(self, precision):
         """set the precsion of the left boundary to either
@@ -4,14 +4,20 @@ File: operonBank.py
 Defines an operonBank that holds operons on a chromosome.
 
 A regular list is used to hold operons.
+An OperonBank may hold the operons of several contigs (see contigs.py);
+getContigBank returns those of one contig.
 
 """
 import math
+import os
 import cPickle
 import csv
+import profiling
 from sequence    import Sequence
 from geneBank   import GeneBank
 from operon      import Operon
+from bankFormat  import isColumnar, loadOperonBank, saveOperonBank
+from contigs     import contigReads, contigOrder
 ##from operonJudge import operonJudge
 
 
@@ -29,11 +35,15 @@ class OperonBank(object):
 
     def __init__(self, fileName = None):
         """Construct an operonBank object.
-        Import the object if a fileName is give."""
+        Import the object if a fileName is give, either a file of pickled
+        operons or a columnar bank (see bankFormat.py)."""
         self._operons = []
         self._fileName = fileName
         self._size = 0
-        if fileName != None:
+        if fileName != None and isColumnar(fileName):
+            for operon in loadOperonBank(fileName):
+                self.add(operon)
+        elif fileName != None:
             fileObj = open(fileName, 'r')
             while True:
                 try:
@@ -42,6 +52,8 @@ class OperonBank(object):
                 except EOFError:
                     fileObj.close()
                     break
+        if fileName != None and profiling.ENABLED:
+            profiling.count('bankBytesRead', os.path.getsize(fileName))
 
     def __str__(self):
         """Returns the string rep of all operons """
@@ -78,17 +90,49 @@ class OperonBank(object):
         self._operons.append(operon)
         self._size += 1
         
+    def bind(self, readsList):
+        """Returns a new OperonBank holding copies of all operons that
+        take their reads from readsList. readsList may be a
+        contigs.SampleReads, from which each operon takes the reads of its
+        own contig."""
+        operonBank = OperonBank()
+        operonBank._fileName = self._fileName
+        for operon in self._operons:
+            operonBank.add(operon.bind(contigReads(readsList,
+                                                   operon.getContig())))
+        return operonBank
+
+    def getContigs(self):
+        """Returns the contig ids of the operons, in order of appearance."""
+        return contigOrder(self._operons)
+
+    def getContigBank(self, contig):
+        """Returns a new OperonBank holding the operons of one contig, in
+        order. The operons are shared, not copied."""
+        operonBank = OperonBank()
+        for operon in self._operons:
+            if operon.getContig() == contig:
+                operonBank.add(operon)
+        return operonBank
+
     def save(self, fileName = None):
         """Saves pickled sequences to a file. The parameter
-        allows the user to change filenames."""
+        allows the user to change filenames. A fileName ending in '.npz'
+        is saved in the columnar format of bankFormat.py instead."""
         if fileName != None:
             self._fileName = fileName
         elif self._fileName == None:
             return
-        fileObj = open(self._fileName, 'w')
-        for operon in self._operons:
-            cPickle.dump(operon, fileObj)
-        fileObj.close()
+        if self._fileName.endswith('.npz'):
+            saveOperonBank(self._operons, self._fileName)
+        else:
+            fileObj = open(self._fileName, 'w')
+            for operon in self._operons:
+                cPickle.dump(operon, fileObj)
+            fileObj.close()
+        if profiling.ENABLED:
+            profiling.count('bankBytesWritten',
+                            os.path.getsize(self._fileName))
 
 
 
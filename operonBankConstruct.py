@@ -3,20 +3,42 @@ File: operonBankConstruct.py
 
 Construct operonBank objects based on geneBank and readsList.
 Construct bed file based on operonBank.
+Operons are found contig by contig (see contigs.py) and numbered
+consecutively across contigs.
 
 """
 import csv
 import math
+import logging
 import cPickle
+import numpy
 from sequence import Sequence
 from geneBank import GeneBank
 from operon   import Operon
 from operonBank import OperonBank
+from coverage import Coverage, CoverageMatrix
+from contigs  import SampleReads, contigReads, getContigs, getContig
+from parallel import runSamples, selectedSamples, workerCount
+from prefetch import prefetch, loadSampleReads
+from export   import configureLogging, writeBed
+from incremental import coverageState, saveState, loadPreviousRun
+from incremental import setJunction, isIncremental, runSettings
+import profiling
 
 
-geneBankFiles = ["geneBank_wt1.txt", "geneBank_wt2.txt", \
-                 "geneBank_rny1.txt", "geneBank_rny2.txt"]
+geneBankFile = "geneBank.npz"
+annotation = None
 readsFiles = ["wt1.csv", "wt2.csv", "rny1.csv", "rny2.csv"]
+log = logging.getLogger("operonBankConstruct")
+
+# Thresholds of operon calling (see operonJudge and boundFinder), used by
+# the batch functions below and swept by parameterSweep.py.
+FOLDCHANGE  = 4
+DENTRATIO   = 0.5
+MAXDISTANCE = 100
+WINDOWWIDTH = 25
+SEARCHREACH = 200
+CVFACTOR    = 2
 
 def operonJudge(seq1, seq2, readsList):
     """Define a function to determine whether two sequences belong to different operons.
@@ -28,18 +50,21 @@ def operonJudge(seq1, seq2, readsList):
     We consider that the two sequences lie in different operons if any of the criteria
     is satisfied.
     Precondition: seq1 and seq2 must be consecutive genes on the chromosome.
-    Returns True if two sequences belong to two different operons, and False otherwise."""
-        
-    def expressJudge(seq1, seq2):
+    Returns True if two sequences belong to two different operons, and False otherwise.
+    The average reads of the two sequences are computed once and shared by the
+    criteria; with a Coverage readsList each one is one array operation."""
+
+    aveRead1 = seq1.getAverageRead()
+    aveRead2 = seq2.getAverageRead()
+
+    def expressJudge(aveRead1, aveRead2):
         """Returns True if seq1 and seq2 are differentially expressed,
         and False otherwise.
         Two sequences are considered differentially expressed if their 
         average reads are more than 4 fold in difference."""
-        aveRead1 = seq1.getAverageRead()
-        aveRead2 = seq2.getAverageRead()
         return aveRead1 >= aveRead2 * 4 or aveRead1 <= aveRead2 * 0.25             
 
-    def dentJudge(seq1, seq2, readsList):
+    def dentJudge(seq1, seq2, readsList, aveRead1, aveRead2):
         """Returns True if there exists a dent between the two sequences,
         and False otherwise.
         The average read of the dent must be less than half of 
@@ -53,8 +78,6 @@ def operonJudge(seq1, seq2, readsList):
             minIGRRead = IGR.getMinRead()
 ##            print "minIGRRead = ", minIGRRead
             
-            aveRead1 = seq1.getAverageRead()
-            aveRead2 = seq2.getAverageRead()
             minAveRead = min(aveRead1, aveRead2)
 ##            print "minAveRead = ", minAveRead
 
@@ -73,15 +96,15 @@ def operonJudge(seq1, seq2, readsList):
         distance = seq2.getStart() - seq1.getEnd()
         return distance > 100
 
-    return expressJudge(seq1, seq2) or \
-           dentJudge(seq1, seq2, readsList) or \
+    return expressJudge(aveRead1, aveRead2) or \
+           dentJudge(seq1, seq2, readsList, aveRead1, aveRead2) or \
            strandJudge(seq1, seq2) or \
            distanceJudge(seq1, seq2)
         
-def operonFinder(geneBank, readsList):
-    """Group genes into operons."""
+def operonFinder(geneBank, readsList, firstOperon = 1):
+    """Group genes into operons, named from operon_<firstOperon> on."""
          
-    operon1 = Operon("operon_1")
+    operon1 = Operon("operon_" + str(firstOperon))
     gene1 = geneBank[0]
     operon1.add(gene1)
     operonBank = OperonBank()
@@ -96,7 +119,7 @@ def operonFinder(geneBank, readsList):
             currentOperon.add(currentGene)
         else:
             j += 1
-            name = "operon_" + str(j + 1)
+            name = "operon_" + str(j + firstOperon)
             operon = Operon(name)
             operon.add(currentGene)
             operonBank.add(operon)
@@ -109,21 +132,199 @@ def operonFinder(geneBank, readsList):
         
     return operonBank
 
-def boundFinder(operon1, operon2, readsList):
-    """Defines boundaries between two consecutive operons
-    using sliding window method to find the region with maximum CV."""
-    WINDOWWIDTH = 25
+def pairStatistics(genes1, genes2, readsList):
+    """Returns the statistics operonJudge compares with its thresholds for
+    the gene pairs (genes1[i], genes2[i]), as a dict of arrays with one
+    entry per pair: 'aveReads1' and 'aveReads2', the average reads of the
+    genes, 'minIGRReads', the minimum read of the intergenic region (inf
+    if there is none), 'strandBreaks', True where the genes are on
+    different strands, and 'distances', from the end of the first gene
+    to the start of the second. The average reads and the minimum reads
+    come from the Coverage in one call each; readsList must be a
+    Coverage."""
+    starts1 = numpy.array([gene.getStart() for gene in genes1])
+    ends1 = numpy.array([gene.getEnd() for gene in genes1])
+    starts2 = numpy.array([gene.getStart() for gene in genes2])
+    ends2 = numpy.array([gene.getEnd() for gene in genes2])
 
-    upGene     = operon1[-1]
-    downGene   = operon2[0]
-    
-    leftEdge1  = upGene.getEnd() - 200
+    IGRStarts = ends1 + 1
+    IGREnds = starts2 - 1
+    hasIGR = IGRStarts < IGREnds
+    minIGRReads = numpy.empty(len(genes1))
+    minIGRReads[:] = numpy.inf
+    minIGRReads[hasIGR] = readsList.getIntervalMinReads(IGRStarts[hasIGR],
+                                                        IGREnds[hasIGR])
+    return {'aveReads1':    readsList.getIntervalAverageReads(starts1,
+                                                              ends1),
+            'aveReads2':    readsList.getIntervalAverageReads(starts2,
+                                                              ends2),
+            'minIGRReads':  minIGRReads,
+            'strandBreaks': numpy.array([gene1.getOrientation() !=
+                                         gene2.getOrientation()
+                                         for gene1, gene2
+                                         in zip(genes1, genes2)],
+                                        dtype = bool),
+            'distances':    starts2 - ends1}
+
+def judgePairs(statistics, fold = FOLDCHANGE, dent = DENTRATIO,
+               distance = MAXDISTANCE):
+    """Combines the criteria of operonJudge as boolean arrays over the
+    pairStatistics of gene pairs: a pair is split if the average reads of
+    its genes differ by fold or more, if the minimum read between them is
+    at most dent times the smaller average read, if the genes are on
+    different strands or if they are more than distance bp apart.
+    Returns a boolean array, True where a pair is split."""
+    aveReads1 = statistics['aveReads1']
+    aveReads2 = statistics['aveReads2']
+    expressBreaks = (aveReads1 >= aveReads2 * fold) | \
+                    (aveReads1 <= aveReads2 / fold)
+    dentBreaks = statistics['minIGRReads'] <= \
+                 numpy.minimum(aveReads1, aveReads2) * dent
+    distanceBreaks = statistics['distances'] > distance
+    return expressBreaks | dentBreaks | statistics['strandBreaks'] | \
+           distanceBreaks
+
+def pairBreaks(genes1, genes2, readsList):
+    """Evaluates operonJudge for the gene pairs (genes1[i], genes2[i]) at
+    once, from their pairStatistics. readsList must be a Coverage.
+    Returns a boolean array, True where a pair is split."""
+    return judgePairs(pairStatistics(genes1, genes2, readsList))
+
+def operonJudges(seq1, seq2, matrix, fold = FOLDCHANGE, dent = DENTRATIO,
+                 distance = MAXDISTANCE):
+    """Evaluates operonJudge for two consecutive genes in every sample of
+    a CoverageMatrix at once, by the criteria of judgePairs. Returns a
+    boolean array with one entry per sample, True where the two genes
+    belong to different operons in that sample."""
+    samples = len(matrix)
+    IGRStart = seq1.getEnd() + 1
+    IGREnd = seq2.getStart() - 1
+    minIGRReads = numpy.empty(samples)
+    minIGRReads[:] = numpy.inf
+    if IGRStart < IGREnd:
+        minIGRReads[:] = matrix.getMinReads(IGRStart, IGREnd)
+    strandBreaks = numpy.empty(samples, dtype = bool)
+    strandBreaks[:] = seq1.getOrientation() != seq2.getOrientation()
+    distances = numpy.empty(samples, dtype = numpy.int64)
+    distances[:] = seq2.getStart() - seq1.getEnd()
+    return judgePairs({'aveReads1':    matrix.getAverageReads(seq1.getStart(),
+                                                              seq1.getEnd()),
+                       'aveReads2':    matrix.getAverageReads(seq2.getStart(),
+                                                              seq2.getEnd()),
+                       'minIGRReads':  minIGRReads,
+                       'strandBreaks': strandBreaks,
+                       'distances':    distances},
+                      fold, dent, distance)
+
+def groupGenes(genes, breaks, readsList, firstOperon = 1):
+    """Returns the OperonBank of a list of consecutive genes, split where
+    breaks (one entry per consecutive pair) is True, as operonFinder
+    groups them. The operon of each gene is the cumulative sum of the
+    breaks before it."""
+    membership = numpy.zeros(len(genes), dtype = int)
+    numpy.cumsum(breaks, out = membership[1:])
+
+    operonBank = OperonBank()
+    for i in xrange(len(genes)):
+        if i == 0 or breaks[i - 1]:
+            operonBank.add(Operon("operon_" +
+                                  str(membership[i] + firstOperon)))
+        operonBank[-1].add(genes[i])
+
+    for operon in operonBank:
+        operon.setOrientation()
+        operon.setLeftBound(operon[0].getStart())
+        operon.setRightBound(operon[-1].getEnd())
+        operon.setReads(readsList)
+
+    return operonBank
+
+def batchOperonFinder(geneBank, readsList, firstOperon = 1):
+    """Groups genes into operons exactly as operonFinder does, but
+    evaluates the four criteria of operonJudge for all consecutive gene
+    pairs at once (see pairBreaks). Falls back to operonFinder when
+    readsList is not a Coverage."""
+    if not isinstance(readsList, Coverage) or len(geneBank) == 0:
+        return operonFinder(geneBank, readsList, firstOperon)
+    genes = list(geneBank)
+    breaks = pairBreaks(genes[:-1], genes[1:], readsList)
+    return groupGenes(genes, breaks, readsList, firstOperon)
+
+def incrementalOperonFinder(geneBank, readsList, previous, firstOperon = 1):
+    """Groups genes into operons as batchOperonFinder does, taking the
+    decision for each consecutive gene pair from previous (an
+    incremental.PreviousRun) where it still holds, and evaluating
+    operonJudge only for the other pairs."""
+    if len(geneBank) == 0:
+        return batchOperonFinder(geneBank, readsList, firstOperon)
+    genes = list(geneBank)
+    breaks = [previous.getBreak(genes[i], genes[i + 1])
+              for i in xrange(len(genes) - 1)]
+    pending = [i for i in xrange(len(breaks)) if breaks[i] == None]
+    if profiling.ENABLED:
+        profiling.count('pairsReused', len(breaks) - len(pending))
+    if pending and isinstance(readsList, Coverage):
+        judged = pairBreaks([genes[i] for i in pending],
+                            [genes[i + 1] for i in pending], readsList)
+    else:
+        judged = [operonJudge(genes[i], genes[i + 1], readsList)
+                  for i in pending]
+    for i, judge in zip(pending, judged):
+        breaks[i] = bool(judge)
+    return groupGenes(genes, numpy.array(breaks, dtype = bool), readsList,
+                      firstOperon)
+
+def searchEdges(upGene, downGene, reach = SEARCHREACH):
+    """Returns (leftEdge, rightEdge, midPoint) of the space searched for
+    the boundary between upGene and downGene: at most reach bp (200 by
+    default) into each gene and never beyond its middle."""
+    leftEdge1  = upGene.getEnd() - reach
     leftEdge2  = (upGene.getStart() + upGene.getEnd() )/ 2
     leftEdge   = max(leftEdge1, leftEdge2)
-    rightEdge1 = downGene.getStart() + 200
+    rightEdge1 = downGene.getStart() + reach
     rightEdge2 = (downGene.getStart() + downGene.getEnd()) / 2
     rightEdge  = min(rightEdge1, rightEdge2)
     midPoint  = (upGene.getEnd() + downGene.getStart()) / 2
+    return leftEdge, rightEdge, midPoint
+
+def assignTurnPoints(operon1, operon2, turnPoint1, turnPoint2, midPoint):
+    """Sets the right bound of operon1 and the left bound of operon2,
+    with their precisions, from the turning points found in the left
+    and right spaces (-1 if none was found)."""
+    if turnPoint1 > 0 and turnPoint2 > 0:
+        operon1.setRightBound(turnPoint1)
+        operon1.setRightBoundPrecision(True)
+        operon2.setLeftBound(turnPoint2)
+        operon2.setLeftBoundPrecision(True)
+        
+    elif turnPoint1 > 0 and turnPoint2 < 0:
+        operon1.setRightBound(turnPoint1)
+        operon1.setRightBoundPrecision(True)
+        operon2.setLeftBound(turnPoint1+1)
+        operon2.setLeftBoundPrecision(False)
+        
+    elif turnPoint1 < 0 and turnPoint2 > 0:
+        operon1.setRightBound(turnPoint2-1)
+        operon1.setRightBoundPrecision(False)
+        operon2.setLeftBound(turnPoint2)
+        operon2.setLeftBoundPrecision(True)
+        
+    else:
+        operon1.setRightBound(midPoint)
+        operon1.setRightBoundPrecision(False)
+        operon2.setLeftBound(midPoint+1)
+        operon2.setLeftBoundPrecision(False)
+
+def boundFinder(operon1, operon2, readsList):
+    """Defines boundaries between two consecutive operons
+    using sliding window method to find the region with maximum CV.
+    The window CVs of a Coverage are those of a list of the same reads
+    (see Coverage.getLogCV), so ties between windows are kept."""
+
+    upGene     = operon1[-1]
+    downGene   = operon2[0]
+    
+    leftEdge, rightEdge, midPoint = searchEdges(upGene, downGene)
     workSpace = Sequence(readsList, (leftEdge, rightEdge))
     breakPoint = workSpace.getMinReadLocation()
 
@@ -140,13 +341,19 @@ def boundFinder(operon1, operon2, readsList):
         else:
             start1 = space1.getStart()
             maxWindow1 = Sequence(readsList, (start1, start1 + WINDOWWIDTH))      
+            maxCV1 = maxWindow1.getLogCV()
             while start1 + WINDOWWIDTH < space1.getEnd():
                 window1 = Sequence(readsList, (start1, start1 + WINDOWWIDTH))
-                if maxWindow1.getLogCV() < window1.getLogCV() and \
+                windowCV1 = window1.getLogCV()
+                if maxCV1 < windowCV1 and \
                    window1.getReads()[0] > window1.getReads()[-1]:
                     maxWindow1 = window1
+                    maxCV1 = windowCV1
                 start1 += 1
-        if maxWindow1.getLogCV() >= refCV * 2:
+            if profiling.ENABLED:
+                profiling.count('boundWindows',
+                                start1 - space1.getStart())
+        if maxWindow1.getLogCV() >= refCV * CVFACTOR:
             turnPoint1 = maxWindow1.getMinReadLocation()
         else:
             turnPoint1 = -1
@@ -157,89 +364,310 @@ def boundFinder(operon1, operon2, readsList):
         else:
             start2 = space2.getStart()
             maxWindow2 = Sequence(readsList, (start2, start2 + WINDOWWIDTH))
+            maxCV2 = maxWindow2.getLogCV()
             while start2 + WINDOWWIDTH < space2.getEnd():
                 window2 = Sequence(readsList, (start2, start2 + WINDOWWIDTH))
-                if maxWindow2.getLogCV() < window2.getLogCV() and \
+                windowCV2 = window2.getLogCV()
+                if maxCV2 < windowCV2 and \
                    window2.getReads()[0] < window2.getReads()[-1]:
                     maxWindow2 = window2
+                    maxCV2 = windowCV2
                 start2 += 1
-        if maxWindow2.getLogCV() >= refCV * 2:
+            if profiling.ENABLED:
+                profiling.count('boundWindows',
+                                start2 - space2.getStart())
+        if maxWindow2.getLogCV() >= refCV * CVFACTOR:
             turnPoint2 = maxWindow2.getRightMinReadLocation()
         else:
             turnPoint2 = -1
             
             
         # Assign turning points to each space.
-        if turnPoint1 > 0 and turnPoint2 > 0:
-            operon1.setRightBound(turnPoint1)
-            operon1.setRightBoundPrecision(True)
-            operon2.setLeftBound(turnPoint2)
-            operon2.setLeftBoundPrecision(True)
-            
-        elif turnPoint1 > 0 and turnPoint2 < 0:
-            operon1.setRightBound(turnPoint1)
-            operon1.setRightBoundPrecision(True)
-            operon2.setLeftBound(turnPoint1+1)
-            operon2.setLeftBoundPrecision(False)
-            
-        elif turnPoint1 < 0 and turnPoint2 > 0:
-            operon1.setRightBound(turnPoint2-1)
-            operon1.setRightBoundPrecision(False)
-            operon2.setLeftBound(turnPoint2)
-            operon2.setLeftBoundPrecision(True)
-            
+        assignTurnPoints(operon1, operon2, turnPoint1, turnPoint2, midPoint)
+
+def maxCVWindow(space, readsList, width, falling, windowCVs = None):
+    """Returns (start, end) of the window boundFinder picks in space: the
+    first window of maximum log-CV among those whose first read is larger
+    (falling) or smaller (not falling) than their last read, or the first
+    window if none of them beats it. A space no longer than width is its
+    own window. readsList must be a Coverage; all window CVs are computed
+    in one array operation, unless windowCVs gives them already as
+    (first window start, log-CVs of the windows from there on) for a
+    range of windows that covers the space. The CVs are bit-identical to
+    those boundFinder compares, and argmax keeps the first of tied
+    windows, so the window is the one boundFinder's scan keeps."""
+    spaceStart, spaceEnd = space.getPosition()
+    if len(space) <= width:
+        return spaceStart, spaceEnd
+    if windowCVs == None:
+        CVs = readsList.getWindowLogCVs(spaceStart, spaceEnd - width, width)
+    else:
+        firstStart, CVs = windowCVs
+        CVs = CVs[spaceStart - firstStart:spaceEnd - width - firstStart]
+    if profiling.ENABLED:
+        profiling.count('boundWindows', len(CVs))
+    starts = numpy.arange(spaceStart, spaceStart + len(CVs))
+    firstReads = readsList[starts]
+    lastReads = readsList[numpy.minimum(starts + width, len(readsList)) - 1]
+    if falling:
+        candidates = firstReads > lastReads
+    else:
+        candidates = firstReads < lastReads
+    bestStart = spaceStart
+    if candidates.any():
+        candidateCVs = numpy.where(candidates, CVs, -numpy.inf)
+        best = int(candidateCVs.argmax())
+        if CVs[0] < candidateCVs[best]:
+            bestStart = spaceStart + best
+    return bestStart, bestStart + width
+
+def windowBoundFinder(operon1, operon2, readsList, width = WINDOWWIDTH,
+                      reach = SEARCHREACH, factor = CVFACTOR,
+                      windowCVs = None):
+    """Defines boundaries between two consecutive operons exactly as
+    boundFinder does, but scans each space with maxCVWindow instead of
+    building a Sequence per window. Falls back to boundFinder when
+    readsList is not a Coverage. width, reach and factor are the window
+    width, the reach of the search space into each gene (see searchEdges)
+    and the multiple of the gene log-CV a window must reach; windowCVs
+    are the window log-CVs of the search space, if already computed (see
+    maxCVWindow)."""
+    if not isinstance(readsList, Coverage):
+        boundFinder(operon1, operon2, readsList)
+        return
+
+    upGene     = operon1[-1]
+    downGene   = operon2[0]
+
+    leftEdge, rightEdge, midPoint = searchEdges(upGene, downGene, reach)
+    workSpace = Sequence(readsList, (leftEdge, rightEdge))
+    breakPoint = workSpace.getMinReadLocation()
+
+    if len(workSpace) <= width:
+        operon1.setRightBound(breakPoint)
+        operon2.setLeftBound(breakPoint)
+    else:
+        refCV = min(upGene.getLogCV(), downGene.getLogCV())
+        space1 = Sequence(readsList, (leftEdge, breakPoint))
+        space2 = Sequence(readsList, (breakPoint, rightEdge))
+
+        start1, end1 = maxCVWindow(space1, readsList, width, True, windowCVs)
+        if readsList.getLogCV(start1, end1) >= refCV * factor:
+            turnPoint1 = readsList.getMinReadLocation(start1, end1)
+        else:
+            turnPoint1 = -1
+
+        start2, end2 = maxCVWindow(space2, readsList, width, False,
+                                   windowCVs)
+        if readsList.getLogCV(start2, end2) >= refCV * factor:
+            turnPoint2 = readsList.getRightMinReadLocation(start2, end2)
         else:
-            operon1.setRightBound(midPoint)
-            operon1.setRightBoundPrecision(False)
-            operon2.setLeftBound(midPoint+1)
-            operon2.setLeftBoundPrecision(False)
+            turnPoint2 = -1
 
+        assignTurnPoints(operon1, operon2, turnPoint1, turnPoint2, midPoint)
 
-def operonBankConstruct(geneBank, readsList, strainName):
-    """Construct a operonBank object. Define the boundaries of each operon."""
+def _matrixMaxCVWindows(matrix, CVs, firstStart, spaceStarts, spaceEnds,
+                        width, falling):
+    """Returns the (starts, ends) of the windows maxCVWindow picks in the
+    space [spaceStarts[k], spaceEnds[k]) of every sample k. CVs holds the
+    window log-CVs of every sample for window starts from firstStart on."""
+    windowStarts = firstStart + numpy.arange(CVs.shape[1])
+    firstReads = matrix.getReadsAt(windowStarts)
+    lastReads = matrix.getReadsAt(windowStarts + width - 1)
+    if falling:
+        candidates = firstReads > lastReads
+    else:
+        candidates = firstReads < lastReads
+    candidates &= windowStarts >= spaceStarts[:, None]
+    candidates &= windowStarts < (spaceEnds - width)[:, None]
+    candidateCVs = numpy.where(candidates, CVs, -numpy.inf)
+    best = candidateCVs.argmax(axis = 1)
+    rows = numpy.arange(len(matrix))
+    wide = spaceEnds - spaceStarts > width
+    firstCVs = numpy.zeros(len(matrix))
+    firstCVs[wide] = CVs[rows[wide], (spaceStarts - firstStart)[wide]]
+    moved = wide & (firstCVs < candidateCVs[rows, best])
+    starts = numpy.where(moved, firstStart + best, spaceStarts)
+    ends = numpy.where(wide, starts + width, spaceEnds)
+    return starts, ends
+
+def matrixBoundFinder(operonPairs, matrix, width = WINDOWWIDTH,
+                      reach = SEARCHREACH, factor = CVFACTOR):
+    """Defines the boundary between two consecutive operons in every
+    sample of a CoverageMatrix at once, as windowBoundFinder does for one
+    sample. operonPairs holds one (operon1, operon2) pair per row of the
+    matrix; all pairs must share the genes on either side of the boundary.
+    width, reach and factor are those of windowBoundFinder. The window
+    log-CVs of the whole search space are computed once for all samples."""
+
+    upGene   = operonPairs[0][0][-1]
+    downGene = operonPairs[0][1][0]
+
+    leftEdge, rightEdge, midPoint = searchEdges(upGene, downGene, reach)
+    if leftEdge < 0 or rightEdge > matrix.getPositionCount():
+        for k in xrange(len(matrix)):
+            operon1, operon2 = operonPairs[k]
+            windowBoundFinder(operon1, operon2, matrix.getCoverage(k),
+                              width, reach, factor)
+        return
+    breakPoints = matrix.getMinReadLocations(leftEdge, rightEdge)
+
+    if rightEdge - leftEdge <= width:
+        for k in xrange(len(matrix)):
+            operon1, operon2 = operonPairs[k]
+            operon1.setRightBound(int(breakPoints[k]))
+            operon2.setLeftBound(int(breakPoints[k]))
+        return
+
+    refCVs = numpy.minimum(
+        matrix.getLogCVs(upGene.getStart(), upGene.getEnd()),
+        matrix.getLogCVs(downGene.getStart(), downGene.getEnd()))
+    CVs = matrix.getWindowLogCVs(leftEdge, rightEdge - width, width)
+    if profiling.ENABLED:
+        profiling.count('boundWindows', CVs.size)
+    leftEdges = numpy.empty(len(matrix), dtype = numpy.int64)
+    leftEdges[:] = leftEdge
+    rightEdges = numpy.empty(len(matrix), dtype = numpy.int64)
+    rightEdges[:] = rightEdge
 
-    operonBank = operonFinder(geneBank, readsList)
+    starts1, ends1 = _matrixMaxCVWindows(matrix, CVs, leftEdge, leftEdges,
+                                         breakPoints, width, True)
+    turnPoints1 = numpy.where(
+        matrix.getLogCVs(starts1, ends1) >= refCVs * factor,
+        matrix.getMinReadLocations(starts1, ends1), -1)
+
+    starts2, ends2 = _matrixMaxCVWindows(matrix, CVs, leftEdge, breakPoints,
+                                         rightEdges, width, False)
+    turnPoints2 = numpy.where(
+        matrix.getLogCVs(starts2, ends2) >= refCVs * factor,
+        matrix.getRightMinReadLocations(starts2, ends2), -1)
+
+    for k in xrange(len(matrix)):
+        operon1, operon2 = operonPairs[k]
+        assignTurnPoints(operon1, operon2, int(turnPoints1[k]),
+                         int(turnPoints2[k]), midPoint)
+
+
+def contigOperonBank(geneBank, readsList, firstOperon = 1, previous = None):
+    """Returns the operonBank of the genes of one contig, with the
+    boundaries of each operon defined. readsList holds the reads of the
+    contig. With previous (an incremental.PreviousRun), the gene pairs and
+    operon junctions it still holds are taken from it."""
+
+    if previous == None:
+        operonBank = batchOperonFinder(geneBank, readsList, firstOperon)
+    else:
+        operonBank = incrementalOperonFinder(geneBank, readsList, previous,
+                                             firstOperon)
 
     j = 0
     while j < len(operonBank) -1:
         operon1 = operonBank[j]
         operon2 = operonBank[j+1]
         operon1.setOrientation()
-        boundFinder(operon1, operon2, readsList)
-        print operon1.getName(), (operon1.getLeftBound(), operon1.getRightBound()), \
-              operon1.getLeftBoundPrecision(), operon1.getRightBoundPrecision()
+        junction = None
+        if previous != None:
+            junction = previous.getJunction(operon1[-1], operon2[0])
+        if junction == None:
+            windowBoundFinder(operon1, operon2, readsList)
+        else:
+            setJunction(operon1, operon2, junction)
+            if profiling.ENABLED:
+                profiling.count('junctionsReused')
+        log.debug("%s %s %s %s", operon1.getName(),
+                  (operon1.getLeftBound(), operon1.getRightBound()),
+                  operon1.getLeftBoundPrecision(),
+                  operon1.getRightBoundPrecision())
         
         j += 1
+    return operonBank
+
+def constructSettings():
+    """Returns the settings of operonBankConstruct (see
+    incremental.runSettings): its thresholds and the digest of its
+    code."""
+    return runSettings("operonBankConstruct",
+                       {'FOLDCHANGE':  FOLDCHANGE,
+                        'DENTRATIO':   DENTRATIO,
+                        'MAXDISTANCE': MAXDISTANCE,
+                        'WINDOWWIDTH': WINDOWWIDTH,
+                        'SEARCHREACH': SEARCHREACH,
+                        'CVFACTOR':    CVFACTOR})
+
+
+def operonBankConstruct(geneBank, readsList, strainName):
+    """Construct a operonBank object. Define the boundaries of each operon.
+    readsList is the readsList of a single contig, or a SampleReads that
+    holds the reads of every contig of geneBank.
+    In incremental mode (see incremental.py) only the decisions affected
+    by changes of the annotation or of the reads since the previous run
+    are recomputed."""
+
+    bankName = "operonBank_" + strainName + ".npz"
+    settings = constructSettings()
+    state = None
+    if isIncremental():
+        state = coverageState(readsList, geneBank.getContigs())
+    previous = loadPreviousRun(bankName, settings, state)
+    if previous != None:
+        log.info("Updating %s incrementally.", bankName)
+
+    operonBank = OperonBank()
+    for contig in geneBank.getContigs():
+        contigBank = contigOperonBank(
+            geneBank.getContigBank(contig), contigReads(readsList, contig),
+            len(operonBank) + 1, previous)
+        for operon in contigBank:
+            operonBank.add(operon)
 
-    bankName = "operonBank_" + strainName + ".txt"
     operonBank.save(bankName)
-    print bankName + " is generated."
+    saveState(bankName, settings, state)
+    log.info("%s is generated.", bankName)
     
     """Export operon boundaries to a new bed file """
-    bedName = "operonBank_" + strainName + ".bed"
-    f2 = open(bedName, 'w')
-    for operon in operonBank:
-        f2.write("Spy|"+ '\t' + str(operon.getLeftBound()) + '\t'
-                 + str(operon.getRightBound()) + '\t'
-                 + operon.getName() + '\t'
-                 + '44' + '\t'
-                 + operon.getOrientation() +'\n')
-    f2.close()
+    bedName = writeBed(operonBank, "operonBank_" + strainName + ".bed")
+    log.info("%s is generated.", bedName)
+    return operonBank
 
-    print bedName + " is generated."
 
+def constructSample(strainName, readsList = None):
+    """Constructs the operonBank of a sample from the shared annotation.
+    readsList is the SampleReads of the sample if it was loaded ahead (see
+    prefetch.py). Runs in a worker process when constructBanks runs in
+    parallel."""
+    with profiling.stage("operonBankConstruct", strainName):
+        if readsList == None:
+            readsList = SampleReads(strainName)
+        geneBank = annotation.bind(readsList)
+        operonBankConstruct(geneBank, readsList, strainName)
+        for contig in getContigs():
+            contig.release(strainName)
 
-def main():
-    for i in xrange(len(geneBankFiles)):
-        geneBank = GeneBank(geneBankFiles[i])
-        
-        with open(readsFiles[i], 'rU') as readsFile:
-            reads = csv.reader(readsFile, delimiter='\t')
-            readsList = []
-            for row in reads:
-                readsList.append(float(row[2]))
+def constructBanks(strainNames, bankFile = geneBankFile, workers = None):
+    """Constructs the operonBanks of the named samples (e.g. ['wt1',
+    'rny1']) from the GeneBank in bankFile, in a pool of worker processes
+    (default: the RNA_WORKERS environment variable, else 1). The
+    annotation is loaded once, before the workers are forked. With one
+    worker, the reads of the next samples are loaded and indexed in
+    background threads while a sample is processed (see prefetch.py)."""
+    global annotation
+    annotation = GeneBank(bankFile)
+    if workerCount(workers) > 1 and len(strainNames) > 1:
+        runSamples(constructSample, strainNames, workers)
+        return
+    contigs = [getContig(contig) for contig in annotation.getContigs()]
+    for strainName, readsList in prefetch(
+            lambda strainName: loadSampleReads(strainName, contigs),
+            strainNames):
+        constructSample(strainName, readsList)
+
+def main(workers = None):
+    """Constructs the operonBanks of all samples, or of the samples named
+    in the RNA_SAMPLES environment variable."""
+    configureLogging()
+    constructBanks([readsFiles[i][0:-4] for i in selectedSamples(readsFiles)],
+                   geneBankFile, workers)
 
-        strainName = readsFiles[i][0:-4]
-        operonBankConstruct(geneBank, readsList, strainName)
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,185 @@
 """
 File: operonBankRefine.py
 
-Unify four operon banks.
+Unify the operon banks of all samples.
 
-1. Include all operons that are identified in the four datasets.
-2. Re-define operons in the four operonBanks.
+1. Include the operon after-gaps identified in the datasets, by the
+   consensus rule of operonConsensus.py (by default all of them).
+2. Re-define operons in the operonBanks, contig by contig (see
+   contigs.py).
 
 """
 import csv
 import math
+import logging
 import cPickle
 from sequence import Sequence
 from geneBank import GeneBank
 from operon   import Operon
 from operonBank import OperonBank
+from prefetch import prefetch, loadMatrix, loadOperonBanks
+from contigs  import getContig
+from parallel import selectedSamples
+from export   import configureLogging, writeBed
+from incremental import coverageState, saveState, loadPreviousRun
+from incremental import setJunction, isIncremental, runSettings
+import profiling
+from operonConsensus import consensusGaps, consensusRule, groupOperons
 from operonBankConstruct import operonJudge
-from operonBankConstruct import boundFinder
+from operonBankConstruct import matrixBoundFinder
 from operonBankConstruct import operonFinder
+from operonBankConstruct import WINDOWWIDTH, SEARCHREACH, CVFACTOR
 
-"""Find all operon after-gaps that occur in the four operonBanks. """
-
-geneBankFiles = ["geneBank_wt1.txt", "geneBank_wt2.txt", \
-                 "geneBank_rny1.txt", "geneBank_rny2.txt"]
+geneBankFile = "geneBank.npz"
 readsFiles = ["wt1.csv", "wt2.csv", "rny1.csv", "rny2.csv"]
+log = logging.getLogger("operonBankRefine")
 
-operonBankFiles = [OperonBank("operonBank_wt1.txt"), \
-                  OperonBank("operonBank_wt2.txt"), \
-                  OperonBank("operonBank_rny1.txt"), \
-                  OperonBank("operonBank_rny2.txt")]
-
-gapList = []
-n = 0
-for i in xrange(4):
-    operonBank = operonBankFiles[i]
-    geneBank   = GeneBank(geneBankFiles[i])
-    for operon in operonBank:
-        gene = operon[-1]
-        gap = geneBank.getIndex(gene.getName())
-        if gap not in gapList:
-            gapList.append(gap)
-            n += 1
-print "The number of after-gaps is: ", n
-gapList.sort()
-        
-
-"""Group genes into operons based on the gap information """
-
-
-for i in xrange(len(geneBankFiles)):
-    geneBank = GeneBank(geneBankFiles[i])
-    operonBankRD = OperonBank()
-    with open(readsFiles[i], 'rU') as readsFile:
-        reads = csv.reader(readsFile, delimiter='\t')
-        readsList = []
-        for row in reads:
-            readsList.append(float(row[2]))
-    
-    
-    n = 0
-    operon = Operon("operon_" + str(n + 1))
-    for gene in geneBank:        
-        afterGap = gapList[n]
-        if geneBank.getIndex(gene.getName()) < afterGap:
-            operon.add(gene)
-        elif geneBank.getIndex(gene.getName()) == afterGap:
-            operon.add(gene)
-            print gene.getName()
-            n += 1
-            operonBankRD.add(operon)
-            operon.setLeftBound(operon[0].getStart())
-            operon.setRightBound(operon[-1].getEnd())
-            operon.setOrientation()
-            operon.setReads(readsList)
-            print operon.getName()
-            print str(operon)
-            operon = Operon("operon_" + str(n + 1))
-
-    j = 0
-    while j < len(operonBankRD) -1:
-        operon1 = operonBankRD[j]
-        operon2 = operonBankRD[j+1]        
-        boundFinder(operon1, operon2, readsList)
-        print operon1.getName(), (operon1.getLeftBound(), operon1.getRightBound()), \
-              round(operon1.getAverageRead(), 2)
-        
-        
-        j += 1
+
+def findGaps(annotation, strainNames, rule = None):
+    """Returns the consensus operon after-gaps of the operonBanks of the
+    named samples (operonBank_<name>.npz), by the consensus rule of
+    operonConsensus.py (default: the RNA_CONSENSUS environment variable)."""
+    with profiling.stage("consensus"):
+        operonBankFiles = loadOperonBanks(["operonBank_" + name + ".npz"
+                                           for name in strainNames])
+
+        rule = consensusRule(rule)
+        gapList = consensusGaps(operonBankFiles, annotation, rule)
+    log.info("The number of after-gaps is: %d (%s)", len(gapList), rule)
+    return gapList
+
+
+def refineSettings(strainNames, consensusNames, rule, width = WINDOWWIDTH,
+                   reach = SEARCHREACH, factor = CVFACTOR):
+    """Returns the settings of operonBankRefine (see
+    incremental.runSettings): the samples refined together, the samples
+    and rule of the consensus, the width, reach and factor
+    matrixBoundFinder is called with and the digest of its code."""
+    return runSettings("operonBankRefine",
+                       {'strainNames':    list(strainNames),
+                        'consensusNames': list(consensusNames),
+                        'rule':           consensusRule(rule),
+                        'WINDOWWIDTH':    width,
+                        'SEARCHREACH':    reach,
+                        'CVFACTOR':       factor})
+
+
+def saveSample(operonBankRD, strainName, settings, state = None):
+    """Saves the refined operonBank of a sample, the settings and coverage
+    state it was refined with (see incremental.py) and its bed file."""
+    if log.isEnabledFor(logging.DEBUG):
+        for j in xrange(len(operonBankRD) - 1):
+            operon = operonBankRD[j]
+            log.debug("%s %s %s", operon.getName(),
+                      (operon.getLeftBound(), operon.getRightBound()),
+                      round(operon.getAverageRead(), 2))
     operonBankRD[-1].setOrientation()
     
     
-    fileName1 = 'operonBankRD_' + str(readsFiles[i])[0:-4] + '.txt'
+    fileName1 = 'operonBankRD_' + strainName + '.npz'
     operonBankRD.save(fileName1)
-    print fileName1 + " is generated."
+    saveState(fileName1, settings, state)
+    log.info("%s is generated.", fileName1)
     
     """Export operon boundaries to a new bed file """
-    fileName2 = "operonBedRD_" + str(readsFiles[i])[0:-4] + ".bed"
-    f2 = open(fileName2, 'w')
-    for operon in operonBankRD:
-        f2.write("Spy|"+ '\t' + str(operon.getLeftBound()) + '\t'
-                 + str(operon.getRightBound()) + '\t'
-                 + operon.getName() + '\t'
-                 + '44' + '\t'
-                 + operon.getOrientation() +'\n')
-    f2.close()
+    fileName2 = writeBed(operonBankRD, "operonBedRD_" + strainName + ".bed")
+    log.info("%s is generated.", fileName2)
+
+
+def refineBanks(annotation, gapList, strainNames, settings,
+                width = WINDOWWIDTH, reach = SEARCHREACH, factor = CVFACTOR):
+    """Groups the genes of annotation into operons at the after-gaps of
+    gapList and re-defines the operon boundaries of the named samples.
+    Returns their refined operonBanks, with the coverage states they were
+    refined from in incremental mode (see incremental.py, otherwise None),
+    in the order of strainNames. settings are those of this run (see
+    refineSettings); width, reach and factor are passed to
+    matrixBoundFinder.
+
+    The samples share their operons, which are grouped once from the
+    annotation, so each boundary is found for every sample at once from
+    one CoverageMatrix (see matrixBoundFinder). Each contig has its own
+    CoverageMatrix, which is loaded in a background thread while the
+    boundaries of the previous contig are found (see prefetch.py). In
+    incremental mode a boundary is taken from the
+    previous operonBankRD of every sample when none of them needs it
+    recomputed."""
+    operonBanksRD = [OperonBank() for name in strainNames]
+    incremental = isIncremental()
+    states = [{} if incremental else None for name in strainNames]
+    previousRuns = [loadPreviousRun('operonBankRD_' + name + '.npz', settings)
+                    for name in strainNames]
+    with profiling.stage("boundaries"):
+        consensusBank = groupOperons(annotation, gapList)
+        contigFiles = dict((contig, [getContig(contig).getReadsFile(name)
+                                     for name in strainNames])
+                           for contig in consensusBank.getContigs())
+        for contig, matrix in prefetch(
+                lambda contig: loadMatrix(contigFiles[contig]),
+                consensusBank.getContigs()):
+            contigBank = consensusBank.getContigBank(contig)
+            contigBanksRD = [contigBank.bind(readsList)
+                             for readsList in matrix]
+            for k in xrange(len(strainNames) if incremental else 0):
+                state = coverageState(matrix.getCoverage(k), [contig])
+                states[k].update(state)
+                if previousRuns[k] != None:
+                    previousRuns[k].update(state)
+
+            if contigBanksRD != []:
+                for j in xrange(len(contigBank) - 1):
+                    junctions = [None if previous == None else
+                                 previous.getJunction(contigBank[j][-1],
+                                                      contigBank[j + 1][0])
+                                 for previous in previousRuns]
+                    if None in junctions:
+                        matrixBoundFinder(
+                            [(contigBankRD[j], contigBankRD[j + 1])
+                             for contigBankRD in contigBanksRD], matrix,
+                            width, reach, factor)
+                        continue
+                    for k in xrange(len(strainNames)):
+                        setJunction(contigBanksRD[k][j],
+                                    contigBanksRD[k][j + 1], junctions[k])
+                    if profiling.ENABLED:
+                        profiling.count('junctionsReused', len(strainNames))
+            for k in xrange(len(strainNames)):
+                for operon in contigBanksRD[k]:
+                    operonBanksRD[k].add(operon)
+    return operonBanksRD, states
+
+
+def operonBankRefine(strainNames, consensusNames = None,
+                     bankFile = geneBankFile, rule = None,
+                     width = WINDOWWIDTH, reach = SEARCHREACH,
+                     factor = CVFACTOR):
+    """Refines and saves the operonBanks of the named samples (e.g. ['wt1',
+    'rny1']). The after-gaps are the consensus of the operonBanks of
+    consensusNames (default: all four samples) by rule. width, reach and
+    factor are those of matrixBoundFinder. Returns the refined
+    operonBanks."""
+    if consensusNames == None:
+        consensusNames = [readsFile[0:-4] for readsFile in readsFiles]
+    annotation = GeneBank(bankFile)
+    gapList = findGaps(annotation, consensusNames, rule)
+    settings = refineSettings(strainNames, consensusNames, rule,
+                              width, reach, factor)
+    operonBanksRD, states = refineBanks(annotation, gapList, strainNames,
+                                        settings, width, reach, factor)
+    for k in xrange(len(strainNames)):
+        strainName = strainNames[k]
+        with profiling.stage("saveSample", strainName):
+            saveSample(operonBanksRD[k], strainName, settings, states[k])
+    return operonBanksRD
 
-    print fileName2 + " is generated."
 
+def main():
+    """Refines the operonBanks of all samples, or of the samples named in
+    the RNA_SAMPLES environment variable."""
+    configureLogging()
+    operonBankRefine([readsFiles[i][0:-4]
+                      for i in selectedSamples(readsFiles)])
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+File: operonConsensus.py
+
+Builds consensus operons from the OperonBanks of any number of samples.
+
+Each OperonBank votes for the genes its operons end at (its after-gaps).
+The consensus after-gaps are the genes with enough votes under a rule:
+'union' (at least one bank), 'intersection' (every bank), or an integer k
+(at least k banks). The genes of the annotation are then grouped into
+operons that end at the consensus after-gaps, once for all samples.
+The last gene of every contig (see contigs.py) always ends an operon.
+
+"""
+import os
+import numpy
+from operon     import Operon
+from operonBank import OperonBank
+
+CONSENSUSVARIABLE = "RNA_CONSENSUS"
+
+
+def consensusRule(rule = None):
+    """Returns the consensus rule: rule if it is given, otherwise the
+    RNA_CONSENSUS environment variable ('union', 'intersection' or a
+    number k), otherwise 'union'."""
+    if rule == None:
+        rule = os.environ.get(CONSENSUSVARIABLE, 'union')
+    if rule in ('union', 'intersection'):
+        return rule
+    try:
+        return int(rule)
+    except ValueError:
+        raise ValueError, "Unknown consensus rule: " + str(rule)
+
+
+def afterGaps(operonBank, annotation):
+    """Returns a sorted array of the annotation indexes of the genes that
+    end the operons of operonBank."""
+    gaps = [annotation.getIndex(operon[-1].getName())
+            for operon in operonBank]
+    return numpy.unique(numpy.array(gaps, dtype = numpy.int64))
+
+
+def consensusGaps(operonBanks, annotation, rule = 'union'):
+    """Returns a sorted array of the consensus after-gaps of operonBanks,
+    as annotation indexes. rule is 'union', 'intersection' or a number k
+    of banks that must agree. The last gene of the annotation, and of each
+    of its contigs, always ends an operon."""
+    rule = consensusRule(rule)
+    if rule == 'union':
+        threshold = 1
+    elif rule == 'intersection':
+        threshold = len(operonBanks)
+    else:
+        threshold = rule
+    if threshold < 1 or threshold > len(operonBanks):
+        raise ValueError, "The consensus needs 1 to " + \
+              str(len(operonBanks)) + " banks, not " + str(threshold) + "."
+    votes = numpy.zeros(len(annotation), dtype = numpy.int64)
+    for operonBank in operonBanks:
+        gaps = afterGaps(operonBank, annotation)
+        votes += numpy.bincount(gaps[gaps >= 0], minlength = len(annotation))
+    if len(annotation) > 0:
+        contigs = numpy.array([gene.getContig() for gene in annotation])
+        votes[numpy.append(contigs[:-1] != contigs[1:], True)] = threshold
+    return numpy.flatnonzero(votes >= threshold)
+
+
+def groupOperons(geneBank, gaps, readsList = None):
+    """Groups the genes of geneBank into operons that end at the after-gaps
+    gaps (geneBank indexes), in one pass over the genes. Sets the
+    orientation and bounds of every operon and attaches it to readsList
+    (None for an unbound bank, see OperonBank.bind). Returns the new
+    OperonBank."""
+    isGap = numpy.zeros(len(geneBank), dtype = bool)
+    isGap[gaps] = True
+    isGap = isGap.tolist()
+    operonBank = OperonBank()
+    operon = Operon("operon_1")
+    i = 0
+    for gene in geneBank:
+        operon.add(gene)
+        if isGap[i]:
+            operon.setLeftBound(operon[0].getStart())
+            operon.setRightBound(operon[-1].getEnd())
+            operon.setOrientation()
+            operon.setReads(readsList)
+            operonBank.add(operon)
+            operon = Operon("operon_" + str(len(operonBank) + 1))
+        i += 1
+    return operonBank
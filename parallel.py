@@ -0,0 +1,79 @@
+"""
+File: parallel.py
+
+Runs independent per-sample work (wt1, wt2, rny1, rny2, ...) in a pool of
+worker processes.
+
+Workers are forked from the calling process, so data it loaded before
+calling runSamples (the annotation bank, gap lists) is shared with them
+copy-on-write instead of being pickled to each one. Coverage loaded from
+binary coverage files is memory-mapped and shared through the page cache.
+When profiling is enabled (see profiling.py), each worker sends its
+counters and stage records back with its result.
+
+"""
+import os
+import imp
+import multiprocessing
+import profiling
+
+WORKERSVARIABLE = "RNA_WORKERS"
+SAMPLESVARIABLE = "RNA_SAMPLES"
+
+
+def workerCount(workers = None):
+    """Returns the number of worker processes: workers if it is given,
+    otherwise the RNA_WORKERS environment variable, otherwise 1."""
+    if workers == None:
+        workers = int(os.environ.get(WORKERSVARIABLE, 1))
+    return max(1, workers)
+
+
+def selectedSamples(readsFiles):
+    """Returns the indexes of the reads files whose samples are to be
+    processed: the samples named in the comma-separated RNA_SAMPLES
+    environment variable (e.g. RNA_SAMPLES=wt1,rny1), or all of them if
+    it is not set. A sample is named by its reads file without extension."""
+    names = os.environ.get(SAMPLESVARIABLE)
+    if names == None:
+        return range(len(readsFiles))
+    names = names.split(',')
+    return [i for i in xrange(len(readsFiles))
+            if os.path.splitext(readsFiles[i])[0] in names]
+
+
+def runSamples(function, samples, workers = None):
+    """Calls function on each item of samples and returns the results in
+    the order of samples. With one worker the calls run in this process,
+    one after another; otherwise each call runs in a pool process.
+    function must be defined at module level. Each call must write only
+    its own sample's outputs, which keeps them identical to a serial run.
+    The calls also run serially while a module import is in progress (a
+    stage script imported rather than run), since the pool's result thread
+    would wait on the import lock held by this thread."""
+    samples = list(samples)
+    workers = min(workerCount(workers), len(samples))
+    if workers <= 1 or imp.lock_held():
+        return [function(sample) for sample in samples]
+    pool = multiprocessing.Pool(workers)
+    try:
+        if profiling.ENABLED:
+            results = pool.map(_profiledCall,
+                               [(function, sample) for sample in samples], 1)
+            for result, record in results:
+                profiling.merge(record)
+            results = [result for result, record in results]
+        else:
+            results = pool.map(function, samples, 1)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def _profiledCall((function, sample)):
+    """Calls function on sample in a pool process. Returns the result with
+    the profiling record of the call."""
+    profiling.reset()
+    result = function(sample)
+    return result, profiling.snapshot()
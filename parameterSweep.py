@@ -0,0 +1,261 @@
+"""
+File: parameterSweep.py
+
+Sweeps the thresholds of operon calling and of half-life shift detection
+over a grid of settings, for each sample, without rerunning the workflow
+for each setting.
+
+The thresholds are those of operonBankConstruct.py (fold, dent and
+distance split two consecutive genes; width, reach and factor place the
+boundary between two operons) and those of halfLifeShift.py (workWidth,
+threshold and minAverageRead flag a half-life shift). Each is given a
+list of values, and the grid holds every combination of them.
+
+What does not depend on the thresholds is computed once per sample: the
+average read of every gene and the minimum read of every intergenic
+region (operonBankConstruct.pairStatistics), the window log-CVs of the
+search space of every junction (once per window width, over the widest
+search space of the grid) and, for each operon set, the log half-lives of
+its probes (halfLifeShift.probeStatistics). A setting then only compares
+them with its thresholds: judgePairs splits the genes, the bounds of a
+junction are found once per width, reach and factor and shared by every
+setting that splits the same gene pair, and windowExtremes and
+isProcessed flag the processed operons.
+
+The operons of each sample are called as operonBankConstruct.py calls
+them; they are not unified across samples as in operonBankRefine.py, so
+the processed operons are those of the sample's own operons. Each row of
+the summary table (sweepSummary.csv) compares a setting with the default
+one, that of the workflow: the number of operons, the number of operons
+whose bounds are not those of an operon of the default setting, and the
+processed operons (named by their first and last gene), gained and lost.
+
+"""
+import itertools
+import logging
+import numpy
+from geneBank import GeneBank
+from operon   import Operon
+from operonBank import OperonBank
+from contigs  import contigReads, getContig
+from prefetch import prefetch, loadSampleReads
+from probeTable import loadProbeTable
+from export   import writeTable
+from incremental import setJunction
+from operonBankConstruct import pairStatistics, judgePairs, groupGenes
+from operonBankConstruct import searchEdges, windowBoundFinder
+from operonBankConstruct import FOLDCHANGE, DENTRATIO, MAXDISTANCE
+from operonBankConstruct import WINDOWWIDTH, SEARCHREACH, CVFACTOR
+from halfLifeShift import probeStatistics, windowExtremes, isProcessed
+from halfLifeShift import WORKWIDTH, THRESHOLD, MINAVERAGEREAD
+from HLShiftFinder import probeHLFile
+import profiling
+
+geneBankFile = "geneBank.npz"
+summaryFile  = "sweepSummary.csv"
+log = logging.getLogger("parameterSweep")
+
+CALLING    = ['fold', 'dent', 'distance']
+BOUNDS     = ['width', 'reach', 'factor']
+SHIFTS     = ['workWidth', 'threshold', 'minAverageRead']
+PARAMETERS = CALLING + BOUNDS + SHIFTS
+DEFAULTS   = {'fold':           FOLDCHANGE,
+              'dent':           DENTRATIO,
+              'distance':       MAXDISTANCE,
+              'width':          WINDOWWIDTH,
+              'reach':          SEARCHREACH,
+              'factor':         CVFACTOR,
+              'workWidth':      WORKWIDTH,
+              'threshold':      THRESHOLD,
+              'minAverageRead': MINAVERAGEREAD}
+COLUMNS    = ['sample'] + PARAMETERS + ['operons', 'boundaryChanges',
+                                       'processed', 'processedGained',
+                                       'processedLost', 'processedOperons']
+
+
+def parameterGrid(values = None):
+    """Returns the settings of a grid, as dicts of parameter -> value, for
+    every combination of the values given in values (a dict of parameter
+    -> list of values). A parameter not in values keeps its default.
+    The halfLifeShift.py thresholds vary fastest, so consecutive settings
+    share their operons.
+    Raises ValueError for an unknown parameter."""
+    if values == None:
+        values = {}
+    for name in values:
+        if name not in DEFAULTS:
+            raise ValueError, "Unknown sweep parameter: " + name
+    lists = [values.get(name) or [DEFAULTS[name]] for name in PARAMETERS]
+    return [dict(zip(PARAMETERS, setting))
+            for setting in itertools.product(*lists)]
+
+
+class SampleSweep(object):
+    """The statistics of one sample that do not depend on the thresholds,
+    and the operons and processed operons of any setting computed from
+    them."""
+
+    def __init__(self, geneBank, readsList, probeTable, reach = SEARCHREACH):
+        """geneBank: the GeneBank of the sample, bound to its reads.
+        readsList: the reads of the sample (a contigs.SampleReads).
+        probeTable: the ProbeTable of the probe half-lives of the sample.
+        reach: Optional, the largest search reach of the settings, which
+               the cached window log-CVs cover."""
+        self._contigs = []
+        for contig in geneBank.getContigs():
+            genes = list(geneBank.getContigBank(contig))
+            reads = contigReads(readsList, contig)
+            self._contigs.append((genes, reads,
+                                  pairStatistics(genes[:-1], genes[1:],
+                                                 reads)))
+        self._probeTable = probeTable
+        self._reach = reach
+        self._windowCVs = {}
+        self._junctions = {}
+        self._operonKey = None
+        self._operonSet = None
+
+    def _getWindowCVs(self, k, pair, width):
+        """Returns the (first window start, window log-CVs) of the widest
+        search space of the junction after gene pair of contig k."""
+        key = (k, pair, width)
+        if key not in self._windowCVs:
+            genes, reads, statistics = self._contigs[k]
+            leftEdge, rightEdge, midPoint = searchEdges(
+                genes[pair], genes[pair + 1], self._reach)
+            self._windowCVs[key] = (leftEdge, reads.getWindowLogCVs(
+                leftEdge, rightEdge - width, width))
+        return self._windowCVs[key]
+
+    def _getJunction(self, k, pair, width, reach, factor):
+        """Returns the junction (see incremental.setJunction) that
+        windowBoundFinder sets between an operon ending with gene pair of
+        contig k and one starting with the next gene."""
+        key = (k, pair, width, reach, factor)
+        if key not in self._junctions:
+            genes, reads, statistics = self._contigs[k]
+            operon1 = Operon('')
+            operon1.add(genes[pair])
+            operon2 = Operon('')
+            operon2.add(genes[pair + 1])
+            windowBoundFinder(operon1, operon2, reads, width, reach, factor,
+                              self._getWindowCVs(k, pair, width))
+            self._junctions[key] = (operon1.getRightBound(),
+                                    operon1.getRightBoundPrecision(),
+                                    operon2.getLeftBound(),
+                                    operon2.getLeftBoundPrecision())
+        return self._junctions[key]
+
+    def getOperons(self, setting):
+        """Returns the OperonBank of a setting, with the probes of the
+        sample assigned to its operons."""
+        fold, dent, distance = [setting[name] for name in CALLING]
+        width, reach, factor = [setting[name] for name in BOUNDS]
+        operonBank = OperonBank()
+        for k in xrange(len(self._contigs)):
+            genes, reads, statistics = self._contigs[k]
+            if len(genes) == 0:
+                continue
+            breaks = judgePairs(statistics, fold, dent, distance)
+            contigBank = groupGenes(genes, breaks, reads, len(operonBank) + 1)
+            pairs = numpy.flatnonzero(breaks)
+            for j in xrange(len(contigBank) - 1):
+                setJunction(contigBank[j], contigBank[j + 1],
+                            self._getJunction(k, int(pairs[j]), width,
+                                              reach, factor))
+            for operon in contigBank:
+                operonBank.add(operon)
+        self._probeTable.assign(operonBank)
+        return operonBank
+
+    def evaluate(self, setting):
+        """Returns the OperonBank of a setting and a boolean array, True
+        for its processed operons. The operons, their probe statistics and
+        their window extremes are kept for the next setting with the same
+        operon calling thresholds."""
+        key = _operonSetKey(setting)
+        if key != self._operonKey:
+            operonBank = self.getOperons(setting)
+            self._operonSet = (operonBank, probeStatistics(operonBank), {})
+            self._operonKey = key
+        operonBank, statistics, extremes = self._operonSet
+        workWidth = setting['workWidth']
+        if workWidth not in extremes:
+            extremes[workWidth] = windowExtremes(statistics, workWidth)
+        maxs, mins = extremes[workWidth]
+        return operonBank, isProcessed(statistics, maxs, mins, workWidth,
+                                       setting['threshold'],
+                                       setting['minAverageRead'])
+
+    def summarize(self, strainName, grid):
+        """Returns the summary rows (see COLUMNS) of the settings of a
+        grid, compared with the default setting, in the order of grid.
+        The settings are evaluated grouped by operon set, those sharing
+        the operons of the default setting first, so that evaluate calls
+        the operons of each set once."""
+        defaultKey = _operonSetKey(DEFAULTS)
+        defaultBank, defaultProcessed = self.evaluate(DEFAULTS)
+        defaultBounds = _operonBounds(defaultBank)
+        defaultNames = set(_processedNames(defaultBank, defaultProcessed))
+        keys = [_operonSetKey(setting) for setting in grid]
+        rows = [None] * len(grid)
+        for i in sorted(xrange(len(grid)),
+                        key = lambda j: (keys[j] != defaultKey, keys[j])):
+            setting = grid[i]
+            operonBank, processed = self.evaluate(setting)
+            names = _processedNames(operonBank, processed)
+            changes = len([bounds for bounds in _operonBounds(operonBank)
+                           if bounds not in defaultBounds])
+            rows[i] = ([strainName] +
+                       [setting[name] for name in PARAMETERS] +
+                       [len(operonBank), changes, len(names),
+                        len(set(names) - defaultNames),
+                        len(defaultNames - set(names)), ';'.join(names)])
+        return rows
+
+
+def _operonSetKey(setting):
+    """Returns the thresholds of a setting that its operons depend on."""
+    return tuple(setting[name] for name in CALLING + BOUNDS)
+
+
+def _operonBounds(operonBank):
+    """Returns the set of (contig, left bound, right bound) of the operons
+    of a bank."""
+    return set((operon.getContig(), operon.getLeftBound(),
+                operon.getRightBound()) for operon in operonBank)
+
+
+def _processedNames(operonBank, processed):
+    """Returns the names ('firstGene-lastGene') of the processed operons of
+    a bank, in bank order."""
+    return [operonBank[j][0].getName() + '-' + operonBank[j][-1].getName()
+            for j in numpy.flatnonzero(processed)]
+
+
+def parameterSweep(strainNames, grid, bankFile = geneBankFile,
+                   fileName = summaryFile, probeHLFileName = None):
+    """Evaluates every setting of grid (see parameterGrid) on the named
+    samples, with the probe half-lives of probeHLFileName or, by default,
+    of each sample (see HLShiftFinder.probeHLFile), and writes the
+    summary table to fileName. The reads of the next sample are loaded in
+    a background thread while a sample is swept (see prefetch.py).
+    Returns the summary rows."""
+    annotation = GeneBank(bankFile)
+    contigs = [getContig(contig) for contig in annotation.getContigs()]
+    reach = max(setting['reach'] for setting in grid + [DEFAULTS])
+    rows = []
+    for strainName, readsList in prefetch(
+            lambda strainName: loadSampleReads(strainName, contigs),
+            strainNames):
+        with profiling.stage("parameterSweep", strainName):
+            probeTable = loadProbeTable(probeHLFileName or
+                                        probeHLFile(strainName))
+            sweep = SampleSweep(annotation.bind(readsList), readsList,
+                                probeTable, reach)
+            rows.extend(sweep.summarize(strainName, grid))
+        log.info("%s: %d settings evaluated.", strainName, len(grid))
+    fileName = writeTable(COLUMNS, zip(*rows) if rows else
+                          [[] for name in COLUMNS], fileName)
+    log.info("%s is generated.", fileName)
+    return rows
@@ -0,0 +1,264 @@
+"""
+File: pipeline.py
+
+Runs the five stages of the workflow (geneBankConstruct, operonBankConstruct,
+operonBankRefine, HLShiftFinder, RNaseYProcessedOperonFinder) in order, and
+skips the stages, and the samples of a per-sample stage, whose outputs are
+still valid.
+
+Every input of a stage (data files, the stage script and the modules it
+imports, whose constants are the parameters of the stage) is fingerprinted
+by its MD5 checksum; the modules are found by following the import
+statements of the script through the source directory (see sourceFiles).
+The environment variables that configure a stage (such as RNA_CONSENSUS)
+are recorded with them. The fingerprints of the inputs and outputs of every
+run are kept in pipelineCache.json in the working directory. A stage (or
+sample) is run again only if an input fingerprint has changed or an
+output is missing or has been modified. Outputs are fingerprinted too, so
+when a rerun stage writes the same contents as before, the stages after it
+are not rerun.
+
+Usage: python pipeline.py [stage ...]
+The named stages are rerun even if their outputs are valid.
+
+"""
+import os
+import sys
+import ast
+import json
+import logging
+import subprocess
+from coverage import fileChecksum, coverageFileName
+from parallel import SAMPLESVARIABLE
+from operonConsensus import CONSENSUSVARIABLE
+from contigs import CONTIGFILE, readsFiles
+from incremental import STATEEXT
+from export import configureLogging
+import profiling
+
+CACHEFILE = "pipelineCache.json"
+SAMPLES   = ["wt1", "wt2", "rny1", "rny2"]
+PROBEFILES = {"wt1":  "probehalfLifeWT.csv",
+              "wt2":  "probehalfLifeWT.csv",
+              "rny1": "probehalfLifeRNY.csv",
+              "rny2": "probehalfLifeRNY.csv"}
+
+SOURCEDIR = os.path.dirname(os.path.abspath(__file__))
+_sources  = {}
+log       = logging.getLogger("pipeline")
+
+
+def moduleImports(fileName):
+    """Returns the names of the modules imported anywhere in a source file,
+    including the imports inside functions."""
+    with open(fileName, 'r') as fileObj:
+        tree = ast.parse(fileObj.read(), fileName)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module != None:
+            names.add(node.module)
+    return names
+
+
+def sourceFiles(name):
+    """Returns the source files of SOURCEDIR that a module depends on: its
+    own file and those of the modules it imports, directly or through
+    other modules of SOURCEDIR, in name order."""
+    if name not in _sources:
+        files = set()
+        pending = [name]
+        while pending:
+            fileName = pending.pop() + ".py"
+            path = os.path.join(SOURCEDIR, fileName)
+            if fileName in files or not os.path.exists(path):
+                continue
+            files.add(fileName)
+            pending.extend(moduleImports(path))
+        _sources[name] = sorted(files)
+    return _sources[name]
+
+
+def readsInputs(sample):
+    """Returns the reads files of a sample on every contig: its coverage
+    CSV files and binary coverage files, whichever exist (loadReads may
+    read either), and the contig file."""
+    inputs = [CONTIGFILE]
+    for csvName in readsFiles(sample):
+        inputs += [csvName, coverageFileName(csvName)]
+    return inputs
+
+
+class Stage(object):
+    """One stage of the workflow: a script with its input and output files.
+    inputs and outputs are functions of a sample name; a stage that does
+    not run per sample is called with the sample ''."""
+
+    def __init__(self, name, inputs, outputs, samples = None, variables = ()):
+        """name: the name of the stage script, without '.py'.
+        samples: the samples the script processes one by one (selected
+                 with the RNA_SAMPLES environment variable), or None.
+        variables: the environment variables that configure the stage."""
+        self._name      = name
+        self._inputs    = inputs
+        self._outputs   = outputs
+        self._samples   = samples
+        self._variables = variables
+
+    def getName(self):
+        """Returns the name of the stage."""
+        return self._name
+
+    def getScript(self):
+        """Returns the path of the stage script."""
+        return os.path.join(SOURCEDIR, self._name + ".py")
+
+    def getSamples(self):
+        """Returns the samples of the stage, or [''] if it does not run
+        per sample."""
+        if self._samples == None:
+            return ['']
+        return self._samples
+
+    def getInputs(self, sample):
+        """Returns the data files read for a sample."""
+        return self._inputs(sample)
+
+    def getOutputs(self, sample):
+        """Returns the files written for a sample."""
+        return self._outputs(sample)
+
+    def getVariables(self):
+        """Returns the current values of the environment variables that
+        configure the stage."""
+        return dict(("$" + name, os.environ.get(name))
+                    for name in self._variables)
+
+    def getCode(self):
+        """Returns the source files of the stage: the script and the
+        modules it depends on (see sourceFiles)."""
+        return [os.path.join(SOURCEDIR, fileName)
+                for fileName in sourceFiles(self._name)]
+
+    def run(self, samples):
+        """Runs the stage script in the working directory for the given
+        samples. Raises RuntimeError if the script fails."""
+        env = dict(os.environ)
+        if self._samples != None:
+            env[SAMPLESVARIABLE] = ','.join(samples)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [SOURCEDIR] + filter(None, [env.get("PYTHONPATH")]))
+        if subprocess.call([sys.executable, self.getScript()], env = env):
+            raise RuntimeError, "Stage " + self._name + " failed."
+
+
+STAGES = [
+    Stage("geneBankConstruct",
+          lambda s: ["Spy49_allGenes.csv"],
+          lambda s: ["geneBank.npz"]),
+    Stage("operonBankConstruct",
+          lambda s: ["geneBank.npz"] + readsInputs(s),
+          lambda s: ["operonBank_" + s + ".npz", "operonBank_" + s + ".bed",
+                     "operonBank_" + s + STATEEXT],
+          SAMPLES),
+    Stage("operonBankRefine",
+          lambda s: ["geneBank.npz"] + readsInputs(s) +
+                    ["operonBank_" + t + ".npz" for t in SAMPLES],
+          lambda s: ["operonBankRD_" + s + ".npz", "operonBedRD_" + s + ".bed",
+                     "operonBankRD_" + s + STATEEXT],
+          SAMPLES, [CONSENSUSVARIABLE]),
+    Stage("HLShiftFinder",
+          lambda s: ["operonBankRD_" + s + ".npz", PROBEFILES[s]] +
+                    readsInputs(s),
+          lambda s: ["processedOperons_" + s + ".csv",
+                     "operonProbes_" + s + ".csv"],
+          SAMPLES),
+    Stage("RNaseYProcessedOperonFinder",
+          lambda s: ["operonBankRD_wt1.npz", "operonBankRD_rny1.npz",
+                     "processedOperons_wt1.csv", "processedOperons_rny1.csv"],
+          lambda s: ["rnyProcessedOperons.csv"])]
+
+
+class Pipeline(object):
+    """Runs stages in order against the fingerprints kept in a cache file."""
+
+    def __init__(self, stages = STAGES, cacheFile = CACHEFILE):
+        self._stages    = stages
+        self._cacheFile = cacheFile
+        self._files     = {}
+        self._runs      = {}
+        if os.path.exists(cacheFile):
+            with open(cacheFile, 'r') as fileObj:
+                cache = json.load(fileObj)
+            self._files = cache["files"]
+            self._runs  = cache["runs"]
+
+    def save(self):
+        """Writes the fingerprints to the cache file."""
+        with open(self._cacheFile, 'w') as fileObj:
+            json.dump({"files": self._files, "runs": self._runs}, fileObj,
+                      indent = 1, sort_keys = True)
+
+    def fingerprint(self, fileName):
+        """Returns the MD5 checksum of a file, or None if it does not exist.
+        A checksum is computed again only if the size or modification time
+        of the file has changed since it was last computed."""
+        if not os.path.exists(fileName):
+            return None
+        stat = os.stat(fileName)
+        known = self._files.get(fileName)
+        if known != None and known[0] == stat.st_size and \
+           known[1] == stat.st_mtime:
+            return known[2]
+        checksum = fileChecksum(fileName)
+        self._files[fileName] = [stat.st_size, stat.st_mtime, checksum]
+        return checksum
+
+    def _inputKey(self, stage, sample):
+        """Returns the fingerprints of the inputs of a stage for a sample."""
+        key = dict((fileName, self.fingerprint(fileName))
+                   for fileName in stage.getCode() + stage.getInputs(sample))
+        key.update(stage.getVariables())
+        return key
+
+    def _outputKey(self, stage, sample):
+        """Returns the fingerprints of the outputs of a stage for a sample."""
+        return dict((fileName, self.fingerprint(fileName))
+                    for fileName in stage.getOutputs(sample))
+
+    def isValid(self, stage, sample):
+        """Returns True if the outputs of a stage for a sample were written
+        from the current inputs and are unchanged since, False otherwise."""
+        run = self._runs.get(stage.getName() + ":" + sample)
+        if run == None or run["inputs"] != self._inputKey(stage, sample):
+            return False
+        outputs = self._outputKey(stage, sample)
+        return None not in outputs.values() and run["outputs"] == outputs
+
+    def run(self, force = ()):
+        """Runs the stages whose outputs are not valid, and those named in
+        force. Returns the list of (stage name, sample) pairs that ran."""
+        ran = []
+        for stage in self._stages:
+            samples = [sample for sample in stage.getSamples()
+                       if stage.getName() in force or
+                       not self.isValid(stage, sample)]
+            if samples == []:
+                log.info("%s is up to date.", stage.getName())
+                continue
+            log.info("Running %s %s", stage.getName(), ' '.join(samples))
+            with profiling.stage(stage.getName(), ','.join(samples)):
+                stage.run(samples)
+            for sample in samples:
+                self._runs[stage.getName() + ":" + sample] = {
+                    "inputs":  self._inputKey(stage, sample),
+                    "outputs": self._outputKey(stage, sample)}
+                ran.append((stage.getName(), sample))
+            self.save()
+        return ran
+
+
+if __name__ == "__main__":
+    configureLogging()
+    Pipeline().run(sys.argv[1:])
@@ -0,0 +1,135 @@
+"""
+File: prefetch.py
+
+Loads the inputs of the next samples in background threads while the
+current sample is processed.
+
+prefetch(function, items) yields (item, function(item)) in the order of
+items, having started function on the next items in threads of their
+own. At most RNA_PREFETCH items (default 1) are loaded ahead of the item
+being processed, which caps the memory they hold; RNA_PREFETCH=0 loads
+each item when it is needed, as before.
+
+The loaders below read coverage and bank files. loadSampleReads also
+builds the range-minimum index of each Coverage, which operon calling
+would otherwise build on first use, so the reads of a memory-mapped
+coverage file are paged in, and their index built, while the CPU works on
+the previous sample; a caller that does not query minimum reads loads the
+reads only. NumPy and file I/O release the GIL, so the threads overlap
+with the computation.
+
+Loaders run in other threads: they must not import modules (the import
+lock may be held by the main thread) and must not share state with the
+computation until they return.
+
+"""
+import os
+import sys
+import imp
+import threading
+import collections
+from coverage import loadReads, CoverageMatrix
+from contigs  import getContigs, SampleReads
+from operonBank import OperonBank
+
+PREFETCHVARIABLE = "RNA_PREFETCH"
+DEFAULTDEPTH     = 1
+
+
+def prefetchDepth(depth = None):
+    """Returns the number of items loaded ahead: depth if it is given,
+    otherwise the RNA_PREFETCH environment variable, otherwise 1."""
+    if depth == None:
+        depth = int(os.environ.get(PREFETCHVARIABLE, DEFAULTDEPTH))
+    return max(0, depth)
+
+
+class _Load(threading.Thread):
+    """Calls a loader on one item in a background thread."""
+
+    def __init__(self, function, item):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._function = function
+        self._item = item
+        self._result = None
+        self._error = None
+
+    def run(self):
+        try:
+            self._result = self._function(self._item)
+        except:
+            self._error = sys.exc_info()
+
+    def getItem(self):
+        """Returns the item being loaded."""
+        return self._item
+
+    def getResult(self):
+        """Waits for the load to end and returns its result. An exception
+        raised by the loader is raised again here."""
+        self.join()
+        if self._error != None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+
+def prefetch(function, items, depth = None):
+    """Yields (item, function(item)) for every item in order, loading up
+    to depth items (see prefetchDepth) ahead in background threads. The
+    loads run in this thread while a module import is in progress, since
+    a loader thread could wait on the import lock held by this thread."""
+    depth = prefetchDepth(depth)
+    if depth == 0 or imp.lock_held():
+        for item in items:
+            yield item, function(item)
+        return
+    pending = collections.deque()
+    for item in items:
+        load = _Load(function, item)
+        load.start()
+        pending.append(load)
+        if len(pending) > depth:
+            load = pending.popleft()
+            yield load.getItem(), load.getResult()
+    while pending:
+        load = pending.popleft()
+        yield load.getItem(), load.getResult()
+
+
+def loadIndexedReads(fileName, minIndex = True):
+    """Returns the Coverage of a reads file (see coverage.loadReads), with
+    its range-minimum index already built if minIndex is True."""
+    coverage = loadReads(fileName)
+    if minIndex:
+        coverage.buildMinIndex()
+    return coverage
+
+
+def loadSampleReads(sample, contigs = None, minIndex = True):
+    """Returns the SampleReads of a sample holding the indexed Coverage of
+    each of the given contigs (default: every registered contig). Unlike
+    the reads a SampleReads loads on demand, these are not kept by the
+    contig registry."""
+    if contigs == None:
+        contigs = getContigs()
+    return SampleReads(sample, dict(
+        (contig.getName(),
+         loadIndexedReads(contig.getReadsFile(sample), minIndex))
+        for contig in contigs))
+
+
+def loadMatrix(fileNames, depth = None):
+    """Returns the CoverageMatrix of several reads files, in the order of
+    fileNames. Up to depth files are read ahead of the one being added.
+    No index is built: the matrix scans the short junction windows it
+    queries directly."""
+    return CoverageMatrix([coverage for fileName, coverage in
+                           prefetch(loadReads, fileNames, depth)])
+
+
+def loadOperonBanks(fileNames, depth = None):
+    """Returns the OperonBanks of several bank files, in the order of
+    fileNames, reading up to depth files ahead."""
+    return [operonBank for fileName, operonBank in
+            prefetch(OperonBank, fileNames, depth)]
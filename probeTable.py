@@ -0,0 +1,155 @@
+"""
+File: probeTable.py
+
+Define a ProbeTable class that holds probe-level half-lives
+(probehalfLifeWT.csv, probehalfLifeRNY.csv) for fast assignment
+to operons and genes.
+
+Probes are kept per strand in arrays sorted by position, so the probes
+of any interval are found by binary search instead of a scan of the
+whole probe list. A probe file row may name the contig of the probe in a
+fourth column (see contigs.py); probes are then kept per contig and
+strand. Rows without it are on the default contig.
+
+"""
+import csv
+import threading
+import numpy
+import profiling
+from contigs import DEFAULTCONTIG
+
+_tables = {}
+_tablesLock = threading.Lock()
+
+
+def loadProbeTable(fileName):
+    """Returns the ProbeTable of a probe half-life file. Each file is
+    parsed once; later calls, from any thread, return the cached table."""
+    with _tablesLock:
+        if fileName not in _tables:
+            _tables[fileName] = ProbeTable(fileName)
+        return _tables[fileName]
+
+
+class ProbeTable(object):
+    """Holds (position, orientation, half-life) probe tuples by strand."""
+
+    def __init__(self, fileName = None, probeHalfLifeList = None,
+                 contigs = None):
+        """Constructs a ProbeTable from a probe half-life file, or from a
+        list of (position, orientation, half-life) tuples and, optionally,
+        a parallel list of their contig ids (both lists are copied). The
+        probes are grouped by contig and strand, in position order, with
+        one lexsort."""
+        self._fileName = fileName
+        if probeHalfLifeList == None:
+            probeHalfLifeList = []
+        probeHalfLifeList = list(probeHalfLifeList)
+        if contigs == None:
+            contigs = [DEFAULTCONTIG] * len(probeHalfLifeList)
+        contigs = list(contigs)
+        if fileName != None:
+            probeHLFile = open(fileName, 'rU')
+            for row in csv.reader(probeHLFile):
+                probeHalfLifeList.append((int(row[0]), row[1],
+                                          float(row[2])))
+                contigs.append(row[3] if len(row) > 3 else DEFAULTCONTIG)
+            probeHLFile.close()
+        self._probes = probeHalfLifeList
+        self._strands = {}
+        keyCodes = {}
+        keys = numpy.array([keyCodes.setdefault((contigs[i],
+                                                 probeHalfLifeList[i][1]),
+                                                len(keyCodes))
+                            for i in xrange(len(probeHalfLifeList))],
+                           dtype = int)
+        positions = numpy.array([probe[0] for probe in probeHalfLifeList],
+                                dtype = int)
+        order = numpy.lexsort((positions, keys))
+        groups = numpy.split(order,
+                             numpy.flatnonzero(numpy.diff(keys[order])) + 1)
+        for key, code in keyCodes.items():
+            self._strands[key] = (positions[groups[code]], groups[code])
+
+    def __len__(self):
+        """Returns the number of probes."""
+        return len(self._probes)
+
+    def getName(self):
+        """Returns the name of the probe half-life file."""
+        return self._fileName
+
+    def _probesAt(self, indexes):
+        """Returns the probes at the given list positions, in file order."""
+        return [self._probes[i] for i in sorted(indexes)]
+
+    def getProbes(self, start, end, orientation, inclusive = False,
+                  contig = DEFAULTCONTIG):
+        """Returns the probes on the given strand of a contig with start <=
+        position < end (or <= end if inclusive), in the order of the probe
+        file."""
+        if (contig, orientation) not in self._strands:
+            return []
+        positions, order = self._strands[(contig, orientation)]
+        side = 'right' if inclusive else 'left'
+        low  = numpy.searchsorted(positions, start, 'left')
+        high = numpy.searchsorted(positions, end, side)
+        if profiling.ENABLED:
+            profiling.count('probeLookups')
+        return self._probesAt(order[low:high])
+
+    def assign(self, bank):
+        """Attaches to every operon (or gene) of an OperonBank (or GeneBank)
+        the probes it would collect with setProbeHalfLife: positions within
+        [leftBound, rightBound] for an operon and [start, end) for a gene,
+        on its own strand and contig. Bounds of a strand are searched in one
+        batch."""
+        byStrand = {}
+        for item in bank:
+            byStrand.setdefault((item.getContig(), item.getOrientation()),
+                                []).append(item)
+        for key, strandItems in byStrand.items():
+            if key not in self._strands:
+                continue
+            positions, order = self._strands[key]
+            starts = []
+            ends = []
+            for item in strandItems:
+                if hasattr(item, 'getLeftBound'):
+                    starts.append(item.getLeftBound())
+                    ends.append(item.getRightBound() + 1)
+                else:
+                    starts.append(item.getStart())
+                    ends.append(item.getEnd())
+            lows  = numpy.searchsorted(positions, starts, 'left')
+            highs = numpy.searchsorted(positions, ends, 'left')
+            if profiling.ENABLED:
+                profiling.count('probeLookups', len(strandItems))
+            for k in xrange(len(strandItems)):
+                probes = self._probesAt(order[lows[k]:highs[k]])
+                strandItems[k].addProbeHalfLife(probes)
+
+
+def saveProbeAssignment(bank, fileName):
+    """Saves the probes attached to the operons of a bank as a CSV sidecar
+    file with rows: operon name, position, orientation, half-life."""
+    fileObj = open(fileName, 'w')
+    writer = csv.writer(fileObj)
+    for operon in bank:
+        for probe in operon.getProbeHalfLife():
+            writer.writerow([operon.getName(), probe[0], probe[1],
+                             repr(probe[2])])
+    fileObj.close()
+
+
+def loadProbeAssignment(bank, fileName):
+    """Attaches the probes of a sidecar file written by saveProbeAssignment
+    to the operons of a bank, matched by operon name."""
+    probes = {}
+    fileObj = open(fileName, 'rU')
+    for row in csv.reader(fileObj):
+        probes.setdefault(row[0], []).append((int(row[1]), row[2],
+                                              float(row[3])))
+    fileObj.close()
+    for operon in bank:
+        operon.addProbeHalfLife(probes.get(operon.getName(), []))
@@ -0,0 +1,143 @@
+"""
+File: profiling.py
+
+Opt-in instrumentation of the workflow scripts.
+
+Profiling is enabled by naming a report file in the RNA_PROFILE
+environment variable (e.g. RNA_PROFILE=profile.json). Each script then
+records its wall time and peak memory, the wall time and peak memory
+growth of each stage and sample it times, and counters of the hot paths:
+
+    sequences         Sequence objects created
+    logTransforms     reads log-transformed (per read, in Sequence and in
+                      coverage.logReads)
+    boundWindows      boundFinder windows evaluated
+    probeComparisons  probes compared in Sequence.setProbeHalfLife
+    probeLookups      binary-search probe lookups in a ProbeTable
+    bankBytesRead     bytes of bank files loaded (pickled or columnar)
+    bankBytesWritten  bytes of bank files saved
+
+At exit the record of the script is appended to the report file, so a
+whole run (see pipeline.py) accumulates one record per script. Workers of
+parallel.runSamples send their records back to the calling script.
+
+The peak resident memory of a process (ru_maxrss) only grows over its
+lifetime, so the peak at the end of a stage may have been reached by an
+earlier stage. A stage therefore records peakGrowthKB, how far it raised
+the peak above its value when the stage began; 0 means the stage stayed
+below the earlier peak, not that it used no memory. The peakKB of a
+script is the peak of the whole process.
+
+When profiling is disabled, the instrumented code only tests ENABLED.
+
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import threading
+
+PROFILEVARIABLE = "RNA_PROFILE"
+
+ENABLED = bool(os.environ.get(PROFILEVARIABLE))
+
+_counters = {}
+_stages   = []
+_started  = time.time()
+_lock     = threading.Lock()
+
+
+def count(name, n = 1):
+    """Adds n to a counter, from any thread. Callers test ENABLED first."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def peakMemory():
+    """Returns the peak resident memory (KB) of this process and of its
+    finished child processes, whichever is larger."""
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+class stage(object):
+    """Times a stage, or one sample of a stage, in a with statement:
+
+        with profiling.stage("operonBankConstruct", "wt1"):
+            ...
+
+    Records the wall time of the block and the growth of the peak memory
+    of the process during it (see peakGrowthKB above). Does nothing when
+    profiling is disabled."""
+
+    def __init__(self, name, sample = None):
+        self._name   = name
+        self._sample = sample
+        self._start  = None
+        self._peak   = None
+
+    def __enter__(self):
+        if ENABLED:
+            self._start = time.time()
+            self._peak  = peakMemory()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if ENABLED and self._start != None:
+            _stages.append({'stage':        self._name,
+                            'sample':       self._sample,
+                            'seconds':      round(time.time() - self._start,
+                                                  6),
+                            'peakGrowthKB': peakMemory() - self._peak})
+        return False
+
+
+def snapshot():
+    """Returns the counters and stage records collected so far."""
+    return {'counters': dict(_counters), 'stages': list(_stages)}
+
+
+def reset():
+    """Clears the counters and stage records."""
+    _counters.clear()
+    del _stages[:]
+
+
+def merge(record):
+    """Adds the counters and stage records of a snapshot (e.g. one sent
+    back by a worker process) to those of this process."""
+    for name, n in record['counters'].items():
+        count(name, n)
+    _stages.extend(record['stages'])
+
+
+def report(fileName = None):
+    """Appends the record of this script to the report file (default: the
+    RNA_PROFILE environment variable). Returns the record."""
+    if fileName == None:
+        fileName = os.environ.get(PROFILEVARIABLE)
+    record = snapshot()
+    record.update({'script':  os.path.basename(sys.argv[0]) or None,
+                   'started': time.strftime("%Y-%m-%dT%H:%M:%S",
+                                            time.localtime(_started)),
+                   'seconds': round(time.time() - _started, 6),
+                   'peakKB':  peakMemory()})
+    runs = []
+    if os.path.exists(fileName):
+        with open(fileName, 'r') as fileObj:
+            runs = json.load(fileObj)['runs']
+    runs.append(record)
+    with open(fileName, 'w') as fileObj:
+        json.dump({'runs': runs}, fileObj, indent = 1, sort_keys = True)
+    return record
+
+
+def _reportAtExit():
+    """Writes the report of this script if profiling is enabled."""
+    if ENABLED:
+        report()
+
+
+atexit.register(_reportAtExit)
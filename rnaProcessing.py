@@ -0,0 +1,296 @@
+"""
+File: rnaProcessing.py
+
+Command-line entry point of the workflow, with one subcommand per stage:
+
+    python rnaProcessing.py geneBankConstruct [--genes FILE] [--bank FILE]
+    python rnaProcessing.py coverageConstruct [--samples S,...]
+                                [--dtype DTYPE] [--encoding ENCODING]
+    python rnaProcessing.py genomeConstruct
+    python rnaProcessing.py bankConvert [FILE ...]
+    python rnaProcessing.py operonBankConstruct [--samples S,...]
+                                [--workers N] [--incremental]
+    python rnaProcessing.py operonBankRefine [--samples S,...]
+                                [--consensus-samples S,...]
+                                [--consensus RULE] [--incremental]
+    python rnaProcessing.py HLShiftFinder [--samples S,...] [--probes FILE]
+                                [--work-width N] [--threshold X]
+                                [--min-average-read X]
+    python rnaProcessing.py RNaseYProcessedOperonFinder [--wt S] [--rny S]
+                                [--output FILE]
+    python rnaProcessing.py all [--samples S,...] [--workers N]
+    python rnaProcessing.py sweep [--samples S,...] [--fold X,...]
+                                [--dent X,...] [--distance N,...]
+                                [--width N,...] [--reach N,...]
+                                [--factor X,...] [--work-width N,...]
+                                [--threshold X,...]
+                                [--min-average-read X,...]
+                                [--probes FILE] [--output FILE]
+    python rnaProcessing.py pipeline [STAGE ...]
+    python rnaProcessing.py benchmark [benchmark options]
+
+Each stage is also a function of its module (e.g.
+operonBankConstruct.constructBanks or HLShiftFinder.HLShiftFinders), and
+importing a stage module does no work, so the stages can be composed in
+one process: 'all' runs the five stages of the workflow one after the
+other in this process, whereas 'pipeline' runs each stage script in its
+own process and skips the stages whose outputs are up to date (see
+pipeline.py). 'sweep' evaluates every combination of the given threshold
+values (see parameterSweep.py).
+
+Without --samples a stage processes all four samples, or the samples
+named in the RNA_SAMPLES environment variable. --log sets the level of
+the log messages (see export.py).
+
+"""
+import os
+import sys
+import argparse
+from incremental import INCREMENTALVARIABLE
+from export import configureLogging
+
+SAMPLES = ["wt1", "wt2", "rny1", "rny2"]
+
+
+def sampleList(text):
+    """Returns the sample names of a comma-separated list, or the samples
+    selected by the RNA_SAMPLES environment variable if text is None."""
+    from parallel import selectedSamples
+    if text != None:
+        return text.split(',')
+    return [SAMPLES[i] for i in selectedSamples(SAMPLES)]
+
+
+def runGeneBank(args):
+    from geneBankConstruct import geneBankConstruct
+    geneBankConstruct(args.genes, args.bank)
+
+
+def runCoverage(args):
+    from coverageConstruct import coverageConstruct
+    coverageConstruct(sampleList(args.samples), args.dtype, args.encoding)
+
+
+def runGenome(args):
+    from genomeConstruct import genomeConstruct
+    genomeConstruct()
+
+
+def runBankConvert(args):
+    from bankConvert import bankConvert
+    bankConvert(args.files or None)
+
+
+def runConstruct(args):
+    from operonBankConstruct import constructBanks
+    constructBanks(sampleList(args.samples), args.bank, args.workers)
+
+
+def runRefine(args):
+    from operonBankRefine import operonBankRefine
+    consensusNames = None
+    if args.consensus_samples != None:
+        consensusNames = args.consensus_samples.split(',')
+    operonBankRefine(sampleList(args.samples), consensusNames, args.bank,
+                     args.consensus)
+
+
+def runHLShift(args):
+    from HLShiftFinder import HLShiftFinders
+    HLShiftFinders(sampleList(args.samples), args.work_width, args.threshold,
+                   args.min_average_read, args.probes)
+
+
+def runRNaseY(args):
+    from RNaseYProcessedOperonFinder import RNaseYProcessedOperonFinder
+    RNaseYProcessedOperonFinder(args.wt, args.rny, args.output)
+
+
+def runAll(args):
+    """Runs the five stages of the workflow in this process."""
+    from geneBankConstruct import geneBankConstruct
+    from operonBankConstruct import constructBanks
+    from operonBankRefine import operonBankRefine
+    from HLShiftFinder import HLShiftFinders
+    from RNaseYProcessedOperonFinder import RNaseYProcessedOperonFinder
+    strainNames = sampleList(args.samples)
+    geneBankConstruct()
+    constructBanks(strainNames, workers = args.workers)
+    operonBankRefine(strainNames, strainNames)
+    HLShiftFinders(strainNames)
+    if "wt1" in strainNames and "rny1" in strainNames:
+        RNaseYProcessedOperonFinder()
+
+
+def runSweep(args):
+    from parameterSweep import parameterSweep, parameterGrid, PARAMETERS
+    grid = parameterGrid(dict((name, getattr(args, name))
+                              for name in PARAMETERS
+                              if getattr(args, name) != None))
+    parameterSweep(sampleList(args.samples), grid, args.bank, args.output,
+                   args.probes)
+
+
+def valueList(cast):
+    """Returns a function that parses a comma-separated list of values
+    with cast, for argparse."""
+    return lambda text: [cast(value) for value in text.split(',')]
+
+
+def runPipeline(args):
+    from pipeline import Pipeline
+    Pipeline().run(args.stages)
+
+
+def runBenchmark(args):
+    import benchmark
+    benchmark.main(args.options)
+
+
+def parser():
+    """Returns the argument parser of the command line."""
+    from geneBankConstruct import geneFileName, geneBankFile
+    from halfLifeShift import WORKWIDTH, THRESHOLD, MINAVERAGEREAD
+    main = argparse.ArgumentParser(
+        description = "Identifies operons and RNase Y processed operons "
+                      "from RNA-seq coverage and probe half-lives.")
+    main.add_argument("--log", help = "log level (e.g. info or debug)")
+    commands = main.add_subparsers(dest = "command")
+
+    command = commands.add_parser("geneBankConstruct",
+                                  help = "build geneBank.npz")
+    command.add_argument("--genes", default = geneFileName,
+                         help = "annotation CSV file")
+    command.add_argument("--bank", default = geneBankFile,
+                         help = "GeneBank file written")
+    command.set_defaults(function = runGeneBank)
+
+    command = commands.add_parser("coverageConstruct",
+                                  help = "convert coverage CSV files")
+    command.add_argument("--samples", help = "comma-separated samples")
+    command.add_argument("--dtype", default = "float64",
+                         choices = ["float64", "float32", "uint32",
+                                    "compact"],
+                         help = "dtype of the stored reads")
+    command.add_argument("--encoding", default = "dense",
+                         choices = ["dense", "rle"],
+                         help = "store every read or runs of equal reads")
+    command.set_defaults(function = runCoverage)
+
+    command = commands.add_parser("genomeConstruct",
+                                  help = "pack the genome files")
+    command.set_defaults(function = runGenome)
+
+    command = commands.add_parser("bankConvert",
+                                  help = "convert pickled bank files")
+    command.add_argument("files", nargs = "*", help = "pickled bank files")
+    command.set_defaults(function = runBankConvert)
+
+    command = commands.add_parser("operonBankConstruct",
+                                  help = "find the operons of each sample")
+    command.add_argument("--samples", help = "comma-separated samples")
+    command.add_argument("--workers", type = int,
+                         help = "worker processes (default RNA_WORKERS)")
+    command.add_argument("--bank", default = geneBankFile,
+                         help = "GeneBank file")
+    command.add_argument("--incremental", action = "store_true",
+                         help = "recompute only what changed")
+    command.set_defaults(function = runConstruct)
+
+    command = commands.add_parser("operonBankRefine",
+                                  help = "unify the operons of the samples")
+    command.add_argument("--samples", help = "comma-separated samples")
+    command.add_argument("--consensus-samples",
+                         help = "samples of the consensus (default all)")
+    command.add_argument("--consensus",
+                         help = "union, intersection or a number k "
+                                "(default RNA_CONSENSUS, else union)")
+    command.add_argument("--bank", default = geneBankFile,
+                         help = "GeneBank file")
+    command.add_argument("--incremental", action = "store_true",
+                         help = "recompute only what changed")
+    command.set_defaults(function = runRefine)
+
+    command = commands.add_parser("HLShiftFinder",
+                                  help = "find the processed operons")
+    command.add_argument("--samples", help = "comma-separated samples")
+    command.add_argument("--probes", help = "probe half-life file "
+                                            "(default by sample)")
+    command.add_argument("--work-width", type = int, default = WORKWIDTH,
+                         help = "probes per window")
+    command.add_argument("--threshold", type = float, default = THRESHOLD,
+                         help = "log2 half-life shift")
+    command.add_argument("--min-average-read", type = float,
+                         default = MINAVERAGEREAD,
+                         help = "minimum average read of an operon")
+    command.set_defaults(function = runHLShift)
+
+    command = commands.add_parser("RNaseYProcessedOperonFinder",
+                                  help = "compare WT with the mutant")
+    command.add_argument("--wt", default = "wt1", help = "WT sample")
+    command.add_argument("--rny", default = "rny1", help = "mutant sample")
+    command.add_argument("--output", default = "rnyProcessedOperons.csv",
+                         help = "UTR table written")
+    command.set_defaults(function = runRNaseY)
+
+    command = commands.add_parser("all", help = "run every stage in this "
+                                                "process")
+    command.add_argument("--samples", help = "comma-separated samples")
+    command.add_argument("--workers", type = int,
+                         help = "worker processes (default RNA_WORKERS)")
+    command.set_defaults(function = runAll)
+
+    command = commands.add_parser("sweep", help = "evaluate a grid of "
+                                                  "thresholds")
+    command.add_argument("--samples", help = "comma-separated samples")
+    for option, name, cast, text in [
+            ("--fold", "fold", float, "expression fold change"),
+            ("--dent", "dent", float, "dent ratio"),
+            ("--distance", "distance", int, "gene distance (bp)"),
+            ("--width", "width", int, "boundary window width"),
+            ("--reach", "reach", int, "boundary search reach (bp)"),
+            ("--factor", "factor", float, "window log-CV factor"),
+            ("--work-width", "workWidth", int, "probes per window"),
+            ("--threshold", "threshold", float, "log2 half-life shift"),
+            ("--min-average-read", "minAverageRead", float,
+             "minimum average read of an operon")]:
+        command.add_argument(option, dest = name, type = valueList(cast),
+                             help = "comma-separated values of the " + text)
+    command.add_argument("--probes", help = "probe half-life file "
+                                            "(default by sample)")
+    command.add_argument("--bank", default = geneBankFile,
+                         help = "GeneBank file")
+    command.add_argument("--output", default = "sweepSummary.csv",
+                         help = "summary table written")
+    command.set_defaults(function = runSweep)
+
+    command = commands.add_parser("pipeline", help = "run the stages whose "
+                                                     "outputs are outdated")
+    command.add_argument("stages", nargs = "*", help = "stages to rerun")
+    command.set_defaults(function = runPipeline)
+
+    command = commands.add_parser("benchmark",
+                                  help = "time the stages on synthetic data")
+    command.set_defaults(function = runBenchmark)
+    return main
+
+
+def main(argv = None):
+    """Runs the subcommand of argv (default: the command line). The
+    arguments after 'benchmark' are passed on to benchmark.py."""
+    if argv == None:
+        argv = sys.argv[1:]
+    options = []
+    if "benchmark" in argv:
+        options = argv[argv.index("benchmark") + 1:]
+        argv = argv[:argv.index("benchmark") + 1]
+    args = parser().parse_args(argv)
+    args.options = options
+    configureLogging(args.log)
+    if getattr(args, "incremental", False):
+        os.environ[INCREMENTALVARIABLE] = "1"
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,42 +2,141 @@
 File: sequence.py
 
 Define a Sequence class to describe a DNA sequence.
-This time the readsList is a must.
-The sequence name is optional.
+A Sequence is a view: it keeps its coordinates and a reference to the
+shared readsList, and takes its reads and bases from them on demand.
+The sequence name is optional. Sequences are slotted (no per-object
+__dict__), since a bank holds thousands of them per sample.
+Each sequence carries the id of its contig (see contigs.py); its bases
+come from the genome of that contig.
 
 """
 
 ##SpyGenome = 'ATGCCTGAAAGTCTAGCCTTAAG'
 
+import gc
 import math
+import copy
 import numpy
+import profiling
+from coverage import Coverage
+from probeTable import ProbeTable
+from genome import getGenome
+from contigs import DEFAULTCONTIG, getContig
+
+SpyGenome = getGenome("SpyGenome.txt")
+
+def makeSequences(names, starts, ends, orientations, halfLives = None,
+                  probeLists = None, contigs = None):
+    """Returns unbound sequences built from parallel lists of names,
+    coordinates, orientations and, optionally, half-lives, probe
+    half-life lists and contig ids, e.g. the columns of a bank file (see
+    bankFormat.py).
+    The cyclic garbage collector is paused meanwhile: the new objects
+    cannot form garbage, but would trigger a collection every few hundred
+    allocations."""
+    if halfLives == None:
+        halfLives = [0] * len(names)
+    if probeLists == None:
+        probeLists = [[] for i in xrange(len(names))]
+    if contigs == None:
+        contigs = [DEFAULTCONTIG] * len(names)
+    if profiling.ENABLED:
+        profiling.count('sequences', len(names))
+    new = Sequence.__new__
+    sequences = []
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for i in xrange(len(names)):
+            seq = new(Sequence)
+            seq._name          = names[i]
+            seq._start         = starts[i]
+            seq._end           = ends[i]
+            seq._orientation   = orientations[i]
+            seq._readsList     = None
+            seq._halfLife      = halfLives[i]
+            seq._probeHalfLife = probeLists[i]
+            seq._contig        = contigs[i]
+            sequences.append(seq)
+    finally:
+        if collecting:
+            gc.enable()
+    return sequences
 
-with open("SpyGenome.txt", 'r') as myfile:
-    SpyGenome = myfile.read().replace('\n', '')
 
 class Sequence(object):
     """ Defines a sequence class representing a string of bases"""
 
     SEQUENCESTR = SpyGenome
 
-    def __init__(self, readsList, (start, end), name = '', orientation = '+'):
+    __slots__ = ('_name', '_start', '_end', '_orientation', '_readsList',
+                 '_halfLife', '_probeHalfLife', '_contig')
+
+    def __init__(self, readsList, (start, end), name = '', orientation = '+',
+                 contig = DEFAULTCONTIG):
         """Constructor of a sequence object.
-        readsList: a list containing RNA-seq reads in order.
+        readsList: a list (or a NumPy array, see coverage.py) containing
+                RNA-seq reads in order. It is shared, not copied. None
+                creates an annotation-only sequence (see bind).
         (start, end): a tuple containing two integers that indicate the
                 start and end site of a sequence
         name: Optional, a string representing the name of the sequence
         orientation: Optional, a string ('+' or '-') representing the sequence
-                orientation on the chromosome. The default is '+'. """
+                orientation on the chromosome. The default is '+'.
+        contig: Optional, the id of the contig of the sequence (see
+                contigs.py). The default is the single contig Spy. """
 
         self._name         = name
         self._start        = start
         self._end          = end
-        self._position     = (start, end)
         self._orientation  = orientation
-        self._reads        = readsList[start:end]
-        self._baseSequence = Sequence.SEQUENCESTR[start:end]
+        self._readsList    = readsList
         self._halfLife     = 0
         self._probeHalfLife = []
+        self._contig       = contig
+        if profiling.ENABLED:
+            profiling.count('sequences')
+
+    def __getstate__(self):
+        """Pickles the coordinates only. The shared readsList is left out
+        and must be re-attached with bind after loading."""
+        state = dict((slot, getattr(self, slot))
+                     for slot in Sequence.__slots__)
+        state['_readsList'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled sequence. Reads, bases and other attributes
+        kept by banks written before sequences became slotted views are
+        discarded."""
+        self._readsList = None
+        self._halfLife = 0
+        self._probeHalfLife = []
+        self._contig = DEFAULTCONTIG
+        for slot in Sequence.__slots__:
+            if slot in state:
+                setattr(self, slot, state[slot])
+
+    def __copy__(self):
+        """Returns a shallow copy of the sequence."""
+        seq = Sequence.__new__(Sequence)
+        for slot in Sequence.__slots__:
+            setattr(seq, slot, getattr(self, slot))
+        if profiling.ENABLED:
+            profiling.count('sequences')
+        return seq
+
+    def bind(self, readsList):
+        """Returns a copy of the sequence that takes its reads from
+        readsList. The sequence itself is unchanged."""
+        seq = copy.copy(self)
+        seq._readsList = readsList
+        seq._probeHalfLife = list(self._probeHalfLife)
+        return seq
+
+    def isBound(self):
+        """Returns True if the sequence is attached to a readsList."""
+        return self._readsList is not None
 
     def __str__(self):
         """Returns a string representation of the sequence."""
@@ -46,7 +145,7 @@ class Sequence(object):
         seqStr += "Position:      " + str(self._start)  + ", " \
                   + str(self._end)  + '\n'        
         seqStr += "Orientation:   " + self._orientation + '\n'       
-        seqStr += "Base sequence: " + self._baseSequence        
+        seqStr += "Base sequence: " + self.getBaseSequence()
         return seqStr
 
     def getName(self):
@@ -56,7 +155,7 @@ class Sequence(object):
     def getPosition(self):
         """Returns a tuple showing the start and end sites of the sequence
         on the chromosome, regardless of sequence orientation."""
-        return self._position
+        return (self._start, self._end)
     
     def getStart(self):
         """Returns the start site of the sequence on the chromosome,
@@ -73,53 +172,83 @@ class Sequence(object):
         or negative on the chromosome."""
         return self._orientation
 
+    def getContig(self):
+        """Returns the id of the contig of the sequence."""
+        return self._contig
+
     def __len__(self):
-        """Returns the number of bases in the sequence"""        
-        return len(self._reads)
+        """Returns the number of bases in the sequence"""
+        if self._readsList is None:
+            return max(0, self._end - self._start)
+        start, end, step = slice(self._start, self._end).indices(
+            len(self._readsList))
+        return max(0, end - start)
 
     def getBaseSequence(self):
-        """Returns the base sequences of the sequence."""        
-        return self._baseSequence
+        """Returns the base sequences of the sequence. The bases are
+        decoded from the shared genome of its contig (see genome.py) on
+        each call."""
+        return self._getGenome()[self._start:self._end]
+
+    def getReverseComplement(self):
+        """Returns the reverse complement of the base sequence."""
+        return self._getGenome().getReverseComplement(self._start, self._end)
+
+    def _getGenome(self):
+        """Returns the genome of the contig of the sequence."""
+        return getContig(self._contig).getGenome()
     
     def isEmpty(self):
         """Returns True if the sequence is empty, False otherwise."""
-        return self._reads == ()
+        return len(self) == 0
 
     def getReads(self):
-        """Returns a tuple of all base reads in a sequence """
-        return self._reads
+        """Returns all base reads in a sequence, sliced from the shared
+        readsList (a view when the readsList is a NumPy array)."""
+        if self._readsList is None:
+            raise ValueError, "The sequence is not bound to a readsList."
+        return self._readsList[self._start:self._end]
 
     def getReadIndex(self, read):
         """Returns the location index of a read. """
-        if read in self._reads:
-            return self._reads.index(read)
+        reads = self.getReads()
+        if read in reads:
+            return list(reads).index(read)
         else:
             return -1
 
     def _logTransform(self):
         """Transform reads to log-reads"""
         logReadsList = []
-        for read in self._reads:
+        for read in self.getReads():
             if read == 0:
                 read = 1
             logRead = math.log(read, 2)
             logReadsList.append(logRead)
+        if profiling.ENABLED:
+            profiling.count('logTransforms', len(logReadsList))
         return logReadsList          
    
     def getAverageRead(self):
         """Returns the averaged base reads in the sequence. The reads are initially
-        log-transformed, averaged, and then reverse-log-transformed."""
-        if self._reads == ():
+        log-transformed, averaged, and then reverse-log-transformed.
+        Computed by the readsList if it is a Coverage."""
+        if self.isEmpty():
             return 0
+        elif isinstance(self._readsList, Coverage):
+            return self._readsList.getAverageRead(self._start, self._end)
         else:
             averageLogRead = numpy.average(self._logTransform())
             averageRead = 2 ** averageLogRead
             return averageRead
 
     def getLogCV(self):
-        """Returns the coefficient variation of a sequence reads"""
-        if self._reads == ():
+        """Returns the coefficient variation of a sequence reads.
+        Computed by the readsList if it is a Coverage."""
+        if self.isEmpty():
             return 0
+        elif isinstance(self._readsList, Coverage):
+            return self._readsList.getLogCV(self._start, self._end)
         else:
             average = numpy.average(self._logTransform())
             std     = numpy.std(self._logTransform())
@@ -131,31 +260,44 @@ class Sequence(object):
         
 
     def getMinRead(self):
-        """Returns the minimum read of the sequence."""
-        if self._reads == () :
+        """Returns the minimum read of the sequence.
+        Uses the range-minimum index of the readsList if it is a Coverage."""
+        if self.isEmpty():
             raise IndexError, "The read list is empty."
-        minRead = self._reads[0]
-        for read in self._reads:
+        if isinstance(self._readsList, Coverage):
+            return self._readsList.getMinRead(self._start, self._end)
+        reads = self.getReads()
+        minRead = reads[0]
+        for read in reads:
             if minRead > read:
                 minRead = read
         return minRead
 
     def getMinReadLocation(self):
-        """Returns the location of the minimum read on the chromosome. """
+        """Returns the location of the minimum read on the chromosome.
+        Uses the range-minimum index of the readsList if it is a Coverage."""
+        if isinstance(self._readsList, Coverage):
+            return self._readsList.getMinReadLocation(self._start, self._end)
+        reads = self.getReads()
         i = 0
         j = 0
-        while i < len(self):
-            if self._reads[j] > self._reads[i]:
+        while i < len(reads):
+            if reads[j] > reads[i]:
                 j = i
             i += 1
         return self._start + j
 
     def getRightMinReadLocation(self):
-        """Returns the right most location of the minimum read on the chromosome. """
+        """Returns the right most location of the minimum read on the chromosome.
+        Uses the range-minimum index of the readsList if it is a Coverage."""
+        if isinstance(self._readsList, Coverage):
+            return self._readsList.getRightMinReadLocation(self._start,
+                                                           self._end)
+        reads = self.getReads()
         i = 0
         j = 0
-        while i < len(self):
-            if self._reads[j] >= self._reads[i]:
+        while i < len(reads):
+            if reads[j] >= reads[i]:
                 j = i
             i += 1
         return self._start + j 
@@ -163,10 +305,11 @@ class Sequence(object):
 
     def getMaxRead(self):
         """Returns the maximum read of the sequence."""
-        if self._reads == ():
+        if self.isEmpty():
             raise IndexError, "The read list is empty."
-        maxRead = self._reads[0]
-        for read in self._reads:
+        reads = self.getReads()
+        maxRead = reads[0]
+        for read in reads:
             if maxRead < read:
                 maxRead = read
         return maxRead
@@ -179,7 +322,15 @@ class Sequence(object):
         
 
     def setProbeHalfLife(self, probeHalfLifeList):
-        """Set probe half-lives to the sequence """
+        """Set probe half-lives to the sequence. probeHalfLifeList is a list
+        of (position, orientation, half-life) tuples or a ProbeTable."""
+        if isinstance(probeHalfLifeList, ProbeTable):
+            self.addProbeHalfLife(probeHalfLifeList.getProbes(
+                self._start, self._end, self._orientation,
+                contig = self._contig))
+            return
+        if profiling.ENABLED:
+            profiling.count('probeComparisons', len(probeHalfLifeList))
         for i in xrange(len(probeHalfLifeList)):
             position = probeHalfLifeList[i][0]
             orientation = probeHalfLifeList[i][1]
@@ -188,6 +339,10 @@ class Sequence(object):
                orientation == self._orientation:
                 self._probeHalfLife.append(probeHalfLifeList[i])
                 
+    def addProbeHalfLife(self, probes):
+        """Appends already selected probe half-lives to the sequence."""
+        self._probeHalfLife.extend(probes)
+
     def getProbeHalfLife(self):
         return self._probeHalfLife
 